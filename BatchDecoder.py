@@ -0,0 +1,423 @@
+"""
+Decoding CAN Logger 2 files and captures without the GUI.
+
+The messages of each file go through the same decoding as the J1939 and
+J1587 tabs: decode plans for the J1939 SPNs, the DM01, DM02 and DM04
+diagnostic messages, the ISO 15765 transport for UDS and the J1587 parameter
+and diagnostic decoding. Nothing here imports PyQt5, so it runs on a server.
+
+The files are read a block at a time and the decoded values are written out
+as they come, so memory stays bounded however many months of logs there are.
+Only the last value of each PGN, SPN and PID is kept. The outputs are:
+
+    pgn_summary.csv        a row for each PGN and source address
+    j1587_summary.csv      a row for each J1587 MID and PID
+    spn_timeseries         the SPN values each time they change
+    pid_timeseries         the J1587 PID values each time they change
+    dtcs.csv               the DTCs each time a diagnostic message changes
+    uds_messages.csv       the UDS messages
+
+The time series are CSV files, or with --format npz columnar NumPy files of
+up to COLUMN_BLOCK_ROWS rows each where the values are float64 and NaN when
+they are not numbers.
+
+Usage:
+    python BatchDecoder.py -o output_directory file_or_directory ...
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from RP1210Functions import *
+from RP1210Capture import CAPTURE_MAGIC, read_capture_header
+from CaptureReader import CaptureReader
+from CANLogger2 import *
+from J1939Database import load_j1939db, empty_j1939db
+from J1939DecodePlan import *
+from J1939Diagnostics import *
+from J1587Decode import *
+from ISO15765 import ISO15765Driver, ISO_PGN
+from RingBuffer import FrameRingBuffer
+
+import logging
+logger = logging.getLogger(__name__)
+
+module_directory = os.path.dirname(os.path.abspath(__file__))
+
+# The SPNs of the Time/Date PGN are shown as integers, like the J1939 tab.
+TIME_SPNS = [959, 960, 961, 963, 962, 964]
+# Rows of a columnar time series file
+COLUMN_BLOCK_ROWS = 1 << 16
+
+DTC_COLUMNS = ["Time", "Protocol", "Message", "SA", "Source", "SPN", "FMI", "Count", "CM",
+               "Suspect Parameter Number Label", "FMI Meaning", "FMI Severity",
+               "Raw Hexadecimal", "Freeze Frame Data"]
+UDS_COLUMNS = ["Time", "Line", "SA", "Source", "DA", "SID", "Service Name",
+               "Meaning", "Value", "Units", "Raw Hexadecimal"]
+
+
+def empty_j1587db():
+    """
+    Return a J1587 database without definitions, for when J1587db.json is
+    missing.
+    """
+    return {"FMI": {}, "MID": {}, "MIDAlias": {}, "PID": {}, "PIDNames": {}, "SID": {}}
+
+def iter_file_messages(filename, bad_blocks):
+    """
+    Return the protocol of a file and an iterator of its messages as
+    (current_time, vda_time, data). The blocks of a CAN Logger 2 file that
+    fail their CRC check are skipped and counted in bad_blocks[filename].
+    """
+    with open(filename, 'rb') as data_file:
+        magic = data_file.read(len(CAPTURE_MAGIC))
+        if magic == CAPTURE_MAGIC:
+            data_file.seek(0)
+            protocol = read_capture_header(data_file)[0]
+            return protocol, iter_capture_messages(filename, bad_blocks)
+    if os.path.getsize(filename) % LOGGER2_BLOCK_SIZE == 0:
+        return "J1939", iter_logger2_messages(filename, bad_blocks)
+    raise ValueError("{} is not a capture or a CAN Logger 2 file.".format(filename))
+
+def iter_capture_messages(filename, bad_blocks):
+    with CaptureReader(filename) as reader:
+        for current_time, vda_time, data in reader.read():
+            yield current_time, vda_time, bytes(data)
+        bad_blocks[filename] = reader.bad_blocks
+
+def iter_logger2_messages(filename, bad_blocks):
+    block_count = os.path.getsize(filename) // LOGGER2_BLOCK_SIZE
+    bad_blocks[filename] = 0
+    for start_block in range(0, block_count, LOGGER2_BATCH_BLOCKS):
+        records, bad = decode_logger2_file_chunk(filename, start_block, LOGGER2_BATCH_BLOCKS)
+        bad_blocks[filename] += bad
+        yield from zip(records.timestamps.tolist(), records.system_micros.tolist(),
+                       (message.tobytes() for message in records.messages))
+
+
+class TimeSeriesWriter():
+    """
+    Writes the rows of a time series as they come, to a CSV file or to
+    columnar .npz files. columns is a list of (name, dtype) and the last
+    column holds the values.
+    """
+    def __init__(self, base_filename, columns, output_format="csv"):
+        self.base_filename = base_filename
+        self.columns = columns
+        self.output_format = output_format
+        self.row_count = 0
+        self.file_count = 0
+        self.rows = []
+        if output_format == "csv":
+            self.csv_file = open(base_filename + ".csv", 'w', newline='')
+            self.writer = csv.writer(self.csv_file)
+            self.writer.writerow([name for name, dtype in columns])
+
+    def write(self, row):
+        self.row_count += 1
+        if self.output_format == "csv":
+            self.writer.writerow(row)
+            return
+        self.rows.append(row)
+        if len(self.rows) >= COLUMN_BLOCK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.output_format == "csv" or not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        arrays = {}
+        for (name, dtype), column in zip(self.columns[:-1], columns[:-1]):
+            arrays[name] = np.array(column, dtype=dtype)
+        name, dtype = self.columns[-1]
+        arrays[name] = np.array([to_float(value) for value in columns[-1]], dtype=dtype)
+        np.savez("{}_{:05d}.npz".format(self.base_filename, self.file_count), **arrays)
+        self.file_count += 1
+        self.rows = []
+
+    def close(self):
+        if self.output_format == "csv":
+            self.csv_file.close()
+        else:
+            self.flush()
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class BatchDecoder():
+    """
+    Decodes the messages of logger and capture files and streams the results
+    to output_directory.
+    """
+    def __init__(self, j1939db, j1587db, output_directory, output_format="csv"):
+        self.j1939db = j1939db
+        self.j1587db = j1587db
+        self.output_directory = output_directory
+        self.output_format = output_format
+        os.makedirs(output_directory, exist_ok=True)
+        self.decode_plans = J1939DecodePlans(j1939db, TIME_SPNS)
+        self.pgns = {} # Keyed by (pgn << 8) | sa
+        self.spn_values = {} # Keyed by (spn, sa)
+        self.pids = {} # Keyed by (mid, pid)
+        self.multi_section_messages = {}
+        self.bad_blocks = {}
+        self.message_count = 0
+
+        # The ISO 15765 driver looks up the source names in self.j1939db.
+        self.iso_queue = FrameRingBuffer(1000)
+        self.iso_recorder = ISO15765Driver(self, self.iso_queue)
+
+        self.spn_writer = TimeSeriesWriter(self.get_path("spn_timeseries"),
+                                           [("Time", np.float64), ("VDA Time", np.uint32), ("PGN", np.uint32),
+                                            ("SA", np.uint8), ("SPN", np.uint32), ("Value", np.float64)],
+                                           output_format)
+        self.pid_writer = TimeSeriesWriter(self.get_path("pid_timeseries"),
+                                           [("Time", np.float64), ("VDA Time", np.uint32), ("MID", np.uint8),
+                                            ("PID", np.uint16), ("Value", np.float64)],
+                                           output_format)
+        self.dtc_file = open(self.get_path("dtcs.csv"), 'w', newline='')
+        self.dtc_writer = csv.DictWriter(self.dtc_file, DTC_COLUMNS, extrasaction='ignore')
+        self.dtc_writer.writeheader()
+        self.uds_file = open(self.get_path("uds_messages.csv"), 'w', newline='')
+        self.uds_writer = csv.DictWriter(self.uds_file, UDS_COLUMNS, extrasaction='ignore')
+        self.uds_writer.writeheader()
+
+    def get_path(self, filename):
+        return os.path.join(self.output_directory, filename)
+
+    def decode_file(self, filename):
+        """
+        Decode all the messages of a file. Returns the number of messages.
+        """
+        protocol, messages = iter_file_messages(filename, self.bad_blocks)
+        if protocol == "J1939":
+            process = self.process_j1939
+        elif protocol == "J1708":
+            process = self.process_j1708
+        else:
+            logger.warning("{} has {} messages, which are not decoded.".format(filename, protocol))
+            return 0
+        count = 0
+        for current_time, vda_time, data in messages:
+            process(current_time, vda_time, data)
+            count += 1
+        self.message_count += count
+        return count
+
+    def process_j1939(self, current_time, vda_time, rx_buffer):
+        try:
+            vda_time, echo, pgn, pri, sa, da = parse_j1939_header(rx_buffer)
+        except struct.error:
+            return
+        if pgn == ISO_PGN:
+            self.iso_queue.put(current_time, vda_time, rx_buffer)
+            self.iso_recorder.read_message(True)
+            for uds_message in self.iso_recorder.uds_messages.values():
+                uds_message["Time"] = current_time
+                self.uds_writer.writerow(uds_message)
+            self.iso_recorder.uds_messages.clear()
+            return
+        if echo == 1:
+            return
+
+        data_bytes = rx_buffer[J1939_HEADER_LENGTH:]
+        key = (pgn << 8) | sa
+        try:
+            record = self.pgns[key]
+            record[0] += 1
+            record[2] = current_time
+            if record[3] == data_bytes:
+                return
+            record[3] = data_bytes
+        except KeyError:
+            # Count, start time, last time and the last data
+            self.pgns[key] = [1, current_time, current_time, data_bytes]
+
+        plan = self.decode_plans.get(pgn)
+        if plan is not None:
+            for spn, value, meaning in decode_pgn(plan, data_bytes):
+                spn_key = (spn, sa)
+                if self.spn_values.get(spn_key) != value:
+                    self.spn_values[spn_key] = value
+                    self.spn_writer.write((current_time, vda_time, pgn, sa, spn, value))
+
+        if pgn in DM_NAMES:
+            try:
+                if pgn == DM04_PGN:
+                    dtcs = get_freeze_frame(self.j1939db, sa, data_bytes)
+                else:
+                    dtcs = get_DM(self.j1939db, sa, data_bytes)
+            except (IndexError, KeyError, struct.error) as e:
+                logger.debug("Could not decode {} from SA {}: {}".format(DM_NAMES[pgn], sa, repr(e)))
+                return
+            for dtc in dtcs.values():
+                dtc.update({"Time": current_time, "Protocol": "J1939", "Message": DM_NAMES[pgn]})
+                self.dtc_writer.writerow(dtc)
+
+    def process_j1708(self, current_time, vda_time, rx_buffer):
+        if len(rx_buffer) < 7 or rx_buffer[4] == 1:
+            return
+        vda_time = struct.unpack(">L", rx_buffer[0:4])[0]
+        msg = rx_buffer[5:]
+        if msg[1] == J1587_MULTI_SECTION_PID:
+            try:
+                msg = add_multi_section_message(self.multi_section_messages, msg)
+            except IndexError:
+                return
+            if msg is None:
+                return
+        try:
+            mid, pid_list = split_j1587_message(msg)
+        except IndexError:
+            return
+        if mid < 128:
+            return
+
+        source_key = "{} on J1587".format(get_mid_name(self.j1587db, mid))
+        for pid, data_bytes in pid_list:
+            if pid in J1587_PIDS_TO_NOT_DECODE:
+                continue
+            key = (mid, pid)
+            try:
+                record = self.pids[key]
+                record["Num"] += 1
+                record["Last Time"] = current_time
+                if record["Data"] == data_bytes:
+                    continue
+            except KeyError:
+                record = {"Num": 1, "Start Time": current_time, "Last Time": current_time,
+                          "Value": None, "Units": "", "Meaning": "",
+                          "Time Records": {}, "Component Information": {}}
+                self.pids[key] = record
+            record["Data"] = data_bytes
+            try:
+                value, units, meaning = get_j1587_value(self.j1587db, mid, pid, data_bytes, record)
+            except (IndexError, KeyError, struct.error) as e:
+                logger.debug("Could not decode PID {} from MID {}: {}".format(pid, mid, repr(e)))
+                continue
+            record["Units"] = units
+            if meaning is not None:
+                record["Meaning"] = meaning
+            if value != record["Value"]:
+                record["Value"] = value
+                self.pid_writer.write((current_time, vda_time, mid, pid, value))
+            if pid == J1587_DIAGNOSTICS_PID:
+                self.write_j1587_dtcs(current_time, mid, source_key, data_bytes)
+
+    def write_j1587_dtcs(self, current_time, mid, source_key, data_bytes):
+        try:
+            for active, sid, is_sid_code, sid_string, fmi, fmi_text, count in \
+                    iter_j1587_diagnostics(self.j1587db, mid, data_bytes):
+                self.dtc_writer.writerow({"Time": current_time,
+                                          "Protocol": "J1587",
+                                          "Message": "PID {}".format(J1587_DIAGNOSTICS_PID),
+                                          "SA": mid,
+                                          "Source": source_key,
+                                          "SPN": "SID {}".format(sid) if is_sid_code else "PID {}".format(sid),
+                                          "FMI": fmi,
+                                          "Count": count,
+                                          "CM": "Active" if active else "Inactive",
+                                          "Suspect Parameter Number Label": sid_string,
+                                          "FMI Meaning": fmi_text,
+                                          "Raw Hexadecimal": bytes_to_hex_string(data_bytes)})
+        except KeyError as e:
+            logger.debug("Could not decode the diagnostics of MID {}: {}".format(mid, repr(e)))
+
+    def get_sa_name(self, sa):
+        try:
+            return self.j1939db["J1939SATabledb"][sa]
+        except KeyError:
+            return "Unknown"
+
+    def write_summaries(self):
+        with open(self.get_path("pgn_summary.csv"), 'w', newline='') as summary_file:
+            writer = csv.writer(summary_file)
+            writer.writerow(["PGN", "Acronym", "Parameter Group Label", "SA", "Source", "Message Count",
+                             "Start Time", "Last Time", "Period (ms)", "Raw Hexadecimal"])
+            for key in sorted(self.pgns):
+                count, start_time, last_time, data_bytes = self.pgns[key]
+                pgn = key >> 8
+                sa = key & 0xFF
+                try:
+                    acronym = self.j1939db["J1939PGNdb"][pgn]["Label"]
+                    label = self.j1939db["J1939PGNdb"][pgn]["Name"]
+                except KeyError:
+                    acronym = "Unknown"
+                    label = "Not Provided"
+                writer.writerow([pgn, acronym, label, sa, self.get_sa_name(sa), count, start_time, last_time,
+                                 "{:0.2f}".format(1000 * (last_time - start_time) / count),
+                                 bytes_to_hex_string(data_bytes)])
+        with open(self.get_path("j1587_summary.csv"), 'w', newline='') as summary_file:
+            writer = csv.writer(summary_file)
+            writer.writerow(["MID", "Message Identification", "PID", "Parameter Identification",
+                             "Value", "Units", "Meaning", "Message Count", "Start Time", "Last Time",
+                             "Period (ms)", "Raw Hexadecimal"])
+            for (mid, pid) in sorted(self.pids):
+                record = self.pids[(mid, pid)]
+                writer.writerow([mid, get_mid_name(self.j1587db, mid), pid, get_pid_name(self.j1587db, pid),
+                                 record["Value"], record["Units"], record["Meaning"], record["Num"],
+                                 record["Start Time"], record["Last Time"],
+                                 "{:0.2f}".format(1000 * (record["Last Time"] - record["Start Time"]) / record["Num"]),
+                                 bytes_to_hex_string(record["Data"])])
+
+    def close(self):
+        self.write_summaries()
+        self.spn_writer.close()
+        self.pid_writer.close()
+        self.dtc_file.close()
+        self.uds_file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode CAN Logger 2 files and captures without the GUI.")
+    parser.add_argument("paths", nargs="+", help="files, or directories of .bin files")
+    parser.add_argument("-o", "--output", default="decoded", help="directory for the output files")
+    parser.add_argument("-f", "--format", choices=["csv", "npz"], default="csv",
+                        help="format of the time series")
+    parser.add_argument("--j1939db", default=os.path.join(module_directory, "J1939db.json"))
+    parser.add_argument("--j1587db", default=os.path.join(module_directory, "J1587db.json"))
+    args = parser.parse_args(argv)
+
+    try:
+        j1939db = load_j1939db(args.j1939db)
+    except FileNotFoundError:
+        logger.warning("{} was not found.".format(args.j1939db))
+        j1939db = empty_j1939db()
+    try:
+        with open(args.j1587db, 'r') as j1587_file:
+            j1587db = json.load(j1587_file)
+    except FileNotFoundError:
+        logger.info("{} was not found.".format(args.j1587db))
+        j1587db = empty_j1587db()
+
+    decoder = BatchDecoder(j1939db, j1587db, args.output, args.format)
+    start = time.time()
+    try:
+        for filename in find_logger2_files(args.paths):
+            file_start = time.time()
+            try:
+                count = decoder.decode_file(filename)
+            except (OSError, ValueError) as e:
+                logger.warning(repr(e))
+                print("{}: {}".format(filename, e))
+                continue
+            print("{}: {} messages in {:.2f} s, {} bad blocks".format(
+                filename, count, time.time() - file_start, decoder.bad_blocks.get(filename, 0)))
+    finally:
+        decoder.close()
+    print("Decoded {} messages in {:.2f} s to {}".format(decoder.message_count, time.time() - start, args.output))
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
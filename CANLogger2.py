@@ -0,0 +1,295 @@
+"""
+Reading the data files of the NMFTA/TU CAN Logger 2.
+
+A file is a series of 512 byte blocks. Each block holds 19 CAN records of 25
+bytes, the receive counts and error counters of the CAN controllers and a
+CRC-32 of the first 508 bytes in its last 4 bytes. The records are turned
+into RP1210 J1939 messages, so they go through the same pipeline as the
+messages read from an adapter.
+
+The file is memory mapped and viewed as an array of LOGGER2_BLOCK_DTYPE, so a
+chunk of thousands of blocks is parsed with a few NumPy operations on whole
+columns instead of struct calls for every record. Only the CRC-32 is still
+computed one block at a time.
+
+Many files, like the ones pulled from the trucks of a fleet, are imported
+together by Logger2BatchImport. The files are split into chunks of whole
+blocks that a pool of processes checks and decodes. A block that fails its
+CRC check is skipped and counted for its file, and the records of all the
+files are merged in time stamp order.
+"""
+import concurrent.futures
+import os
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+LOGGER2_BLOCK_SIZE = 512
+LOGGER2_RECORD_COUNT = 19
+# Blocks parsed at a time. This bounds the memory used for a large file.
+LOGGER2_CHUNK_BLOCKS = 1 << 16
+# Blocks parsed at a time by the GUI import between updates of the progress
+# dialog. Their messages fit in the receive ring buffer.
+LOGGER2_IMPORT_BLOCKS = 256
+# Blocks decoded by a process of a batch import at a time
+LOGGER2_BATCH_BLOCKS = 1 << 13
+# Bytes of an RP1210 J1939 message made from a record: VDA time, echo, PGN,
+# priority, SA, DA and 8 data bytes
+LOGGER2_MESSAGE_SIZE = 19
+
+# A record is the channel, a time stamp in seconds, a microsecond counter,
+# the CAN ID, the DLC and the microseconds of the time stamp in the 3 bytes
+# starting at the DLC, and 8 data bytes.
+LOGGER2_RECORD_DTYPE = np.dtype({"names": ["channel", "timestamp", "system_micros", "can_id", "dlc", "micros", "data"],
+                                 "formats": ["u1", "<u4", "<u4", "<u4", "u1", "<u4", ("u1", 8)],
+                                 "offsets": [0, 1, 5, 9, 13, 13, 17],
+                                 "itemsize": 25})
+LOGGER2_BLOCK_DTYPE = np.dtype({"names": ["prefix", "records", "rx_counts", "rec", "tec", "block_filename", "crc"],
+                                "formats": ["S4", (LOGGER2_RECORD_DTYPE, LOGGER2_RECORD_COUNT), ("<u4", 3),
+                                            ("u1", 3), ("u1", 3), "S8", "<u4"],
+                                "offsets": [0, 4, 479, 491, 494, 497, 508],
+                                "itemsize": LOGGER2_BLOCK_SIZE})
+
+# The records of a chunk of blocks as columns. messages is an (N, 19) uint8
+# array of RP1210_ReadMessage J1939 messages.
+Logger2Records = namedtuple("Logger2Records", ["timestamps", "system_micros", "channels", "can_ids",
+                                               "pgns", "priorities", "sources", "destinations",
+                                               "data", "messages"])
+
+
+def map_logger2_blocks(filename):
+    """
+    Return the complete blocks of a CAN Logger 2 file as a memory mapped
+    array of LOGGER2_BLOCK_DTYPE.
+    """
+    block_count = os.path.getsize(filename) // LOGGER2_BLOCK_SIZE
+    if block_count == 0:
+        return np.zeros(0, dtype=LOGGER2_BLOCK_DTYPE)
+    return np.memmap(filename, dtype=LOGGER2_BLOCK_DTYPE, mode='r', shape=(block_count,))
+
+def check_logger2_blocks(blocks):
+    """
+    Return a boolean array that is True for the blocks whose CRC-32 matches.
+    """
+    raw = blocks.view(np.uint8).reshape(-1, LOGGER2_BLOCK_SIZE)
+    crcs = np.fromiter((zlib.crc32(row[:508]) for row in raw), dtype=np.uint32, count=len(raw))
+    return crcs == blocks["crc"]
+
+def decode_logger2_blocks(blocks):
+    """
+    Return the records of an array of blocks as Logger2Records. The records
+    of a block end at the first one with a DLC of 0xFF.
+    """
+    records = blocks["records"]
+    used = np.cumprod(records["dlc"] != 0xFF, axis=1).astype(bool)
+    records = records[used]
+
+    can_ids = records["can_id"]
+    sources = (can_ids & 0xFF).astype(np.uint8)
+    priorities = ((can_ids >> 26) & 0x07).astype(np.uint8)
+    data_page = ((can_ids >> 24) & 0x03).astype(np.uint8) # EDP and DP
+    pf = ((can_ids >> 16) & 0xFF).astype(np.uint8)
+    ps = ((can_ids >> 8) & 0xFF).astype(np.uint8)
+    pdu2 = pf >= 0xF0
+    destinations = np.where(pdu2, np.uint8(0xFF), ps)
+    ps = np.where(pdu2, ps, np.uint8(0))
+    # The EDP and DP bits are added like the record by record import did.
+    pgn_high = (data_page >> 1) + (data_page & 1)
+    pgns = (pgn_high.astype(np.uint32) << 16) | (pf.astype(np.uint32) << 8) | ps
+
+    system_micros = records["system_micros"]
+    timestamps = records["timestamp"] + (records["micros"] & 0x00FFFFFF) / 1000000
+
+    messages = np.empty((len(records), LOGGER2_MESSAGE_SIZE), dtype=np.uint8)
+    messages[:, 0:4] = system_micros.astype(">u4").view(np.uint8).reshape(-1, 4)
+    messages[:, 4] = 0 # not an echo
+    messages[:, 5] = ps
+    messages[:, 6] = pf
+    messages[:, 7] = pgn_high
+    messages[:, 8] = priorities
+    messages[:, 9] = sources
+    messages[:, 10] = destinations
+    messages[:, 11:] = records["data"]
+    return Logger2Records(timestamps, system_micros, records["channel"], can_ids,
+                          pgns, priorities, sources, destinations, records["data"], messages)
+
+def read_logger2_chunks(filename, chunk_blocks=LOGGER2_CHUNK_BLOCKS):
+    """
+    Yield the records of a CAN Logger 2 file as Logger2Records, a chunk of
+    blocks at a time, with the number of bytes read so far. Stops at the
+    first block that fails its CRC check.
+    """
+    blocks = map_logger2_blocks(filename)
+    for start in range(0, len(blocks), chunk_blocks):
+        chunk = blocks[start:start + chunk_blocks]
+        good = check_logger2_blocks(chunk)
+        if not good.all():
+            logger.warning("CRC Failed")
+            chunk = chunk[:np.argmin(good)]
+            yield decode_logger2_blocks(chunk), (start + len(chunk)) * LOGGER2_BLOCK_SIZE
+            return
+        yield decode_logger2_blocks(chunk), (start + len(chunk)) * LOGGER2_BLOCK_SIZE
+    logger.debug("Reached end of file {}".format(filename))
+
+def decode_logger2_file_chunk(filename, start_block, block_count):
+    """
+    Decode block_count blocks of a CAN Logger 2 file starting at
+    start_block, skipping the blocks that fail their CRC check. Returns the
+    Logger2Records and the number of bad blocks. This runs in the processes
+    of a batch import.
+    """
+    chunk = map_logger2_blocks(filename)[start_block:start_block + block_count]
+    good = check_logger2_blocks(chunk)
+    return decode_logger2_blocks(chunk[good]), int(len(good) - np.count_nonzero(good))
+
+def concatenate_logger2_records(records_list):
+    """
+    Join a list of Logger2Records into one.
+    """
+    if not records_list:
+        return decode_logger2_blocks(np.zeros(0, dtype=LOGGER2_BLOCK_DTYPE))
+    return Logger2Records(*(np.concatenate(columns) for columns in zip(*records_list)))
+
+def sort_logger2_records(records):
+    """
+    Return the records sorted by time stamp. Records with the same time stamp
+    stay in the order they were in.
+    """
+    if np.all(records.timestamps[1:] >= records.timestamps[:-1]):
+        return records
+    order = np.argsort(records.timestamps, kind="stable")
+    return Logger2Records(*(column[order] for column in records))
+
+def find_logger2_files(paths):
+    """
+    Return the CAN Logger 2 files of a directory, or of a list of files and
+    directories, sorted by name. The files of a directory are the .bin files
+    in it.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                             if name.lower().endswith(".bin") and os.path.isfile(os.path.join(path, name)))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+class Logger2BatchImport():
+    """
+    Imports many CAN Logger 2 files with a pool of processes.
+
+    start submits the chunks of the files to the pool and poll collects the
+    chunks that are done, so a GUI can keep its event loop running in
+    between. When done is True, get_records returns the records of all the
+    files in time stamp order. crc_failures counts the blocks of each file
+    that failed their CRC check.
+    """
+    def __init__(self, paths, workers=None, chunk_blocks=LOGGER2_BATCH_BLOCKS):
+        self.filenames = find_logger2_files(paths)
+        self.workers = workers
+        self.chunks = []
+        self.crc_failures = {}
+        self.record_counts = {}
+        self.total_bytes = 0
+        for filename in self.filenames:
+            block_count = os.path.getsize(filename) // LOGGER2_BLOCK_SIZE
+            for start_block in range(0, block_count, chunk_blocks):
+                self.chunks.append((filename, start_block, min(chunk_blocks, block_count - start_block)))
+            self.crc_failures[filename] = 0
+            self.record_counts[filename] = 0
+            self.total_bytes += block_count * LOGGER2_BLOCK_SIZE
+        self.bytes_processed = 0
+        self.results = [None] * len(self.chunks)
+        self.executor = None
+        self.futures = {}
+
+    def start(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        for i, (filename, start_block, block_count) in enumerate(self.chunks):
+            future = self.executor.submit(decode_logger2_file_chunk, filename, start_block, block_count)
+            self.futures[future] = i
+
+    def poll(self, timeout=0.1):
+        """
+        Wait up to timeout seconds for chunks to finish and collect them.
+        Returns True when all of them are done.
+        """
+        if self.futures:
+            finished, pending = concurrent.futures.wait(self.futures, timeout,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                i = self.futures.pop(future)
+                filename, start_block, block_count = self.chunks[i]
+                records, bad_blocks = future.result()
+                if bad_blocks:
+                    logger.warning("{} blocks of {} failed the CRC check".format(bad_blocks, filename))
+                self.results[i] = records
+                self.crc_failures[filename] += bad_blocks
+                self.record_counts[filename] += len(records.timestamps)
+                self.bytes_processed += block_count * LOGGER2_BLOCK_SIZE
+        if not self.futures and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return self.done
+
+    @property
+    def done(self):
+        return not self.futures and all(result is not None for result in self.results)
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.futures = {}
+
+    def get_records(self):
+        """
+        Return the records of all the files merged in time stamp order.
+        """
+        records = sort_logger2_records(concatenate_logger2_records(
+            [result for result in self.results if result is not None]))
+        self.results = [None] * len(self.chunks)
+        return records
+
+    def run(self):
+        """
+        Import the files without a GUI and return the merged records.
+        """
+        self.start()
+        while not self.poll():
+            pass
+        return self.get_records()
+
+
+def iter_logger2(filename):
+    """
+    Yield the records of a CAN Logger 2 file as (timestamp, system_micros,
+    rp1210_message). Stops at the first block that fails its CRC check.
+    """
+    for records, bytes_read in read_logger2_chunks(filename):
+        for timestamp, system_micros, message in zip(records.timestamps.tolist(),
+                                                     records.system_micros.tolist(),
+                                                     records.messages):
+            yield (timestamp, system_micros, message.tobytes())
+
+if __name__ == '__main__':
+    import sys
+    import time
+    start = time.time()
+    batch = Logger2BatchImport(sys.argv[1:])
+    records = batch.run()
+    duration = time.time() - start
+    for filename in batch.filenames:
+        print("{}: {} records, {} bad blocks".format(filename, batch.record_counts[filename], batch.crc_failures[filename]))
+    print("Imported {} records from {:0.3f} Mbytes in {:.2f} s".format(
+        len(records.timestamps), batch.total_bytes / 1000000, duration))
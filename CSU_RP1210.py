@@ -69,15 +69,29 @@ import struct
 import json
 import os
 import threading
-import binascii
+import multiprocessing
 
 from RP1210 import *
 from RP1210Functions import *
+from RP1210Filters import *
+from RP1210Backends import *
+from RP1210Capture import *
+from CANLogger2 import *
+from CaptureReplay import *
+from LogImportThread import *
 from RP1210Select import *
 from J1939Tab import *
 from J1587Tab import *
 from ComponentInfoTab import *
 from ISO15765 import *
+from J1939Database import *
+from RingBuffer import *
+try:
+    from J1939Worker import *
+except ImportError:
+    # The worker process shares its state with multiprocessing.shared_memory,
+    # which needs Python 3.8 or later.
+    J1939WorkerThread = None
 
 if sys.maxsize > 2**32:
     print("Must run on 32-bit Python.")
@@ -111,29 +125,30 @@ class CSU_RP1210(QMainWindow):
         #load the J1939 Database
         progress.setLabel(progress_label)
         try:
-            with open("J1939db.json",'r') as j1939_file:
-                self.j1939db = json.load(j1939_file) 
+            self.j1939db = load_j1939db("J1939db.json")
         except FileNotFoundError:
             try:
-                with open(os.path.join(module_directory,"J1939db.json"),'r') as j1939_file:
-                    self.j1939db = json.load(j1939_file) 
+                self.j1939db = load_j1939db(os.path.join(module_directory,"J1939db.json"))
             except FileNotFoundError: 
                 # Make a data structure to do something anyways
                 logger.debug("J1939db.json file was not found.")
-                self.j1939db = {"J1939BitDecodings":{},
-                                "J1939FMITabledb": {},
-                            "J1939LampFlashTabledb": {},
-                            "J1939OBDTabledb": {},
-                            "J1939PGNdb": {},
-                            "J1939SAHWTabledb": {},
-                            "J1939SATabledb": {},
-                            "J1939SPNdb": {} }
+                self.j1939db = empty_j1939db()
         logger.info("Done Loading J1939db")
         progress.setValue(1)
         QCoreApplication.processEvents()
 
         self.rx_queues = {}
         self.tx_queues = {}
+        # What to do with received messages when the GUI falls behind
+        self.overflow_policies = {"J1939": DROP_OLDEST,
+                                  "J1708": DROP_OLDEST,
+                                  "CAN": DROP_NEWEST}
+        # Messages the adapter should not pass on. These are the fast
+        # messages from the engine and transmission.
+        self.message_filter_settings = {"J1939": {"Mode": BLOCK_LISTED,
+                                                  "Filters": [{"PGN": pgn, "SA": sa}
+                                                              for pgn in [61444, 61443, 65134, 65215]
+                                                              for sa in [0, 11]]}}
         progress_label.setText("Loading the J1587 Database")
         try:
             with open(os.path.join(module_directory,"J1587db.json"),'r') as j1587_file:
@@ -193,6 +208,17 @@ class CSU_RP1210(QMainWindow):
         os.system("TASKKILL /F /IM DGServer1.exe")  
         
         self.update_rate = 100
+        self.read_batch_size = 256 # messages taken from a ring buffer at a time
+        # Read and decode J1939 in a separate process
+        self.use_j1939_worker = False
+        self.j1939_worker = None
+        # Write the raw traffic of the read threads to capture files
+        self.capture_traffic = False
+        self.capture_compression = ZLIB_COMPRESSION
+        self.capture_writers = {}
+        self.replay_thread = None
+        self.import_thread = None
+        self.import_progress = None
 
         self.module_directory = module_directory
         
@@ -258,6 +284,22 @@ class CSU_RP1210(QMainWindow):
         open_logger2.triggered.connect(self.open_open_logger2)
         file_menu.addAction(open_logger2)
 
+        import_logger2_files = QAction(QIcon(os.path.join(module_directory,r'icons/logger2_48px.png')), 'Import CAN Logger 2 &Files', self)
+        import_logger2_files.setStatusTip('Import many files from the NMFTA/TU CAN Logger 2 together')
+        import_logger2_files.triggered.connect(self.import_logger2_files)
+        file_menu.addAction(import_logger2_files)
+
+        import_logger2_directory = QAction(QIcon(os.path.join(module_directory,r'icons/logger2_48px.png')), 'Import CAN Logger 2 &Directory', self)
+        import_logger2_directory.setStatusTip('Import all the CAN Logger 2 files in a directory')
+        import_logger2_directory.triggered.connect(self.import_logger2_directory)
+        file_menu.addAction(import_logger2_directory)
+
+        replay_capture = QAction(QIcon(os.path.join(module_directory,r'icons/logger2_48px.png')), '&Replay Capture', self)
+        replay_capture.setShortcut('Ctrl+R')
+        replay_capture.setStatusTip('Play a capture or a CAN Logger 2 file back through the decoders')
+        replay_capture.triggered.connect(self.replay_capture)
+        file_menu.addAction(replay_capture)
+
 
         exit_action = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Close_Window_48px.png')), '&Quit', self)
         exit_action.setShortcut('Ctrl+Q')
@@ -405,6 +447,38 @@ class CSU_RP1210(QMainWindow):
         rp1210_get_hardware_status_ex.triggered.connect(self.get_hardware_status_ex)
         self.rp1210_menu.addAction(rp1210_get_hardware_status_ex)
 
+        rp1210_overflow_policy = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Settings_48px.png')), 'Receive &Overflow Policy', self)
+        rp1210_overflow_policy.setStatusTip('Choose what happens to received messages when the display cannot keep up.')
+        rp1210_overflow_policy.triggered.connect(self.set_overflow_policy)
+        self.rp1210_menu.addAction(rp1210_overflow_policy)
+
+        rp1210_message_filters = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Settings_48px.png')), 'Message &Filters', self)
+        rp1210_message_filters.setStatusTip('Choose the messages the adapter passes or blocks.')
+        rp1210_message_filters.triggered.connect(self.set_message_filters)
+        self.rp1210_menu.addAction(rp1210_message_filters)
+
+        rp1210_j1939_worker = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Settings_48px.png')), 'Decode J1939 in a &Worker Process', self)
+        rp1210_j1939_worker.setCheckable(True)
+        rp1210_j1939_worker.setChecked(self.use_j1939_worker)
+        rp1210_j1939_worker.setStatusTip('Read and decode J1939 in a separate process the next time the clients connect.')
+        rp1210_j1939_worker.toggled.connect(self.set_use_j1939_worker)
+        if J1939WorkerThread is None:
+            rp1210_j1939_worker.setEnabled(False)
+            rp1210_j1939_worker.setStatusTip('Decoding J1939 in a worker process needs Python 3.8 or later.')
+        self.rp1210_menu.addAction(rp1210_j1939_worker)
+
+        rp1210_capture = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Settings_48px.png')), '&Capture Raw Traffic', self)
+        rp1210_capture.setCheckable(True)
+        rp1210_capture.setChecked(self.capture_traffic)
+        rp1210_capture.setStatusTip('Write every message the adapter receives to binary capture files.')
+        rp1210_capture.toggled.connect(self.set_capture_traffic)
+        self.rp1210_menu.addAction(rp1210_capture)
+
+        rp1210_capture_compression = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Settings_48px.png')), 'Capture Co&mpression', self)
+        rp1210_capture_compression.setStatusTip('Choose how the blocks of new capture files are compressed.')
+        rp1210_capture_compression.triggered.connect(self.set_capture_compression)
+        self.rp1210_menu.addAction(rp1210_capture_compression)
+
         disconnect_rp1210 = QAction(QIcon(os.path.join(module_directory,r'icons/icons8_Disconnected_48px.png')), 'Client &Disconnect', self)
         disconnect_rp1210.setShortcut('Ctrl+Shift+D')
         disconnect_rp1210.setStatusTip('Disconnect all RP1210 Clients')
@@ -452,6 +526,7 @@ class CSU_RP1210(QMainWindow):
                                                  "DM02":{},
                                                  "DM04":{}
                                                  }
+        self.data_package["Receive Queues"] = {}
         self.request_timeout = 1
 
         self.J1939.reset_data()
@@ -483,137 +558,208 @@ class CSU_RP1210(QMainWindow):
                                             filters,
                                             selected_filter)
         if fname:
-            file_size = os.path.getsize(fname)
-            bytes_processed = 0
-            #update the data package
-            progress = QProgressDialog(self)
-            progress.setMinimumWidth(600)
-            progress.setWindowTitle("Processing CAN Logger 2 Data File")
-            progress.setMinimumDuration(0)
-            progress.setWindowModality(Qt.WindowModal)
-            progress.setModal(False) #Will lead to instability when trying to click around.
-            progress.setMaximum(file_size)
-            progress_label = QLabel("Processed {:0.3f} of {:0.3f} Mbytes.".format(bytes_processed/1000000,file_size/1000000))
-            progress.setLabel(progress_label)
-        
-            logger.debug("Importing file {}".format(fname))
-            with open(fname,'rb') as f:
-                while True:
-                    line = f.read(512)
-                    if len(line) < 512:
-                        logger.debug("Reached end of file {}".format(fname))
-                        break
-                    #check integrity
-                    bytes_to_check = line[0:508]
-                    crc_value = struct.unpack('<L',line[508:512])[0]
-                    
-                    if binascii.crc32(bytes_to_check) != crc_value:
-                        logger.warning("CRC Failed")
-                        break
-                    #print('CRC Passed')
-                    #print(line)
-                    #print(" ".join(["{:02X}".format(c) for c in line]))
-                    prefix = line[0:4]
-                    RXCount0 = struct.unpack('<L',line[479:483])[0]
-                    RXCount1 = struct.unpack('<L',line[483:487])[0]   
-                    RXCount2 = struct.unpack('<L',line[487:491])[0]
-                    # CAN Controller Receive Error Counters.
-                    Can0_REC = line[491]
-                    Can1_REC = line[492]
-                    Can2_REC = line[493]
-                    # CAN Controller Transmit Error Counters
-                    Can0_TEC = line[494]
-                    Can1_TEC = line[495]
-                    Can2_TEC = line[496]
-                    # A constant ASCII Text file to preserve the original filename (and take up space)
-                    block_filename = line[497:505]
-                    #micro seconds to write the previous 512 bytes to the SD card (only 3 bytes so mask off the MSB)
-                    buffer_write_time = struct.unpack('<L',line[505:509])[0] & 0x00FFFFFF
-                    for i in range(4,487,25):
-                        # parse data from records
-                        channel = line[i]
-                        timestamp = struct.unpack('<L',line[i+1:i+5])[0]
-                        system_micros = struct.unpack('<L',line[i+5:i+9])[0]
-                        can_id = struct.unpack('<L',line[i+9:i+13])[0]
-                        dlc = line[i+13]
-                        if dlc == 0xFF:
-                            break
-                        micros_per_second = struct.unpack('<L',line[i+13:i+17])[0] & 0x00FFFFFF
-                        timestamp += micros_per_second/1000000
-                        data_bytes = line[i+17:i+25]
-                        data = struct.unpack('8B',data_bytes)[0]
-
-                        #create an RP1210 data structure
-                        sa =  can_id & 0xFF
-                        priority = (can_id & 0x1C000000) >> 26
-                        edp = (can_id & 0x02000000) >> 25
-                        dp =  (can_id & 0x01000000) >> 24
-                        pf =  (can_id & 0x00FF0000) >> 16
-                        if pf >= 0xF0:
-                            ps = (can_id & 0x0000FF00) >> 8
-                            da = 0xFF
-                        else:
-                            ps = 0
-                            da = (can_id & 0x0000FF00) >> 8
-                        ps = struct.pack('B', ps)
-                        pf = struct.pack('B', pf)
-                        pgn = ps + pf + struct.pack('B', edp + dp)
-                        rp1210_message = struct.pack('<L',system_micros) 
-                        rp1210_message += b'\x00' 
-                        rp1210_message += pgn  
-                        rp1210_message += struct.pack('B', priority) 
-                        rp1210_message += struct.pack('B', sa) 
-                        rp1210_message += struct.pack('B', da) 
-                        rp1210_message += data_bytes
-                        self.rx_queues["Logger"].put((timestamp, rp1210_message))
-                    bytes_processed += 512
-                    progress.setValue(bytes_processed)
-                    progress_label.setText("Processed {:0.3f} of {:0.3f} Mbytes.".format(bytes_processed/1000000,file_size/1000000))
-                    if progress.wasCanceled():
-                        break
-                    QCoreApplication.processEvents()
+            self.start_log_import(fname, "Processing CAN Logger 2 Data File")
+
+    def import_logger2_files(self):
+        filters = "{} Data Files (*.bin);;All Files (*.*)".format(self.title)
+        selected_filter = "CAN Logger 2 Data Files (*.bin)"
+        fnames,_ = QFileDialog.getOpenFileNames(self,
+                                               'Import CAN Logger 2 Files',
+                                               self.export_path,
+                                               filters,
+                                               selected_filter)
+        if fnames:
+            self.import_logger2_batch(fnames)
+
+    def import_logger2_directory(self):
+        directory = QFileDialog.getExistingDirectory(self,
+                                                     'Import CAN Logger 2 Directory',
+                                                     self.export_path)
+        if directory:
+            self.import_logger2_batch(directory)
+
+    def import_logger2_batch(self, paths):
+        """
+        Decode CAN Logger 2 files with a pool of processes and load their
+        messages in time stamp order. Blocks that fail the CRC check are
+        skipped and reported for each file at the end.
+        """
+        if not find_logger2_files(paths):
+            QMessageBox.information(self, "Import CAN Logger 2", "There are no CAN Logger 2 files in {}.".format(paths))
+            return
+        self.start_log_import(paths, "Processing CAN Logger 2 Data Files", use_pool=True)
+
+    def start_log_import(self, paths, title, use_pool=False):
+        """
+        Import log files on a LogImportThread. The messages go through the
+        Logger ring buffer, so the GUI decodes them on its read timer and
+        stays interactive.
+        """
+        self.cancel_log_import()
+        self.stop_replay()
+        self.import_progress = QProgressDialog(self)
+        self.import_progress.setMinimumWidth(600)
+        self.import_progress.setWindowTitle(title)
+        self.import_progress.setMinimumDuration(0)
+        self.import_progress.setWindowModality(Qt.NonModal)
+        self.import_progress.setAutoClose(False)
+        self.import_progress.setAutoReset(False)
+        self.import_progress.setMaximum(0)
+        self.import_progress.setLabelText("Starting the import.")
+        self.import_progress.canceled.connect(self.cancel_log_import)
+        self.import_progress.show()
+
+        self.import_thread = LogImportThread(self.rx_queues["Logger"], paths, use_pool, self)
+        self.import_thread.progress.connect(self.show_import_progress)
+        self.import_thread.import_finished.connect(self.log_import_finished)
+        self.import_thread.start()
+
+    def show_import_progress(self, done, total, text):
+        if self.import_progress is not None:
+            self.import_progress.setMaximum(max(total, 1))
+            self.import_progress.setValue(done)
+            self.import_progress.setLabelText(text)
+
+    def cancel_log_import(self):
+        """
+        Stop the import and drop the messages it has not delivered yet.
+        """
+        if self.import_thread is not None:
+            self.import_thread.progress.disconnect()
+            self.import_thread.import_finished.disconnect()
+            self.import_thread.cancel()
+            self.import_thread.wait()
+            self.import_thread = None
+            logger.info("Cancelled the import.")
+            rx_queue = self.rx_queues["Logger"]
+            while rx_queue.qsize():
+                rx_queue.get_batch(self.read_batch_size)
+        self.close_import_progress()
+
+    def close_import_progress(self):
+        if self.import_progress is not None:
+            self.import_progress.canceled.disconnect()
+            self.import_progress.close()
+            self.import_progress.deleteLater()
+            self.import_progress = None
+
+    def log_import_finished(self, summary):
+        self.import_thread = None
+        self.close_import_progress()
+        self.statusBar().showMessage("Imported {} messages.".format(summary["Messages"]))
+        if summary["Error"] is not None:
+            QMessageBox.warning(self, "Import CAN Logger 2", "The import stopped:\n{}".format(summary["Error"]))
+        stopped = ["{}: stopped at byte {}, {} blocks were not imported".format(
+                       os.path.basename(filename), offset, blocks)
+                   for filename, (offset, blocks) in summary["Stopped At"].items()]
+        if stopped:
+            QMessageBox.warning(self, "Import CAN Logger 2",
+                                "A block failed the CRC check and the rest of the file was not imported.\n" +
+                                "\n".join(stopped))
+        failures = ["{}: {} bad blocks".format(os.path.basename(filename), count)
+                    for filename, count in summary["CRC Failures"].items()
+                    if count and filename not in summary["Stopped At"]]
+        if failures:
+            QMessageBox.warning(self, "Import CAN Logger 2",
+                                "Blocks that failed the CRC check were skipped.\n" + "\n".join(failures))
+
+    def replay_capture(self):
+        """
+        Ask for a capture file and the replay speed and start playing the file
+        back into the receive ring buffers.
+        """
+        filters = "{} Data Files (*.bin);;All Files (*.*)".format(self.title)
+        fname,_ = QFileDialog.getOpenFileName(self,
+                                            'Replay Capture File',
+                                            self.export_path,
+                                            filters)
+        if not fname:
+            return
+        speeds = list(REPLAY_SPEEDS.keys())
+        speed, ok = QInputDialog.getItem(self, "Replay Capture", "Replay speed:", speeds, 0, False)
+        if not ok:
+            return
+        try:
+            protocol, messages = open_replay_file(fname)
+        except (OSError, ValueError) as e:
+            logger.warning(repr(e))
+            QMessageBox.warning(self, "Replay Capture", "Could not open {}:\n{}".format(fname, e))
+            return
+        self.cancel_log_import()
+        self.stop_replay()
+        # A ring buffer has one writer, so a replay never goes into the ring of
+        # a read thread. J1939 goes where imported files go and the other
+        # protocols get a Logger ring of their own.
+        queue_name = "Logger" if protocol == "J1939" else "Logger " + protocol
+        if queue_name not in self.rx_queues:
+            self.rx_queues[queue_name] = FrameRingBuffer()
+        self.replay_thread = ReplayThread(self.rx_queues[queue_name], messages, REPLAY_SPEEDS[speed])
+        self.replay_thread.setDaemon(True)
+        self.replay_thread.start()
+        self.statusBar().showMessage("Replaying {} at {}".format(fname, speed))
+
+    def stop_replay(self):
+        """
+        Stop the replay and drop the messages it has not delivered yet, so
+        the next writer of its ring buffer starts alone on an empty ring.
+        """
+        if self.replay_thread is not None:
+            self.replay_thread.runSignal = False
+            self.replay_thread.join()
+            rx_queue = self.replay_thread.rx_queue
+            while rx_queue.qsize():
+                rx_queue.get_batch(self.read_batch_size)
+            self.replay_thread = None
+
+    def check_replay(self):
+        """
+        Report the replay rate when the replay is over.
+        """
+        if self.replay_thread is not None and not self.replay_thread.is_alive():
+            self.statusBar().showMessage("Replayed {} messages in {:.1f} s ({:.0f} messages/s)".format(
+                self.replay_thread.message_count, self.replay_thread.duration, self.replay_thread.messages_per_second))
+            self.replay_thread = None
 
-                    
-            progress.deleteLater()
     def reload_data(self):
         """
         Reload and refresh the data tables.
         """
-        self.J1939.pgn_data_model.aboutToUpdate()
-        self.J1939.j1939_unique_ids = self.data_package["J1939 Parameter Group Numbers"]
+        # Saved records have string keys.
+        self.J1939.pgn_data_model.beginResetModel()
+        self.J1939.j1939_unique_ids = import_pgn_records(self.data_package["J1939 Parameter Group Numbers"])
         self.J1939.pgn_data_model.setDataDict(self.J1939.j1939_unique_ids)
-        self.J1939.pgn_data_model.signalUpdate()
+        self.J1939.pgn_data_model.endResetModel()
         #TODO: Add the row and column resizers like the one for UDS.
-
-        self.J1939.pgn_rows = list(self.J1939.j1939_unique_ids.keys())
         
-        self.J1939.spn_data_model.aboutToUpdate()
-        self.J1939.unique_spns = self.data_package["J1939 Suspect Parameter Numbers"]
+        self.J1939.spn_data_model.beginResetModel()
+        self.J1939.unique_spns = import_spn_records(self.data_package["J1939 Suspect Parameter Numbers"])
         self.J1939.spn_data_model.setDataDict(self.J1939.unique_spns)
-        self.J1939.spn_data_model.signalUpdate()
+        self.J1939.spn_data_model.endResetModel()
+        self.J1939.previous_spn_length = 0
 
-        self.J1939.dm01_data_model.aboutToUpdate()
+        self.J1939.dm01_data_model.beginResetModel()
         self.J1939.active_trouble_codes = self.data_package["Diagnostic Codes"]["DM01"]
         self.J1939.dm01_data_model.setDataDict(self.J1939.active_trouble_codes)
-        self.J1939.dm01_data_model.signalUpdate()
+        self.J1939.dm01_data_model.endResetModel()
 
-        self.J1939.dm02_data_model.aboutToUpdate()
+        self.J1939.dm02_data_model.beginResetModel()
         self.J1939.previous_trouble_codes = self.data_package["Diagnostic Codes"]["DM02"]
         self.J1939.dm02_data_model.setDataDict(self.J1939.previous_trouble_codes)
-        self.J1939.dm02_data_model.signalUpdate()
+        self.J1939.dm02_data_model.endResetModel()
 
-        self.J1939.dm04_data_model.aboutToUpdate()
+        self.J1939.dm04_data_model.beginResetModel()
         self.J1939.freeze_frame = self.data_package["Diagnostic Codes"]["DM04"]
         self.J1939.dm04_data_model.setDataDict(self.J1939.freeze_frame)
-        self.J1939.dm04_data_model.signalUpdate()
+        self.J1939.dm04_data_model.endResetModel()
 
-        self.J1939.uds_data_model.aboutToUpdate()
+        self.J1939.uds_data_model.beginResetModel()
         self.J1939.iso_recorder.uds_messages = self.data_package["UDS Messages"]
         self.J1939.uds_data_model.setDataDict(self.J1939.iso_recorder.uds_messages)
-        self.J1939.uds_data_model.signalUpdate()
+        self.J1939.uds_data_model.endResetModel()
         self.J1939.uds_table.resizeRowsToContents()
         for c in self.J1939.uds_resizable_cols:
             self.J1939.uds_table.resizeColumnToContents(c)       
+        self.J1939.share_data_package()
 
     def confirm_quit(self):
         self.close()
@@ -625,6 +771,8 @@ class CSU_RP1210(QMainWindow):
             QMessageBox.Yes)
         if result == QMessageBox.Yes:
             logger.debug("Quitting.")
+            self.cancel_log_import()
+            self.stop_capture()
             event.accept()
         else:
             event.ignore()
@@ -650,11 +798,14 @@ class CSU_RP1210(QMainWindow):
             self.close_clients()
         except AttributeError:
             pass
+        self.stop_capture()
+        self.stop_replay()
         try:
-            for thread in self.read_message_threads:
+            for thread in self.read_message_threads.values():
                 thread.runSignal = False
         except AttributeError:
             pass
+        self.j1939_worker = None
         
         progress = QProgressDialog(self)
         progress.setMinimumWidth(600)
@@ -663,8 +814,8 @@ class CSU_RP1210(QMainWindow):
         progress.setWindowModality(Qt.WindowModal)
         progress.setMaximum(6)
       
-        # Once an RP1210 DLL is selected, we can connect to it using the RP1210 helper file.
-        self.RP1210 = RP1210Class(dll_name)
+        # Once an RP1210 DLL or backend is selected, we can connect to it using the RP1210 helper file.
+        self.RP1210 = create_rp1210(dll_name)
     
         if self.RP1210_toolbar is None:
             self.setup_RP1210_menus()
@@ -675,7 +826,13 @@ class CSU_RP1210(QMainWindow):
         progress.setValue(1)
         self.client_ids["J1708"] = self.RP1210.get_client_id("J1708", deviceID, "Auto")
         progress.setValue(2)
-        self.client_ids["J1939"] = self.RP1210.get_client_id("J1939", deviceID, "{}".format(speed))
+        # The virtual bus is inside this process, so a worker process would not see it.
+        use_j1939_worker = self.use_j1939_worker and dll_name != VIRTUAL_BUS_BACKEND
+        if use_j1939_worker:
+            # The worker process connects its own J1939 client.
+            self.client_ids["J1939"] = None
+        else:
+            self.client_ids["J1939"] = self.RP1210.get_client_id("J1939", deviceID, "{}".format(speed))
         progress.setValue(3)
         #self.client_ids["ISO15765"] = self.RP1210.get_client_id("ISO15765", deviceID, "Auto")
         #progress.setValue(3)
@@ -696,12 +853,13 @@ class CSU_RP1210(QMainWindow):
             logger.warning(repr(e))
             logger.warning(f"Failed to create {selection.connections_file}")
             
-        self.rx_queues={"Logger":queue.Queue(10000)}
+        self.close_ring_buffers()
+        self.rx_queues={"Logger":FrameRingBuffer()}
         self.read_message_threads={}
-        self.extra_queues = {"Logger":queue.Queue(10000)}
+        self.extra_queues = {"Logger":FrameRingBuffer()}
         self.isodriver = ISO15765Driver(self, self.extra_queues["Logger"])
       
-        # Set all filters to pass.  This allows messages to be read.
+        # Set the message filters. This allows messages to be read.
         # Constants are defined in an included file
         i = 0
         BUFFER_SIZE = 8192
@@ -717,22 +875,23 @@ class CSU_RP1210(QMainWindow):
                                                        byref(fpchClientCommand), 1)
                 logger.debug('RP1210_Echo_Transmitted_Messages returns {:d}: {}'.format(return_value,self.RP1210.get_error_code(return_value)))
                 
-                #Set all filters to pas
-                return_value = self.RP1210.SendCommand(c_short(RP1210_Set_All_Filters_States_to_Pass), 
-                                                       c_short(nClientID),
-                                                       None, 0)
+                #Set the filters in the adapter
+                self.RP1210.message_filters.add_client(protocol, nClientID)
+                return_value = self.RP1210.message_filters.set_filters(protocol, self.get_filter_set(protocol))
                 if return_value == 0:
-                    logger.debug("RP1210_Set_All_Filters_States_to_Pass for {} is successful.".format(protocol))
+                    logger.debug("Setting the message filters for {} is successful.".format(protocol))
                     #setup a Receive queue. This keeps the GUI responsive and enables messages to be received.
-                    self.rx_queues[protocol] = queue.Queue(10000)
-                    self.tx_queues[protocol] = queue.Queue(10000)
-                    self.extra_queues[protocol] = queue.Queue(10000)
+                    self.rx_queues[protocol] = FrameRingBuffer(overflow_policy=self.overflow_policies.get(protocol, DROP_NEWEST),
+                                                               spill_filename=self.get_spill_filename(protocol))
+                    self.tx_queues[protocol] = FrameRingBuffer()
+                    self.extra_queues[protocol] = FrameRingBuffer()
                     self.read_message_threads[protocol] = RP1210ReadMessageThread(self, 
                                                                                   self.rx_queues[protocol],
                                                                                   self.extra_queues[protocol],
                                                                                   self.RP1210.ReadMessage, 
                                                                                   nClientID,
                                                                                   protocol,"CSU_RP1210")
+                    self.read_message_threads[protocol].software_filter = self.RP1210.message_filters.get_software_filter(protocol)
                     self.read_message_threads[protocol].setDaemon(True) #needed to close the thread when the application closes.
                     self.read_message_threads[protocol].start()
                     logger.debug("Started RP1210ReadMessage Thread.")
@@ -742,7 +901,7 @@ class CSU_RP1210(QMainWindow):
                         self.isodriver = ISO15765Driver(self, self.extra_queues["J1939"])
                     
                 else :
-                    logger.debug('RP1210_Set_All_Filters_States_to_Pass returns {:d}: {}'.format(return_value,self.RP1210.get_error_code(return_value)))
+                    logger.debug('Setting the message filters returns {}: {}'.format(return_value,self.RP1210.get_error_code(return_value)))
 
                 if protocol == "J1939":
                     fpchClientCommand[0] = 0x00 #0 = as fast as possible milliseconds
@@ -760,11 +919,189 @@ class CSU_RP1210(QMainWindow):
                 logger.debug("{} Client not connected for All Filters to pass. No Queue will be set up.".format(protocol))
             i+=1
             progress.setValue(3+i)
+
+        if use_j1939_worker:
+            self.start_j1939_worker(dll_name, deviceID, speed)
+        if self.capture_traffic:
+            self.start_capture()
         
         if self.client_ids["J1939"] is None or self.client_ids["J1708"] is None:
             QMessageBox.information(self,"RP1210 Client Not Connected.","The default RP1210 Device was not found or is unplugged. Please reconnect your Vehicle Diagnostic Adapter (VDA) and select the RP1210 device to use.")
         progress.deleteLater()
 
+    def set_capture_traffic(self, checked):
+        self.capture_traffic = checked
+        if checked:
+            self.start_capture()
+        else:
+            self.stop_capture()
+
+    def set_capture_compression(self):
+        """
+        Ask for the compression of the capture files. It is used for the
+        files started after the change.
+        """
+        codecs = list(CAPTURE_CODECS.keys())
+        codec, ok = QInputDialog.getItem(self, "Capture Compression", "Compress capture blocks with:",
+                                         codecs, codecs.index(self.capture_compression), False)
+        if ok:
+            self.capture_compression = codec
+            logger.info("Capture compression: {}".format(codec))
+
+    def start_capture(self):
+        """
+        Start a capture writer for each read thread that does not have one.
+        """
+        for protocol, thread in self.read_message_threads.items():
+            if protocol in self.capture_writers:
+                continue
+            if not isinstance(thread, RP1210ReadMessageThread):
+                logger.info("{} is read in the worker process and is not captured.".format(protocol))
+                continue
+            capture_queue = make_capture_ring()
+            writer = CaptureWriterThread(capture_queue, thread.filename, protocol, compression=self.capture_compression)
+            writer.setDaemon(True)
+            writer.start()
+            self.capture_writers[protocol] = writer
+            thread.capture_queue = capture_queue
+        if self.capture_writers:
+            self.statusBar().showMessage("Capturing raw traffic for {}".format(", ".join(self.capture_writers)))
+
+    def stop_capture(self):
+        """
+        Stop the capture writers and wait for them to write what they have.
+        The read threads commit the batch they are reading and let go of the
+        capture queue first, so the writers drain every message.
+        """
+        detached = {}
+        for protocol in self.capture_writers:
+            thread = self.read_message_threads.get(protocol)
+            if thread is not None:
+                detached[protocol] = thread.detach_capture()
+        deadline = time.time() + CAPTURE_DETACH_TIMEOUT
+        for protocol, writer in self.capture_writers.items():
+            if protocol in detached and not detached[protocol].wait(max(0, deadline - time.time())):
+                # The thread is waiting for a message, so its last batch
+                # is already committed.
+                logger.debug("The {} read thread is still waiting for a message.".format(protocol))
+            writer.runSignal = False
+        for protocol, writer in self.capture_writers.items():
+            writer.join(5)
+            logger.info("Captured {}: {}".format(protocol, writer.get_stats()))
+        self.capture_writers = {}
+
+    def set_use_j1939_worker(self, checked):
+        self.use_j1939_worker = checked
+        logger.info("Decode J1939 in a worker process: {}".format(checked))
+
+    def start_j1939_worker(self, dll_name, deviceID, speed):
+        """
+        Start the process that reads and decodes J1939. The GUI then renders
+        the shared state of the worker in read_rp1210.
+        """
+        self.rx_queues["J1939"] = FrameRingBuffer(overflow_policy=self.overflow_policies.get("J1939", DROP_NEWEST),
+                                                  spill_filename=self.get_spill_filename("J1939"))
+        self.tx_queues["J1939"] = FrameRingBuffer()
+        self.extra_queues["J1939"] = FrameRingBuffer()
+        worker = J1939WorkerThread(self,
+                                   self.rx_queues["J1939"],
+                                   self.extra_queues["J1939"],
+                                   dll_name, deviceID, speed,
+                                   self.message_filter_settings.get("J1939"),
+                                   os.path.join(module_directory, "J1939db.json"))
+        worker.setDaemon(True)
+        worker.start()
+        worker.connected.wait(10)
+        if worker.nClientID is None:
+            logger.warning("The J1939 worker process did not connect.")
+            worker.runSignal = False
+            return
+        self.j1939_worker = worker
+        self.read_message_threads["J1939"] = worker
+        self.client_ids["J1939"] = worker.nClientID
+        self.isodriver = ISO15765Driver(self, self.extra_queues["J1939"])
+        self.statusBar().showMessage("J1939 connected in a worker process using {}".format(dll_name))
+        logger.debug("Started the J1939 worker process.")
+
+    def get_filter_set(self, protocol):
+        """
+        Return the RP1210FilterSet for a protocol from the filter settings, or
+        None to pass all the messages.
+        """
+        settings = self.message_filter_settings.get(protocol)
+        if settings is None:
+            return None
+        try:
+            return RP1210FilterSet.from_dict(protocol, settings)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(repr(e))
+            logger.warning("The {} message filters are not valid. All messages are passed.".format(protocol))
+            return None
+
+    def set_message_filters(self):
+        """
+        Edit the message filters of a protocol as JSON and send them to the
+        adapter. The client stays connected.
+        """
+        protocols = list(FILTER_BUILDERS.keys())
+        protocol, ok = QInputDialog.getItem(self, "Message Filters", "Protocol:", protocols, 0, False)
+        if not ok:
+            return
+        settings = self.message_filter_settings.get(protocol, {"Mode": BLOCK_LISTED, "Filters": []})
+        text, ok = QInputDialog.getMultiLineText(self, "Message Filters",
+                                                 "{} messages to pass or block. The Mode is {} or {}.".format(protocol, PASS_LISTED, BLOCK_LISTED),
+                                                 json.dumps(settings, indent=2))
+        if not ok:
+            return
+        try:
+            settings = json.loads(text)
+            filter_set = RP1210FilterSet.from_dict(protocol, settings)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            QMessageBox.warning(self, "Message Filters", "The filters were not changed:\n{}".format(e))
+            return
+        self.message_filter_settings[protocol] = filter_set.to_dict()
+        if protocol == "J1939" and self.j1939_worker is not None:
+            self.j1939_worker.set_filters(self.message_filter_settings[protocol])
+            logger.info("Sent the J1939 message filters to the worker process.")
+            return
+        if self.RP1210 is None:
+            return
+        return_value = self.RP1210.message_filters.set_filters(protocol, filter_set)
+        if return_value:
+            logger.warning('Setting the message filters returns {}: {}'.format(return_value,self.RP1210.get_error_code(return_value)))
+        if protocol in self.read_message_threads:
+            self.read_message_threads[protocol].software_filter = self.RP1210.message_filters.get_software_filter(protocol)
+        logger.info("Set the {} message filters to {}".format(protocol, filter_set))
+
+    def get_spill_filename(self, protocol):
+        return os.path.join(get_storage_path(), protocol + "Spill.bin")
+
+    def set_overflow_policy(self):
+        """
+        Ask for the protocol and the overflow policy to use for its receive
+        ring buffer. The change takes effect immediately.
+        """
+        protocols = list(self.overflow_policies.keys())
+        protocol, ok = QInputDialog.getItem(self, "Receive Overflow Policy", "Protocol:", protocols, 0, False)
+        if not ok:
+            return
+        policies = OVERFLOW_POLICIES
+        current = policies.index(self.overflow_policies[protocol])
+        policy, ok = QInputDialog.getItem(self, "Receive Overflow Policy",
+                                          "When the {} receive queue is full:".format(protocol),
+                                          policies, current, False)
+        if not ok:
+            return
+        self.overflow_policies[protocol] = policy
+        if protocol in self.rx_queues:
+            self.rx_queues[protocol].set_overflow_policy(policy, self.get_spill_filename(protocol))
+        logger.info("Set the {} overflow policy to {}".format(protocol, policy))
+
+    def close_ring_buffers(self):
+        for ring_buffers in [self.rx_queues, self.tx_queues, getattr(self, "extra_queues", {})]:
+            for ring_buffer in ring_buffers.values():
+                ring_buffer.close()
+
     def check_connections(self):
         '''
         This function checks the VDA hardware status function to see if it has seen network traffic in the last second.
@@ -794,8 +1131,15 @@ class CSU_RP1210(QMainWindow):
                 self.status_icon[key].setText("<html><img src='{}/icons/icons8_Unavailable_48px.png'><br>Network<br>Unavailable</html>".format(module_directory))
                 self.network_connected[key] = False
 
+            try:
+                ring_stats = self.rx_queues[key].get_stats()
+                self.data_package.setdefault("Receive Queues", {})[key] = ring_stats
+                dropped_count = ring_stats["Dropped Count"]
+            except KeyError:
+                dropped_count = 0
+
             self.message_count_label[key].setText("Message Count:\n{}".format(humanize.intcomma(current_count)))
-            self.message_rate_label[key].setText("Message Rate:\n{} msg/sec".format(count_change))
+            self.message_rate_label[key].setText("Message Rate:\n{} msg/sec\nDropped: {}".format(count_change, humanize.intcomma(dropped_count)))
         
         #Get ECM Clock and Date from J1587 if available
         self.data_package["Time Records"]["Personal Computer"]["Last PC Time"] = time.time()
@@ -883,6 +1227,7 @@ class CSU_RP1210(QMainWindow):
         Close all the RP1210 read message threads and disconnect the client.
         """
         logger.debug("disconnectRP1210")
+        self.stop_capture()
         for protocol, nClientID in self.client_ids.items():
             try:
                 self.read_message_threads[protocol].runSignal = False
@@ -890,6 +1235,9 @@ class CSU_RP1210(QMainWindow):
             except KeyError:
                 pass
             self.client_ids[protocol] = None
+        self.j1939_worker = None
+        if self.RP1210 is not None:
+            self.RP1210.message_filters.remove_clients()
         for n in range(128):
             try:
                 self.RP1210.ClientDisconnect(n)
@@ -934,7 +1282,7 @@ class CSU_RP1210(QMainWindow):
                 priority |= 0x80
             message_bytes = bytes([b0, b1, b2, priority, SA, DA])
             message_bytes += data_bytes
-            self.RP1210.send_message(self.client_ids["J1939"], message_bytes)
+            self.send_j1939_bytes(message_bytes)
     
     def find_j1939_data(self, pgn, sa=0):
         '''
@@ -943,7 +1291,7 @@ class CSU_RP1210(QMainWindow):
         '''
         
         try:
-            return self.J1939.j1939_unique_ids[repr((pgn,sa))]["Bytes"]
+            return self.J1939.j1939_unique_ids[pgn_key(pgn, sa)].data
         except KeyError:
             return False
           
@@ -954,6 +1302,16 @@ class CSU_RP1210(QMainWindow):
             b1 = (PGN_to_request & 0xff00) >> 8
             b2 = (PGN_to_request & 0xff0000) >> 16
             message_bytes = bytes([0x00, 0xEA, 0x00, 0x06, SA, DA, b0, b1, b2])
+            self.send_j1939_bytes(message_bytes)
+
+    def send_j1939_bytes(self, message_bytes):
+        """
+        Send an RP1210 J1939 message on the client in this process or through
+        the J1939 worker process.
+        """
+        if self.j1939_worker is not None:
+            self.j1939_worker.send_message(message_bytes)
+        else:
             self.RP1210.send_message(self.client_ids["J1939"], message_bytes)
 
     def send_j1587_request(self, pid, tool = 0xB6): 
@@ -970,27 +1328,35 @@ class CSU_RP1210(QMainWindow):
     def read_rp1210(self):
         # This function needs to run often to keep the queues from filling
         #try:
+        self.check_replay()
+        if self.j1939_worker is not None:
+            # The worker process has done the counting and decoding.
+            try:
+                self.J1939.fill_j1939_state(self.j1939_worker.read_changes())
+            except:
+                logger.debug(traceback.format_exc())
         for protocol in self.rx_queues.keys():
             if protocol in self.rx_queues:
                 start_time = time.time()
                 while self.rx_queues[protocol].qsize():
-                    #Get a message from the queue. These are raw bytes
-                    #if not protocol == "J1708":
-                    rxmessage = self.rx_queues[protocol].get() 
-                    # logger.debug(rxmessage)                                  
+                    #Get a batch of messages from the ring buffer. These are raw RP1210 messages
                     if protocol == "J1939" or protocol == "Logger" :
-                        try:
-                            self.J1939.fill_j1939_table(rxmessage)
-                        except:
-                            logger.debug(traceback.format_exc())
-                    elif protocol == "J1708":
-                        try:
-                            self.J1587.fill_j1587_table(rxmessage)    
-                            #J1708logger.info("{:0.6f},".format(rxmessage[0]) + ",".join("{:02X}".format(c) for c in rxmessage[1]))
-                        except:
-                            logger.debug(traceback.format_exc())
+                        # The J1939 table copies what it keeps, so it can read the slots directly.
+                        for current_time, vda_time, data in self.rx_queues[protocol].iter_views(self.read_batch_size):
+                            try:
+                                self.J1939.fill_j1939_table({'current_time':current_time,'data':data})
+                            except:
+                                logger.debug(traceback.format_exc())
+                    elif protocol == "J1708" or protocol == "Logger J1708":
+                        for current_time, vda_time, data in self.rx_queues[protocol].get_batch(self.read_batch_size):
+                            try:
+                                self.J1587.fill_j1587_table((current_time, data))
+                            except:
+                                logger.debug(traceback.format_exc())
+                    else:
+                        self.rx_queues[protocol].get_batch(self.read_batch_size)
                     
-                    if time.time() - start_time + .020 > self.update_rate: #give some time to process events
+                    if time.time() - start_time + .020 > self.update_rate / 1000: #give some time to process events
                         logger.debug("Can't keep up with messages.")
                         return
         
@@ -1037,6 +1403,7 @@ class CSU_RP1210(QMainWindow):
 
 if __name__ == '__main__':
 
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     execute = CSU_RP1210()
     sys.exit(app.exec_())
\ No newline at end of file
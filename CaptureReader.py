@@ -0,0 +1,287 @@
+"""
+Random access to RP1210 capture files.
+
+A CaptureReader memory maps a capture file and loads its sparse block index
+from the sidecar file. A query for a time range, a PGN or a source address
+only touches the blocks whose times overlap the range and whose Bloom filter
+may hold the PGN and SA, so looking at 30 seconds of a multi gigabyte
+capture does not read the file from the start.
+
+When the sidecar is missing, or it ends before the capture does because the
+writer was stopped between writing a block and its index entry, the rest of
+the file is scanned once and indexed in memory.
+
+The blocks of a compressed capture are decompressed when they are read, by a
+pool of threads when there are several of them. A block that fails its CRC
+check is skipped and counted in bad_blocks.
+"""
+import bisect
+import concurrent.futures
+import mmap
+import os
+
+from RP1210Capture import *
+from RingBuffer import FRAME_RECORD
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Bytes of records in a block of the index made by scanning a file
+SCAN_BLOCK_SIZE = 1 << 20
+
+
+class CaptureIndexEntry():
+    """
+    A block of a capture file: the PC times of its first and last message,
+    where its records are and a Bloom filter of what is in it.
+    """
+    __slots__ = ("first_time", "last_time", "offset", "length", "count", "bloom")
+
+    def __init__(self, first_time, last_time, offset, length, count, bloom):
+        self.first_time = first_time
+        self.last_time = last_time
+        self.offset = offset
+        self.length = length
+        self.count = count
+        self.bloom = bloom
+
+    def __repr__(self):
+        return "<CaptureIndexEntry {:.3f}-{:.3f} at {} with {} messages>".format(
+            self.first_time, self.last_time, self.offset, self.count)
+
+
+class CaptureReader():
+    """
+    Serves the messages of a capture file by time range, PGN and SA.
+    Messages are (current_time, vda_time, data) where data is a memoryview of
+    the mapped file, valid until the reader is closed, or bytes for a
+    compressed capture.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.capture_file = open(filename, 'rb')
+        self.protocol, self.start_time, self.codec = read_capture_header(self.capture_file)
+        self.bad_blocks = 0
+        self.map = mmap.mmap(self.capture_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.index = self.load_index()
+        self.scan_index(self.index[-1].offset + self.index[-1].length if self.index else CAPTURE_HEADER.size)
+        # The PC time can step backwards, so search the running maximum.
+        self.last_times = []
+        last_time = float("-inf")
+        for entry in self.index:
+            last_time = max(last_time, entry.last_time)
+            self.last_times.append(last_time)
+
+    def load_index(self):
+        index = []
+        index_filename = get_index_filename(self.filename)
+        try:
+            with open(index_filename, 'rb') as index_file:
+                magic, version = INDEX_HEADER.unpack(index_file.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or version > INDEX_VERSION:
+                    raise ValueError("{} is not a capture index file.".format(index_filename))
+                contents = index_file.read()
+        except (OSError, ValueError, struct.error) as e:
+            logger.info("Indexing {} without its sidecar: {}".format(self.filename, repr(e)))
+            return index
+        for offset in range(0, len(contents) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+            first_time, last_time, block_offset, length, count, bloom = INDEX_ENTRY.unpack_from(contents, offset)
+            if block_offset + length > len(self.map):
+                break
+            index.append(CaptureIndexEntry(first_time, last_time, block_offset, length, count,
+                                           int.from_bytes(bloom, 'little')))
+        return index
+
+    def scan_index(self, offset):
+        """
+        Index the records from offset to the end of the file in blocks of
+        about SCAN_BLOCK_SIZE bytes.
+        """
+        if self.codec:
+            self.scan_compressed_index(offset)
+            return
+        j1939 = self.protocol == "J1939"
+        end = len(self.map)
+        block_offset = offset
+        first_time = last_time = None
+        count = 0
+        bloom = 0
+        bloom_masks = {}
+        while offset + FRAME_RECORD.size <= end:
+            length, current_time, vda_time = FRAME_RECORD.unpack_from(self.map, offset)
+            start = offset + FRAME_RECORD.size
+            if start + length > end:
+                break
+            if first_time is None:
+                first_time = current_time
+            last_time = current_time
+            count += 1
+            if j1939 and length > 9:
+                key = (self.map[start + 5] | (self.map[start + 6] << 8) | (self.map[start + 7] << 16)) << 8 | self.map[start + 9]
+                mask = bloom_masks.get(key)
+                if mask is None:
+                    mask = j1939_bloom_mask(key >> 8, key & 0xFF)
+                    bloom_masks[key] = mask
+                bloom |= mask
+            offset = start + length
+            if offset - block_offset >= SCAN_BLOCK_SIZE:
+                self.add_scanned_block(first_time, last_time, block_offset, offset, count, bloom, j1939)
+                block_offset = offset
+                first_time = None
+                count = 0
+                bloom = 0
+        if count:
+            self.add_scanned_block(first_time, last_time, block_offset, offset, count, bloom, j1939)
+
+    def scan_compressed_index(self, offset):
+        """
+        Index the compressed blocks from offset to the end of the file from
+        their headers. Without decompressing them there is no Bloom filter,
+        so these blocks match any PGN and SA.
+        """
+        end = len(self.map)
+        while offset + BLOCK_HEADER.size <= end:
+            magic, codec, flags, count, raw_length, compressed_length, crc, first_time, last_time = \
+                BLOCK_HEADER.unpack_from(self.map, offset)
+            length = BLOCK_HEADER.size + compressed_length
+            if magic != BLOCK_MAGIC or offset + length > end:
+                break
+            self.index.append(CaptureIndexEntry(first_time, last_time, offset, length, count, (1 << BLOOM_BITS) - 1))
+            offset += length
+
+    def add_scanned_block(self, first_time, last_time, block_offset, offset, count, bloom, j1939):
+        if not j1939:
+            bloom = (1 << BLOOM_BITS) - 1
+        self.index.append(CaptureIndexEntry(first_time, last_time, block_offset, offset - block_offset, count, bloom))
+
+    def get_time_range(self):
+        """
+        Return the PC times of the first and the last message, or None.
+        """
+        if not self.index:
+            return None
+        return (min(entry.first_time for entry in self.index), self.last_times[-1])
+
+    def __len__(self):
+        return sum(entry.count for entry in self.index)
+
+    def find_blocks(self, start_time=None, end_time=None, pgn=None, sa=None):
+        """
+        Return the index entries of the blocks that may have messages in the
+        time range with the PGN and SA. None matches anything.
+        """
+        first = 0 if start_time is None else bisect.bisect_left(self.last_times, start_time)
+        mask = query_bloom_mask(pgn, sa)
+        blocks = []
+        for entry in self.index[first:]:
+            if end_time is not None and entry.first_time > end_time:
+                break
+            if entry.bloom & mask == mask:
+                blocks.append(entry)
+        return blocks
+
+    def iter_block(self, entry):
+        """
+        Yield the (current_time, vda_time, data) of each message in a block.
+        """
+        if self.codec:
+            yield from self.decode_block(entry)
+            return
+        offset = entry.offset
+        end = entry.offset + entry.length
+        view = self.view
+        while offset < end:
+            length, current_time, vda_time = FRAME_RECORD.unpack_from(self.map, offset)
+            offset += FRAME_RECORD.size
+            yield (current_time, vda_time, view[offset:offset + length])
+            offset += length
+
+    def decode_block(self, entry):
+        """
+        Return the messages of a compressed block, or an empty list if the
+        block is damaged.
+        """
+        try:
+            return decode_block(self.map, entry.offset, self.protocol)[1]
+        except ValueError as e:
+            logger.warning("{}: {}".format(self.filename, e))
+            self.bad_blocks += 1
+            return []
+
+    def iter_blocks(self, entries, workers=1):
+        """
+        Yield the messages of the blocks in order. The blocks of a compressed
+        capture are decompressed by a pool of threads, since zlib and lzma let
+        go of the GIL.
+        """
+        if not self.codec or workers < 2 or len(entries) < 2:
+            for entry in entries:
+                yield from self.iter_block(entry)
+            return
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for messages in executor.map(self.decode_block, entries):
+                yield from messages
+
+    def read(self, start_time=None, end_time=None, pgn=None, sa=None, workers=1):
+        """
+        Yield the messages in the time range with the PGN and SA in the
+        order they were captured. None matches anything.
+        """
+        check_time = start_time is not None or end_time is not None
+        if start_time is None:
+            start_time = float("-inf")
+        if end_time is None:
+            end_time = float("inf")
+        check_j1939 = self.protocol == "J1939" and (pgn is not None or sa is not None)
+        for message in self.iter_blocks(self.find_blocks(start_time, end_time, pgn, sa), workers):
+            if check_time and not start_time <= message[0] <= end_time:
+                continue
+            if check_j1939:
+                data = message[2]
+                if len(data) < 10:
+                    continue
+                if pgn is not None and (data[5] | (data[6] << 8) | (data[7] << 16)) != pgn:
+                    continue
+                if sa is not None and data[9] != sa:
+                    continue
+            yield message
+
+    def read_around(self, center_time, seconds=30, pgn=None, sa=None):
+        """
+        Yield the messages in the seconds around a PC time, like the time of
+        a DTC.
+        """
+        return self.read(center_time - seconds / 2, center_time + seconds / 2, pgn, sa)
+
+    def close(self):
+        try:
+            self.view.release()
+            self.map.close()
+        except BufferError:
+            # A message view is still in use. The map is closed with the file
+            # when the last view is gone.
+            logger.debug("The memory map of {} is still in use.".format(self.filename))
+        self.capture_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    for filename in sys.argv[1:]:
+        start = time.time()
+        with CaptureReader(filename) as reader:
+            print("{}: {} {} messages in {} blocks, indexed in {:.3f} s".format(
+                filename, reader.protocol, len(reader), len(reader.index), time.time() - start))
+            time_range = reader.get_time_range()
+            if time_range is not None:
+                center = (time_range[0] + time_range[1]) / 2
+                start = time.time()
+                count = sum(1 for message in reader.read_around(center, 30))
+                print("{} messages in the 30 s around the middle, read in {:.3f} s".format(count, time.time() - start))
@@ -0,0 +1,164 @@
+"""
+Replaying captured traffic into the receive ring buffers.
+
+A ReplayThread pushes the messages of a capture into a FrameRingBuffer the
+way a read thread does, so the GUI decodes them like live traffic. The
+supported files are the captures of RP1210Capture, compressed or not, and
+the data files of the CAN Logger 2.
+
+The messages are paced by their VDA time stamps: at the speed they were
+recorded, a number of times faster, or as fast as the consumer takes them.
+Messages are never dropped; when the ring is full the replay waits, so as
+fast as possible measures how many messages per second the consumer decodes.
+"""
+import os
+import threading
+import time
+
+from RP1210Capture import CAPTURE_MAGIC, read_capture_header
+from CaptureReader import CaptureReader
+from CANLogger2 import iter_logger2, LOGGER2_BLOCK_SIZE
+from RingBuffer import FrameRingBuffer
+
+import logging
+logger = logging.getLogger(__name__)
+
+AS_FAST_AS_POSSIBLE = 0
+REAL_TIME = 1.0
+REPLAY_SPEEDS = {"Real Time": REAL_TIME,
+                 "2x": 2.0,
+                 "5x": 5.0,
+                 "10x": 10.0,
+                 "As Fast As Possible": AS_FAST_AS_POSSIBLE}
+# Longer gaps between messages, like the logger being off, are cut to this
+# many seconds.
+MAX_REPLAY_GAP = 5.0
+# Messages written before they are committed to the consumer
+REPLAY_BATCH_SIZE = 256
+
+
+def iter_native_capture(filename):
+    with CaptureReader(filename) as reader:
+        yield from reader.read()
+
+def open_replay_file(filename):
+    """
+    Return the protocol of a capture file and an iterator of its messages as
+    (current_time, vda_time, data).
+    """
+    with open(filename, 'rb') as capture_file:
+        magic = capture_file.read(len(CAPTURE_MAGIC))
+        if magic == CAPTURE_MAGIC:
+            capture_file.seek(0)
+            protocol = read_capture_header(capture_file)[0]
+            return protocol, iter_native_capture(filename)
+    if os.path.getsize(filename) % LOGGER2_BLOCK_SIZE == 0:
+        return "J1939", iter_logger2(filename)
+    raise ValueError("{} is not a capture or a CAN Logger 2 file.".format(filename))
+
+
+class ReplayThread(threading.Thread):
+    """
+    Writes the (current_time, vda_time, data) messages of an iterable into
+    rx_queue. speed is how many times faster than recorded to replay, or
+    AS_FAST_AS_POSSIBLE.
+    """
+    def __init__(self, rx_queue, messages, speed=REAL_TIME, batch_size=REPLAY_BATCH_SIZE):
+        threading.Thread.__init__(self)
+        self.rx_queue = rx_queue
+        self.messages = messages
+        self.speed = speed
+        self.batch_size = batch_size
+        self.runSignal = True
+        self.message_count = 0
+        self.wait_count = 0
+        self.start_time = None
+        self.duration = 0
+        self.messages_per_second = 0
+        self.error = None
+
+    def run(self):
+        rx_queue = self.rx_queue
+        speed = self.speed
+        pending = 0
+        replay_time = 0 # seconds of recorded traffic replayed
+        last_vda_time = None
+        self.start_time = time.perf_counter()
+        try:
+            for current_time, vda_time, data in self.messages:
+                if not self.runSignal:
+                    break
+                if speed:
+                    if last_vda_time is not None:
+                        # The VDA time is in microseconds and wraps around.
+                        step = (vda_time - last_vda_time) & 0xFFFFFFFF
+                        if step < 0x80000000:
+                            replay_time += min(step / 1e6, MAX_REPLAY_GAP)
+                    last_vda_time = vda_time
+                    delay = self.start_time + replay_time / speed - time.perf_counter()
+                    if delay > 0:
+                        rx_queue.commit()
+                        pending = 0
+                        while delay > 0 and self.runSignal:
+                            time.sleep(min(delay, 0.1))
+                            delay = self.start_time + replay_time / speed - time.perf_counter()
+                while rx_queue.free_slots() < 1 and self.runSignal:
+                    rx_queue.commit()
+                    pending = 0
+                    self.wait_count += 1
+                    time.sleep(0.001)
+                if not self.runSignal:
+                    # Stopped while pacing or waiting for free slots
+                    break
+                rx_queue.write(current_time, vda_time, data)
+                self.message_count += 1
+                pending += 1
+                if pending >= self.batch_size:
+                    rx_queue.commit()
+                    pending = 0
+        except (OSError, ValueError) as e:
+            self.error = e
+            logger.warning(repr(e))
+        rx_queue.commit()
+        self.duration = time.perf_counter() - self.start_time
+        if self.duration > 0:
+            self.messages_per_second = self.message_count / self.duration
+        logger.info("Replayed {} messages in {:.3f} s ({:.0f} messages/s)".format(
+            self.message_count, self.duration, self.messages_per_second))
+
+
+def benchmark(filename, speed=AS_FAST_AS_POSSIBLE):
+    """
+    Replay a capture into a ring buffer and decode it like the J1939 worker
+    process does. Prints the messages per second.
+    """
+    from RP1210Functions import parse_j1939_header, J1939_HEADER_LENGTH
+    from J1939Database import load_j1939db
+    from J1939Worker import SharedJ1939State, J1939StateDecoder
+    protocol, messages = open_replay_file(filename)
+    rx_queue = FrameRingBuffer()
+    replay = ReplayThread(rx_queue, messages, speed)
+    replay.daemon = True
+    state = None
+    if protocol == "J1939":
+        state = SharedJ1939State()
+        decoder = J1939StateDecoder(load_j1939db("J1939db.json"), state)
+    replay.start()
+    while replay.is_alive() or rx_queue.qsize():
+        for current_time, vda_time, data in rx_queue.iter_views(1000):
+            if state is not None:
+                vda_time, echo, pgn, priority, sa, da = parse_j1939_header(data)
+                decoder.process(current_time, vda_time, pgn, sa, data[J1939_HEADER_LENGTH:])
+        if state is not None:
+            decoder.publish(time.time())
+        time.sleep(0.001)
+    print("{}: {} messages".format(filename, replay.message_count))
+    print("Replayed: {:10.0f} messages/s".format(replay.messages_per_second))
+    print("Waited:   {:10d} times for the decoder".format(replay.wait_count))
+    if state is not None:
+        state.close(unlink=True)
+
+if __name__ == '__main__':
+    import sys
+    for filename in sys.argv[1:]:
+        benchmark(filename)
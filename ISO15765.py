@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-from PyQt5.QtCore import QCoreApplication
 import time
 import sys
 import struct
@@ -138,14 +137,19 @@ class ISO15765Driver():
     
     def look_up_source(self, sa):
         try:
-            return  self.root.j1939db["J1939SATabledb"]["{}".format(sa)]
+            return  self.root.j1939db["J1939SATabledb"][sa]
         except KeyError:
             return "Unknown"
 
     def read_message(self, display=False):
-        # The queue is fed by RP1210ReadMessageThread 
+        # The ring buffer is fed by RP1210ReadMessageThread with RP1210 J1939 messages
         while self.read_queue.qsize():
-            (pgn, priority, src_addr, dst_addr, message_data) = self.read_queue.get()
+            (current_time, vda_time, rx_buffer) = self.read_queue.get()
+            pgn = rx_buffer[5] + (rx_buffer[6] << 8) + (rx_buffer[7] << 16)
+            priority = rx_buffer[8]
+            src_addr = rx_buffer[9]
+            dst_addr = rx_buffer[10]
+            message_data = rx_buffer[11:]
             #if display:
             #    logger.debug("Received ISO message: {}".format((pgn, priority, src_addr, dst_addr, message_data)))
             if is_first_frame(message_data):
@@ -288,6 +292,8 @@ class ISO15765Driver():
         return self.get_iso_param(message_bytes, da=0, timeout=timeout, retries=3)
     
     def get_iso_param(self, message_bytes, da=0, timeout=None, retries=3):
+        # Only requests need the event loop, so decoding works without Qt.
+        from PyQt5.QtCore import QCoreApplication
         self.send_message(message_bytes, dst=da)
         done = False
         returned_data = None
@@ -0,0 +1,813 @@
+"""
+Decoding of SAE J1587 messages from a J1708 network.
+
+A J1587 message is a Message Identifier (MID) followed by Parameter
+Identifiers (PIDs) and their data. These functions turn the parameters into
+display values with the J1587 database, so the J1587 tab and the headless
+batch decoder share them.
+"""
+import calendar
+import math
+import struct
+import time
+import traceback
+
+import logging
+logger = logging.getLogger(__name__)
+
+J1587_DIAGNOSTICS_PID = 194
+J1587_MULTI_SECTION_PID = 0xC0
+# Parameters that are not decoded
+J1587_PIDS_TO_NOT_DECODE = [197, 198, 254]
+
+
+def split_j1587_message(msg):
+    """
+    Return the MID of a J1587 message and a list of its (pid, data_bytes).
+    """
+    buffer_length = len(msg)
+    mid = msg[0]
+    buffer_index = 1
+    pid_list = []
+    # Generate a list of tuples where each tuple is a PID, Value
+    while buffer_index < buffer_length:
+        try:
+            pid = msg[buffer_index]
+            if pid == 255:
+                buffer_index +=1
+                pid = msg[buffer_index] + 256
+            buffer_index += 1
+            if pid < 128 or pid % 256 < 128:
+                pid_list.append((pid,bytes([msg[buffer_index]])))
+                buffer_index += 1
+            elif pid < 192 or pid % 256 < 192:
+                pid_list.append((pid,msg[buffer_index:buffer_index + 2]))
+                buffer_index += 2
+            else:
+                n = msg[buffer_index]
+                pid_list.append((pid,msg[buffer_index:buffer_index + n + 1]))
+                buffer_index = buffer_index + n + 1
+        except IndexError:
+            break
+    return mid, pid_list
+
+def add_multi_section_message(multi_section_messages, msg):
+    """
+    Add a section of a multi section message (PID 192) to the partial
+    messages kept in multi_section_messages. Returns the whole message when
+    all of its sections are in, otherwise None.
+    """
+    (mid, pid, last_section, this_section, data) = J1587MultiSectionMessage.parse_message(msg)
+    if mid not in multi_section_messages.keys():
+        # Create the dictionary entry of a message object if it doesn't exist using the PID as a key.
+        multi_section_messages[mid] = {pid: J1587MultiSectionMessage(mid, pid, last_section)}
+    elif pid not in multi_section_messages[mid].keys():
+        multi_section_messages[mid][pid] = J1587MultiSectionMessage(mid, pid, last_section)
+    multi_section_messages[mid][pid].add_section(this_section, data)
+    # Would they send a multi-section message as just one message?
+    # Probably not, but it wouldn't surprise me
+    if multi_section_messages[mid][pid].all_sections_recvd():
+        completed_message = multi_section_messages[mid][pid].get_message()
+        del(multi_section_messages[mid][pid])
+        return completed_message
+    return None
+
+def get_mid_name(j1587db, mid):
+    try:
+        return j1587db["MID"]["{}".format(mid)]
+    except KeyError:
+        return "Unknown"
+
+def get_pid_name(j1587db, pid):
+    try:
+        return j1587db["PID"]["{}".format(pid)]["Name"]
+    except:
+        return "Not Provided"
+
+def get_j1587_bit_meaning(pid, value):
+    meaning = ""
+    if pid in j1587BitDecodingDict.keys():
+        for element in j1587BitDecodingDict[pid]:
+            meaning += element['string']
+            masked_bit = (value & element['mask']) >> element['shift']
+            meaning += element['values'][masked_bit]
+            meaning += '\n'
+    else:
+        meaning = "Not Decoded"
+    return meaning.strip()#[:-1] #Strip the last newline off the string
+
+def get_j1587_value(j1587db, mid, pid, data, source_records):
+    """
+    Return the (value, units, meaning) of a parameter as display strings.
+    meaning is None for parameters without one. The ECM clock and the
+    identification parameters are also stored in source_records, which holds
+    the "Time Records" and "Component Information" dictionaries of the MID.
+    """
+    meaning = None
+    try:
+        units = j1587db["PID"]["{}".format(pid)]["Unit"]
+
+    except KeyError:
+        value = repr(data)
+        units = ""
+        return ("{}".format(value), units, meaning)
+    else:
+        data_length = j1587db["PID"]["{}".format(pid)]["DataLength"]
+        data_type = j1587db["PID"]["{}".format(pid)]["DataType"]
+        bit_resolution = j1587db["PID"]["{}".format(pid)]["BitResolution"]
+        time_records = source_records["Time Records"]
+
+        if data_type == "Binary Bit-Mapped" and pid != 194:
+            if len(data) == 1:
+                value = struct.unpack("B",data)[0]
+                meaning = get_j1587_bit_meaning(pid,value)
+            else:
+                value = data
+        elif data_type == "Unsigned Short Integer" and data_length == 1 and len(data) == 1:
+            value = "{:0.3f}".format(struct.unpack("B",data)[0] * bit_resolution)
+        elif data_type == "Unsigned Integer" and data_length == 2 and len(data) == 2:
+            value = "{:0.3f}".format(struct.unpack("<H",data)[0] * bit_resolution)
+        elif data_type == "Signed Integer" and data_length == 2 and len(data) == 2:
+            value = "{:0.3f}".format(struct.unpack("<h",data)[0] * bit_resolution)
+        elif data_type == "Signed Integer" and data_length == 2 and len(data) == 3:
+            value = "{:0.3f}".format(struct.unpack("<h",data[1:3])[0] * bit_resolution)
+        elif data_type == "Unsigned Long Integer" and data_length == 4 and len(data) == 4:
+            value = "{:0.3f}".format(struct.unpack("<L",data)[0] * bit_resolution)
+        elif data_type == "Unsigned Long Integer" and data_length == 4 and len(data) == 5:
+            value = "{:0.3f}".format(struct.unpack("<L",data[1:5])[0] * bit_resolution)
+        elif data_type == "Signed Long Integer" and data_length == 4 and len(data) == 5:
+            value = "{:0.3f}".format(struct.unpack("<l",data[1:5])[0] * bit_resolution)
+        elif pid == 251 and data[0] == 3: #Clock
+            seconds = data[1]
+            minutes = data[2]
+            hours = data[3]
+            value = "{:02d}:{:02d}:{:02d}".format(hours, minutes, math.ceil(seconds/4))
+            units = "HH:MM:SS"
+            time_records["Last ECM Clock"] = value
+            try:
+                time_string = time_records["Last ECM Date"] + "T" + time_records["Last ECM Clock"]
+            except KeyError:
+                logger.debug("We don't have a date code, so we can't make time.")
+            else:
+                try:
+                    time_records["Last ECM Time"] = calendar.timegm(time.strptime(time_string,"%m/%d/%YT%H:%M:%S"))
+                    time_records["PC Time minus ECM Time"] = time.time() - time_records["Last ECM Time"]
+                except (TypeError, ValueError):
+                    logger.debug(traceback.format_exc())
+                    time_records["Last ECM Time"] = None
+                    time_records["PC Time minus ECM Time"] = None
+
+                time_records["PC Time at Last ECM Time"] = time.time()
+        elif pid == 252 and data[0] == 3: #Date
+            day = data[1]
+            month = data[2]
+            year = data[3] + 1985
+            value = "{:02d}/{:02d}/{:04d}".format(month,math.ceil(day/4),year)
+            units = "Month/Day/Year"
+            time_records["Last ECM Date"] = value
+        elif pid == 243: #Component Identification
+            value = data.decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
+            component_id_list = value.split("*")
+            try:
+                make = component_id_list[0]
+            except IndexError:
+                make = None
+            try:
+                model = component_id_list[1]
+            except IndexError:
+                model = None
+            try:
+                serial = component_id_list[2]
+            except IndexError:
+                serial = None
+            try:
+                unit = component_id_list[3]
+            except IndexError:
+                unit = None
+            source_records["Component Information"].update({"Make":make, "Model":model, "Serial":serial, "Unit":unit})
+        elif pid == 237: #VIN
+            value = data[1:].decode("ascii",'ignore').replace(b'\x00'.decode('ascii','ignore'),'')
+            logger.info("Found J1587 Vehicle Identification from MID {}: ".format(mid) + value)
+            source_records["Component Information"].update({"VIN": value})
+
+        elif pid == 234: # Software Identification
+            value = data[1:].decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
+            logger.info("Found J1587 Software Identification from MID {}: ".format(mid) + value)
+            source_records["Component Information"].update({"Software": value})
+
+        elif data_type == "Alphanumeric":
+            value = data.decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
+
+        elif pid == 194:
+            meaning, count = get_j1587_diagnostics(j1587db, mid, data)
+            value = "{:d}".format(count)
+            units = "Count"
+        else:
+            value = ""
+
+    return ("{}".format(value), units, meaning)
+
+def iter_j1587_diagnostics(j1587db, mid, data):
+    """
+    Yield the diagnostic codes of PID 194 from the SAE J1587 standard as
+    (active, sid, is_sid_code, sid_string, fmi, fmi_text, occurance_count).
+    occurance_count is None when it is not included.
+    """
+    byte_count = data[0]
+    byte_index = 1
+    while byte_index < byte_count + 1:
+        try:
+            sid = data[byte_index]
+            byte_index += 1
+            diag_code_char = data[byte_index]
+            byte_index += 1
+        except IndexError:
+            return
+        occurance_count_included = (diag_code_char & 0x80) == 0x80
+        fault_is_inactive = (diag_code_char & 0x40) == 0x40
+        standard_code = (diag_code_char & 0x20) == 0x20
+        is_sid_code = (diag_code_char & 0x10) == 0x10
+
+        if not standard_code:
+            sid += 256
+
+        try:
+            if is_sid_code:
+                if "{}".format(mid) in j1587db["SID"].keys():
+                    sid_string = j1587db["SID"]["{}".format(mid)]["{}".format(sid)]
+                else:
+                    sid_string = j1587db["SID"]["-1"]["{}".format(sid)]
+            else:
+                sid_string = j1587db["PIDNames"]["{}".format(sid)]
+        except KeyError:
+            sid_string = "Unknown System ID"
+
+        fmi = diag_code_char & 0x0F
+        fmi_text = j1587db["FMI"]["{}".format(fmi)]
+
+        occurance_count = None
+        if occurance_count_included:
+            try:
+                occurance_count = data[byte_index]
+            except IndexError:
+                # The count is cut off, so this is the last code.
+                yield (not fault_is_inactive, sid, is_sid_code, sid_string, fmi, fmi_text, None)
+                return
+            byte_index += 1
+        yield (not fault_is_inactive, sid, is_sid_code, sid_string, fmi, fmi_text, occurance_count)
+
+def get_j1587_diagnostics(j1587db, mid, data):
+    ''' Interpret PID 194 from SAE J1587 standard. Returns the message and the number of codes.'''
+    message = ""
+    count = 0
+    for active, sid, is_sid_code, sid_string, fmi, fmi_text, occurance_count in iter_j1587_diagnostics(j1587db, mid, data):
+        message += "A - " if active else "I - "
+        message += sid_string
+        message += ": "
+        message += fmi_text
+        if occurance_count is not None:
+            message += ". Count: {}\n".format(occurance_count)
+        else:
+            message += "\n"
+        count += 1
+    return message.strip(), count
+
+
+class J1587MultiSectionMessage():
+
+    def __init__(self, mid, pid, num_sections):
+        self.mid = mid
+        self.pid = pid
+        self.sections = [None] * (num_sections + 1)
+
+    def add_section(self, section_num, data):
+        # If not the final section, don't add the checksum to data.
+        if section_num < len(self.sections):
+            self.sections[section_num] = data[:-1]
+        else:
+            self.sections[section_num] = data
+
+    def all_sections_recvd(self):
+        return not None in self.sections
+
+    def get_message(self):
+        data = self.get_data()
+        if data is None:
+            return None
+        # Don't need to consider section 2/3 PIDs because these messages don't
+        # support them
+        return bytes([self.mid, self.pid]) + data
+
+    def get_data(self):
+        if not self.all_sections_recvd():
+            return None
+        else:
+            return b''.join(self.sections)
+
+    @staticmethod
+    def parse_message(buf):
+        mid = buf[0]
+        byte_count = buf[2]
+        data_portion = buf[3:3 + byte_count]
+        pid = data_portion[0]
+        last_section = (data_portion[1] & 0xF0) >> 4
+        this_section = data_portion[1] & 0x0F
+        if this_section == 0:
+            data = data_portion[3:]
+        else:
+            data = data_portion[2:]
+
+        return (mid, pid, last_section, this_section, data)
+
+
+activeInactive = {
+    0: 'Inactive',
+    1: 'Active'
+}
+onOff = {
+    0: 'Off',
+    1: 'On'
+}
+onOffErrorNa = {
+    0: 'Off / Inactive',
+    1: 'On / Active',
+    2: 'Error Condition',
+    3: 'Not Avaliable'
+}
+
+j1587BitDecodingDict = {
+    40: [{
+        'mask': 0x03,
+        'shift': 4,
+        'string': 'Engine Retarder Switch - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0x3C,
+        'shift': 4,
+        'string': 'Engine Retarder Level Switch - ',
+        'values': {0: "0 Cylinders",
+                   1: "1 Cylinder",
+                   2: "2 Cylinder",
+                   3: "3 Cylinder",
+                   4: "4 Cylinder",
+                   5: "5 Cylinder",
+                   6: "6 Cylinder",
+                   7: "7 Cylinder",
+                   8: "8 Cylinder",
+                   9: "Reserved",
+                   10: "Reserved",
+                   11: "Reserved",
+                   12: "Reserved",
+                   13: "Reserved",
+                   14: "Error",
+                   15: "Not Avaliable"}
+        },
+    ],
+    44: [{
+        'mask': 0x30,
+        'shift': 4,
+        'string': 'Protect Lamp Status - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0xc,
+        'shift': 2,
+        'string': 'Amber Lamp Status - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0x3,
+        'shift': 0,
+        'string': 'Red Lamp Status - ',
+        'values': onOffErrorNa
+        }
+    ],
+    49: [{
+        'mask': 0xC0,
+        'shift': 6,
+        'string': 'ABS off-road function switch - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0x30,
+        'shift': 4,
+        'string': 'ABS Retarder Control - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0xc,
+        'shift': 2,
+        'string': 'ABS brake control - ',
+        'values': onOffErrorNa
+        },
+        {
+        'mask': 0x3,
+        'shift': 0,
+        'string': 'ABS warning lamp - ',
+        'values': onOffErrorNa
+        }
+    ],
+    70: [{
+        'mask': 0x80,
+        'shift': 7,
+        'string': '',
+        'values': activeInactive
+        }
+    ],
+    71: [{
+        'mask': 0x80,
+        'shift': 7,
+        'string': 'Idle shutdown timer status - ',
+        'values': activeInactive
+        },
+        {
+        'mask': 0x8,
+        'shift': 3,
+        'string': 'Idle shutdown timer function - ',
+        'values': {
+            0: 'Disabled',
+            1: 'Enabled'
+        }},
+        {
+        'mask': 0x4,
+        'shift': 2,
+        'string': 'Idle shutdown timer override - ',
+        'values': activeInactive
+        },
+        {
+        'mask': 0x2,
+        'shift': 1,
+        'string': 'Engine has shutdown by idle timer - ',
+        'values': {
+            0: 'No',
+            1: 'Yes'
+        }},
+        {
+        'mask': 0x1,
+        'shift': 0,
+        'string': 'Driver Alert Mode - ',
+        'values': activeInactive
+        }
+    ],
+    89: [
+        {
+            'mask': 0x80,
+            'shift': 7,
+            'string': 'PTO Mode - ',
+            'values': activeInactive
+        },
+        {
+            'mask': 0x40,
+            'shift': 6,
+            'string': 'Clutch Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x20,
+            'shift': 5,
+            'string': 'Brake Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x10,
+            'shift': 4,
+            'string': 'Accel Switch - ',
+            'values':
+            onOff
+        },
+        {
+            'mask': 0x8,
+            'shift': 3,
+            'string': 'Resume Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x4,
+            'shift': 2,
+            'string': 'Coast Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x2,
+            'shift': 1,
+            'string': 'Set Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x1,
+            'shift': 0,
+            'string': 'PTO Control Switch - ',
+            'values': onOff
+        }
+    ],
+    85: [
+        {
+            'mask': 0x1,
+            'shift': 0,
+            'string': 'Cruise Control Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x2,
+            'shift': 1,
+            'string': 'Set Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x4,
+            'shift': 2,
+            'string': 'Coast Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x8,
+            'shift': 3,
+            'string': 'Resume Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x10,
+            'shift': 4,
+            'string': 'Accel Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x20,
+            'shift': 5,
+            'string': 'Brake Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x40,
+            'shift': 6,
+            'string': 'Clutch Switch - ',
+            'values': onOff
+        },
+        {
+            'mask': 0x80,
+            'shift': 7,
+            'string': 'Cruise Mode - ',
+            'values': {
+                0: 'Not Active',
+                1: 'Active'
+            }},
+    ],
+    83: [
+        {
+            'mask': 0x80,
+            'shift': 7,
+            'string': 'Road Speed Limiter Currently ',
+            'values': {
+                0: 'Not Active',
+                1: 'Active'
+            }}
+    ],
+    97: [
+        {
+            'mask': 0x80,
+            'shift': 7,
+            'string': 'Water in Fuel Tndicator - ',
+            'values': {
+                0: 'No',
+                1: 'Yes'
+            }}
+    ],
+    121: [
+        {
+            'mask': 0x80,
+            'shift': 7,
+            'string': 'Engine Retarder -  ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x01,
+            'shift': 2,
+            'string': '2 Cylinder - ',
+            'values': { 0: "Not Active",
+                        1: "Active" }
+        },
+        {
+            'mask': 0x02,
+            'shift': 2,
+            'string': '3 Cylinder - ',
+            'values': { 0: "Not Active",
+                        1: "Active" }
+        },
+        {
+            'mask': 0x04,
+            'shift': 2,
+            'string': '4 Cylinder - ',
+            'values': { 0: "Not Active",
+                        1: "Active" }
+        },
+        {
+            'mask': 0x08,
+            'shift': 2,
+            'string': '6 Cylinder - ',
+            'values': { 0: "Not Active",
+                        1: "Active" }
+        },
+        {
+            'mask': 0x10,
+            'shift': 2,
+            'string': '8 Cylinder - ',
+            'values': { 0: "Not Active",
+                        1: "Active" }
+        }
+    ],
+    134: [
+        {
+            'mask': 0x3,
+            'shift': 0,
+            'string': 'Wheel sensor ABS axle: 4 right - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc,
+            'shift': 2,
+            'string': 'Wheel sensor ABS axle: 3 right - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x30,
+            'shift': 4,
+            'string': 'Wheel sensor ABS axle: 2 right - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc0,
+            'shift': 6,
+            'string': 'Wheel sensor ABS axle: 1 right - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x300,
+            'shift': 8,
+            'string': 'Wheel sensor ABS axle: 4 left - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc00,
+            'shift': 10,
+            'string': 'Wheel sensor ABS axle: 3 left - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x3000,
+            'shift': 12,
+            'string': 'Wheel sensor ABS axle: 2 left - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc000,
+            'shift': 14,
+            'string': 'Wheel sensor ABS axle: 1 left - ',
+            'values': onOffErrorNa
+        },
+    ],
+    150: [
+        {
+            'mask': 0x30,
+            'shift': 4,
+            'string': 'PTO #3 engagement actuator status - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc0,
+            'shift': 6,
+            'string': 'PTO #4 engagement actuator status - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x3000,
+            'shift': 12,
+            'string': 'PTO #3 engagement control switch status - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc000,
+            'shift': 14,
+            'string': 'PTO #4 engagement control switch status - ',
+            'values': onOffErrorNa
+        },
+    ],
+    151: [
+        {
+            'mask': 0x3,
+            'shift': 0,
+            'string': 'ATC deep snow/mud function switch - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc,
+            'shift': 2,
+            'string': 'VDC brake control - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x30,
+            'shift': 4,
+            'string': 'VDC engine control - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x300,
+            'shift': 8,
+            'string': 'ATC status lamp - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc00,
+            'shift': 10,
+            'string': 'ATC brake control - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x3000,
+            'shift': 12,
+            'string': 'ATC engine control - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc000,
+            'shift': 14,
+            'string': 'ATC spin-out signal detection - ',
+            'values': onOffErrorNa
+        },
+    ],
+    209: [
+        {
+            'mask': 0x3,
+            'shift': 0,
+            'string': 'Tractor Mounted Trailer ABS Lamp - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc,
+            'shift': 2,
+            'string': 'Trailer ABS Control Status - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x30,
+            'shift': 4,
+            'string': 'ABS warning lamp Trailer #1 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc0,
+            'shift': 8,
+            'string': 'ABS brake control Status Trailer #1 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x300,
+            'shift': 0,
+            'string': 'ABS warning Lamp Trailer #2 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc00,
+            'shift': 2,
+            'string': 'ABS brake control Status Trailer #2 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x3000,
+            'shift': 4,
+            'string': 'ABS warning Lamp Trailer #3 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc000,
+            'shift': 8,
+            'string': 'ABS brake control Status Trailer #3 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x30000,
+            'shift': 0,
+            'string': 'ABS warning Lamp Trailer #4 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc0000,
+            'shift': 2,
+            'string': 'ABS brake control Status Trailer #4 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0x300000,
+            'shift': 4,
+            'string': 'ABS warning Lamp Trailer #5 - ',
+            'values': onOffErrorNa
+        },
+        {
+            'mask': 0xc00000,
+            'shift': 8,
+            'string': 'ABS brake control Status Trailer #5 - ',
+            'values': onOffErrorNa
+        },
+    ]
+}
\ No newline at end of file
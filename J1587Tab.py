@@ -39,6 +39,7 @@ import json
 import math
 import traceback
 from RP1210Functions import *
+from J1587Decode import *
 from TableModel.TableModel import *
 
 import logging
@@ -74,7 +75,7 @@ class J1587Tab(QWidget):
                                    589, 1002, 1003, 1028, 1122, 1123, 1124, 1125, 1126]
 
 
-        self.pids_to_not_decode = [197, 198, 254]
+        self.pids_to_not_decode = list(J1587_PIDS_TO_NOT_DECODE)
 
         self.j1587responses = {}
         self.mids = [] # 128, 130, 136]
@@ -132,27 +133,7 @@ class J1587Tab(QWidget):
         msg_mid = msg[0]
 
         if msg[1] == 0xc0: #See section A.192 of J1587
-            (mid, pid, last_section, this_section, data) = J1587MultiSectionMessage.parse_message(msg)
-            if mid in self.multi_section_messages.keys() and pid in self.multi_section_messages[mid].keys():
-                self.multi_section_messages[mid][pid].add_section(this_section, data)
-                if self.multi_section_messages[mid][pid].all_sections_recvd():
-                    completed_message = self.multi_section_messages[mid][pid].get_message()
-                    del(self.multi_section_messages[mid][pid])
-                    return completed_message
-            else:
-                if mid not in self.multi_section_messages.keys():
-                    # Create the dictionary entry of a message object if it doesn't exist using the PID as a key.
-                    self.multi_section_messages[mid] = {pid: J1587MultiSectionMessage(mid, pid, last_section)}
-                elif pid not in self.multi_section_messages[mid].keys():
-                    self.multi_section_messages[mid][pid] = J1587MultiSectionMessage(mid, pid, last_section)
-                self.multi_section_messages[mid][pid].add_section(this_section, data)
-                # Would they send a multi-section message as just one message?
-                # Probably not, but it wouldn't surprise me
-                if self.multi_section_messages[mid][pid].all_sections_recvd():
-                    completed_message = self.multi_section_messages[mid][pid].get_message()
-                    del(self.multi_section_messages[mid][pid])
-                    return completed_message
-            return None    
+            return add_multi_section_message(self.multi_section_messages, msg)
         # Need to request more information.
         elif msg[1] == 0xc2:
             mid = msg[0]
@@ -259,6 +240,8 @@ class J1587Tab(QWidget):
         self.J1587_id_table.setHorizontalHeaderLabels(self.J1587_id_table_columns)
         self.J1587_id_table.setRowCount(0)
         self.J1587_unique_ids = {}
+        # The data package holds the table itself, so it is not merged after every message.
+        self.root.data_package["J1587 Message and Parameter IDs"] = self.J1587_unique_ids
         self.J1587_table_index = {}
         self.byte_set={}
         logger.info("User cleared J1587 table data.")
@@ -280,36 +263,11 @@ class J1587Tab(QWidget):
         if msg is None:
             return
 
-        buffer_length = len(msg)
-        #return
         try:
-            mid = msg[0]
+            mid, pid_list = split_j1587_message(msg)
         except IndexError:
             return
 
-        buffer_index = 1
-        pid_list = []
-        #logger.debug(bytes_to_hex_string(msg))
-        # Generate a list of tuples where each tuple is a PID, Value
-        while buffer_index < buffer_length:
-            try:
-                pid = msg[buffer_index]
-                if pid == 255:
-                    buffer_index +=1
-                    pid = msg[buffer_index] + 256
-                buffer_index += 1
-                if pid < 128 or pid % 256 < 128:
-                    pid_list.append((pid,bytes([msg[buffer_index]])))
-                    buffer_index += 1
-                elif pid < 192 or pid % 256 < 192:
-                    pid_list.append((pid,msg[buffer_index:buffer_index + 2]))
-                    buffer_index += 2
-                else:
-                    n = msg[buffer_index]
-                    pid_list.append((pid,msg[buffer_index:buffer_index + n + 1]))
-                    buffer_index = buffer_index + n + 1
-            except IndexError:
-                break
         #print(pid_list)
         if mid < 128:
             return
@@ -447,764 +405,22 @@ class J1587Tab(QWidget):
                 units = self.J1587_unique_ids[pid_key]["Units"]
                 self.root.data_package["ECU Time Information"][source_key].update({"Total Engine Hours":"{:0.2f} {}".format(val,units)})
 
-
-        self.root.data_package["J1587 Message and Parameter IDs"].update(self.J1587_unique_ids)
     
     def get_mid_name(self, mid):
-        try:
-            return self.J1587db["MID"]["{}".format(mid)]
-        except KeyError:
-            return "Unknown"
-    
+        return get_mid_name(self.J1587db, mid)
+
     def get_pid_name(self, pid):
-        try:
-            return self.J1587db["PID"]["{}".format(pid)]["Name"]
-        except:
-            return "Not Provided"
-                
+        return get_pid_name(self.J1587db, pid)
+
     def clear_voltage_history(self):
         for key in self.battery_potential:
             self.battery_potential[key]=[]
 
-    def get_j1587_bit_meaning(self, pid, value):
-        meaning = ""
-        if pid in j1587BitDecodingDict.keys():
-            for element in j1587BitDecodingDict[pid]:
-                meaning += element['string']
-                masked_bit = (value & element['mask']) >> element['shift']
-                meaning += element['values'][masked_bit]
-                meaning += '\n'
-        else:
-            meaning = "Not Decoded" 
-        return meaning.strip()#[:-1] #Strip the last newline off the string
-
     def get_j1587_value(self, mid, pid, data, source_key):
         pid_key = repr((mid,pid))
-        
-        try:
-            units = self.J1587db["PID"]["{}".format(pid)]["Unit"]
-
-        except KeyError:
-            value = repr(data)
-            units = ""
-            return ("{}".format(value), units)
-        else:
-            data_length = self.J1587db["PID"]["{}".format(pid)]["DataLength"]
-            data_type = self.J1587db["PID"]["{}".format(pid)]["DataType"]
-            bit_resolution = self.J1587db["PID"]["{}".format(pid)]["BitResolution"]
-            
-            if data_type == "Binary Bit-Mapped" and pid != 194:
-                #logger.debug("Decoding J1587 Bits. Data = " + repr(data))
-                if len(data) == 1:
-                    value = struct.unpack("B",data)[0]
-                    self.J1587_unique_ids[pid_key]["Meaning"] = self.get_j1587_bit_meaning(pid,value)
-                else:
-                    value = data
-            elif data_type == "Unsigned Short Integer" and data_length == 1 and len(data) == 1:
-                value = "{:0.3f}".format(struct.unpack("B",data)[0] * bit_resolution)
-            elif data_type == "Unsigned Integer" and data_length == 2 and len(data) == 2:
-                value = "{:0.3f}".format(struct.unpack("<H",data)[0] * bit_resolution)
-            elif data_type == "Signed Integer" and data_length == 2 and len(data) == 2:
-                value = "{:0.3f}".format(struct.unpack("<h",data)[0] * bit_resolution)
-            elif data_type == "Signed Integer" and data_length == 2 and len(data) == 3:
-                value = "{:0.3f}".format(struct.unpack("<h",data[1:3])[0] * bit_resolution)
-            elif data_type == "Unsigned Long Integer" and data_length == 4 and len(data) == 4:
-                value = "{:0.3f}".format(struct.unpack("<L",data)[0] * bit_resolution)
-            elif data_type == "Unsigned Long Integer" and data_length == 4 and len(data) == 5:
-                value = "{:0.3f}".format(struct.unpack("<L",data[1:5])[0] * bit_resolution)
-            elif data_type == "Signed Long Integer" and data_length == 4 and len(data) == 5:
-                value = "{:0.3f}".format(struct.unpack("<l",data[1:5])[0] * bit_resolution)
-            elif pid == 251 and data[0] == 3: #Clock
-                seconds = data[1]
-                minutes = data[2]
-                hours = data[3]
-                value = "{:02d}:{:02d}:{:02d}".format(hours, minutes, math.ceil(seconds/4))
-                units = "HH:MM:SS"
-                self.root.data_package["Time Records"][source_key]["Last ECM Clock"] = value
-                try:
-                    time_string = self.root.data_package["Time Records"][source_key]["Last ECM Date"] + "T" + self.root.data_package["Time Records"][source_key]["Last ECM Clock"]
-                except KeyError:
-                    logger.debug("We don't have a date code, so we can't make time.")
-                else:
-                    try:
-                        self.root.data_package["Time Records"][source_key]["Last ECM Time"] = calendar.timegm(time.strptime(time_string,"%m/%d/%YT%H:%M:%S"))
-                        self.root.data_package["Time Records"][source_key]["PC Time minus ECM Time"] = time.time() - self.root.data_package["Time Records"][source_key]["Last ECM Time"]
-                    except (TypeError, ValueError):
-                        logger.debug(traceback.format_exc())
-                        self.root.data_package["Time Records"][source_key]["Last ECM Time"] = None
-                        self.root.data_package["Time Records"][source_key]["PC Time minus ECM Time"] = None
-                    
-                    self.root.data_package["Time Records"][source_key]["PC Time at Last ECM Time"] = time.time()
-        
-
-                
-                    
-            elif pid == 252 and data[0] == 3: #Date
-                day = data[1]
-                month = data[2]
-                year = data[3] + 1985
-                value = "{:02d}/{:02d}/{:04d}".format(month,math.ceil(day/4),year)
-                units = "Month/Day/Year"
-                self.root.data_package["Time Records"][source_key]["Last ECM Date"] = value
-            elif pid == 243: #Component Identification
-                value = data.decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
-                component_id_list = value.split("*")
-                try:
-                    make = component_id_list[0]
-                    if "TDSC" in make.upper():
-                        self.make = "DTDSC"
-                except IndexError:
-                    make = None
-                try:
-                    model = component_id_list[1]
-                except IndexError:
-                    model = None
-                try:
-                    serial = component_id_list[2]
-                except IndexError:
-                    serial = None
-                try:
-                    unit = component_id_list[3]
-                except IndexError:
-                    unit = None
-                # self.component_id[source_key] = 
-                # logger.info("Found J1587 Component ID from MID {}: ".format(mid) + repr(self.component_id[source_key]))
-                # if mid == 128: #Engine
-                #     self.root.make = make
-                #     self.root.model = model
-                self.root.data_package["Component Information"][source_key].update({"Make":make, "Model":model, "Serial":serial, "Unit":unit})
-            elif pid == 237: #VIN
-                value = data[1:].decode("ascii",'ignore').replace(b'\x00'.decode('ascii','ignore'),'')
-                logger.info("Found J1587 Vehicle Identification from MID {}: ".format(mid) + value)
-                self.root.data_package["Component Information"][source_key].update({"VIN": value})
-            
-            elif pid == 234: # Software Identification
-                value = data[1:].decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
-                logger.info("Found J1587 Software Identification from MID {}: ".format(mid) + value)
-                self.root.data_package["Component Information"][source_key].update({"Software": value})
-            
-            elif data_type == "Alphanumeric":
-                value = data.decode('ascii','ignore').replace(b'\x00'.decode('ascii','ignore'),'')
-            
-            elif pid == 194:
-                self.count_divisor = 1
-                self.J1587_unique_ids[pid_key]["Meaning"] = self.get_j1587_diagnostics(mid,pid,data)
-                value = "{:d}".format(self.pid194_count)
-                units = "Count"
-            else:
-                value = ""
-        
-        return ("{}".format(value),units)  
-
-    def get_j1587_diagnostics(self, mid, pid, data):
-        ''' Interpret PID 194 from SAE J1597 standard'''
-        message = ""
-        byte_count = data[0]
-        byte_index = 1
-        self.pid194_count = 0
-        while byte_index < byte_count + 1:
-            try:
-                sid = data[byte_index]
-                byte_index += 1
-                diag_code_char = data[byte_index]
-                byte_index += 1
-            except IndexError:
-                return message
-            if (diag_code_char & 0x80) == 0x80:
-                occurance_count_included = True
-                self.count_divisor = 3
-            else:
-                occurance_count_included = False
-                self.count_divisor = 2
-            
-            if (diag_code_char & 0x40) == 0x40:
-                fault_is_inactive = True
-                message += "I - "
-            else:
-                fault_is_inactive = False
-                message += "A - "
-
-            if (diag_code_char & 0x20) == 0x20:
-                standard_code = True
-            else:
-                standard_code = False
-
-            if (diag_code_char & 0x10) == 0x10:
-                is_sid_code = True
-            else:
-                is_sid_code = False
-            
-            if not standard_code:
-                sid += 256
-
-            try:
-                if is_sid_code:
-                    if "{}".format(mid) in self.J1587db["SID"].keys():
-                        sid_string = self.J1587db["SID"]["{}".format(mid)]["{}".format(sid)]
-                    else:
-                        sid_string = self.J1587db["SID"]["-1"]["{}".format(sid)]
-                else:
-                    sid_string = self.J1587db["PIDNames"]["{}".format(sid)]
-            except KeyError:
-                sid_string = "Unknown System ID"
-            
-            
-            message += sid_string
-            message += ": "
-
-            fmi = diag_code_char & 0x0F
-            fmi_text = self.J1587db["FMI"]["{}".format(fmi)]
-            message += fmi_text
-
-            if occurance_count_included:
-                try:
-                    occurance_count = data[byte_index]
-                except IndexError:
-                    return message
-                byte_index += 1
-                message += ". Count: {}\n".format(occurance_count)
-            else:
-                message += "\n"
-            self.pid194_count += 1
-        #logger.debug(message)
-        return message.strip()    
-
-
-class J1587MultiSectionMessage():
-
-    def __init__(self, mid, pid, num_sections):
-        self.mid = mid
-        self.pid = pid
-        self.sections = [None] * (num_sections + 1)
-
-    def add_section(self, section_num, data):
-        # If not the final section, don't add the checksum to data.
-        if section_num < len(self.sections):
-            self.sections[section_num] = data[:-1]
-        else:
-            self.sections[section_num] = data
-
-    def all_sections_recvd(self):
-        return not None in self.sections
-
-    def get_message(self):
-        data = self.get_data()
-        if data is None:
-            return None
-        # Don't need to consider section 2/3 PIDs because these messages don't
-        # support them
-        return bytes([self.mid, self.pid]) + data
-
-    def get_data(self):
-        if not self.all_sections_recvd():
-            return None
-        else:
-            return b''.join(self.sections)
-
-    @staticmethod
-    def parse_message(buf):
-        mid = buf[0]
-        byte_count = buf[2]
-        data_portion = buf[3:3 + byte_count]
-        pid = data_portion[0]
-        last_section = (data_portion[1] & 0xF0) >> 4
-        this_section = data_portion[1] & 0x0F
-        if this_section == 0:
-            data = data_portion[3:]
-        else:
-            data = data_portion[2:]
-
-        return (mid, pid, last_section, this_section, data)
-
-
-activeInactive = {
-    0: 'Inactive',
-    1: 'Active'
-}
-onOff = {
-    0: 'Off',
-    1: 'On'
-}
-onOffErrorNa = {
-    0: 'Off / Inactive',
-    1: 'On / Active',
-    2: 'Error Condition',
-    3: 'Not Avaliable'
-}
-
-j1587BitDecodingDict = {
-    40: [{
-        'mask': 0x03,
-        'shift': 4,
-        'string': 'Engine Retarder Switch - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0x3C,
-        'shift': 4,
-        'string': 'Engine Retarder Level Switch - ',
-        'values': {0: "0 Cylinders",
-                   1: "1 Cylinder",
-                   2: "2 Cylinder",
-                   3: "3 Cylinder",
-                   4: "4 Cylinder",
-                   5: "5 Cylinder",
-                   6: "6 Cylinder",
-                   7: "7 Cylinder",
-                   8: "8 Cylinder",
-                   9: "Reserved",
-                   10: "Reserved",
-                   11: "Reserved",
-                   12: "Reserved",
-                   13: "Reserved",
-                   14: "Error",
-                   15: "Not Avaliable"}
-        },
-    ],
-    44: [{
-        'mask': 0x30,
-        'shift': 4,
-        'string': 'Protect Lamp Status - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0xc,
-        'shift': 2,
-        'string': 'Amber Lamp Status - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0x3,
-        'shift': 0,
-        'string': 'Red Lamp Status - ',
-        'values': onOffErrorNa
-        }
-    ],
-    49: [{
-        'mask': 0xC0,
-        'shift': 6,
-        'string': 'ABS off-road function switch - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0x30,
-        'shift': 4,
-        'string': 'ABS Retarder Control - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0xc,
-        'shift': 2,
-        'string': 'ABS brake control - ',
-        'values': onOffErrorNa
-        },
-        {
-        'mask': 0x3,
-        'shift': 0,
-        'string': 'ABS warning lamp - ',
-        'values': onOffErrorNa
-        }
-    ],
-    70: [{
-        'mask': 0x80,
-        'shift': 7,
-        'string': '',
-        'values': activeInactive
-        }
-    ],
-    71: [{
-        'mask': 0x80,
-        'shift': 7,
-        'string': 'Idle shutdown timer status - ',
-        'values': activeInactive
-        },
-        {
-        'mask': 0x8,
-        'shift': 3,
-        'string': 'Idle shutdown timer function - ',
-        'values': {
-            0: 'Disabled',
-            1: 'Enabled'
-        }},
-        {
-        'mask': 0x4,
-        'shift': 2,
-        'string': 'Idle shutdown timer override - ',
-        'values': activeInactive
-        },
-        {
-        'mask': 0x2,
-        'shift': 1,
-        'string': 'Engine has shutdown by idle timer - ',
-        'values': {
-            0: 'No',
-            1: 'Yes'
-        }},
-        {
-        'mask': 0x1,
-        'shift': 0,
-        'string': 'Driver Alert Mode - ',
-        'values': activeInactive
-        }
-    ],
-    89: [
-        {
-            'mask': 0x80,
-            'shift': 7,
-            'string': 'PTO Mode - ',
-            'values': activeInactive
-        },
-        {
-            'mask': 0x40,
-            'shift': 6,
-            'string': 'Clutch Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x20,
-            'shift': 5,
-            'string': 'Brake Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x10,
-            'shift': 4,
-            'string': 'Accel Switch - ',
-            'values':
-            onOff
-        },
-        {
-            'mask': 0x8,
-            'shift': 3,
-            'string': 'Resume Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x4,
-            'shift': 2,
-            'string': 'Coast Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x2,
-            'shift': 1,
-            'string': 'Set Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x1,
-            'shift': 0,
-            'string': 'PTO Control Switch - ',
-            'values': onOff
-        }
-    ],
-    85: [
-        {
-            'mask': 0x1,
-            'shift': 0,
-            'string': 'Cruise Control Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x2,
-            'shift': 1,
-            'string': 'Set Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x4,
-            'shift': 2,
-            'string': 'Coast Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x8,
-            'shift': 3,
-            'string': 'Resume Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x10,
-            'shift': 4,
-            'string': 'Accel Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x20,
-            'shift': 5,
-            'string': 'Brake Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x40,
-            'shift': 6,
-            'string': 'Clutch Switch - ',
-            'values': onOff
-        },
-        {
-            'mask': 0x80,
-            'shift': 7,
-            'string': 'Cruise Mode - ',
-            'values': {
-                0: 'Not Active',
-                1: 'Active'
-            }},
-    ],
-    83: [
-        {
-            'mask': 0x80,
-            'shift': 7,
-            'string': 'Road Speed Limiter Currently ',
-            'values': {
-                0: 'Not Active',
-                1: 'Active'
-            }}
-    ],
-    97: [
-        {
-            'mask': 0x80,
-            'shift': 7,
-            'string': 'Water in Fuel Tndicator - ',
-            'values': {
-                0: 'No',
-                1: 'Yes'
-            }}
-    ],
-    121: [
-        {
-            'mask': 0x80,
-            'shift': 7,
-            'string': 'Engine Retarder -  ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x01,
-            'shift': 2,
-            'string': '2 Cylinder - ',
-            'values': { 0: "Not Active",
-                        1: "Active" }
-        },
-        {
-            'mask': 0x02,
-            'shift': 2,
-            'string': '3 Cylinder - ',
-            'values': { 0: "Not Active",
-                        1: "Active" }
-        },
-        {
-            'mask': 0x04,
-            'shift': 2,
-            'string': '4 Cylinder - ',
-            'values': { 0: "Not Active",
-                        1: "Active" }
-        },
-        {
-            'mask': 0x08,
-            'shift': 2,
-            'string': '6 Cylinder - ',
-            'values': { 0: "Not Active",
-                        1: "Active" }
-        },
-        {
-            'mask': 0x10,
-            'shift': 2,
-            'string': '8 Cylinder - ',
-            'values': { 0: "Not Active",
-                        1: "Active" }
-        }
-    ],
-    134: [
-        {
-            'mask': 0x3,
-            'shift': 0,
-            'string': 'Wheel sensor ABS axle: 4 right - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc,
-            'shift': 2,
-            'string': 'Wheel sensor ABS axle: 3 right - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x30,
-            'shift': 4,
-            'string': 'Wheel sensor ABS axle: 2 right - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc0,
-            'shift': 6,
-            'string': 'Wheel sensor ABS axle: 1 right - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x300,
-            'shift': 8,
-            'string': 'Wheel sensor ABS axle: 4 left - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc00,
-            'shift': 10,
-            'string': 'Wheel sensor ABS axle: 3 left - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x3000,
-            'shift': 12,
-            'string': 'Wheel sensor ABS axle: 2 left - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc000,
-            'shift': 14,
-            'string': 'Wheel sensor ABS axle: 1 left - ',
-            'values': onOffErrorNa
-        },
-    ],
-    150: [
-        {
-            'mask': 0x30,
-            'shift': 4,
-            'string': 'PTO #3 engagement actuator status - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc0,
-            'shift': 6,
-            'string': 'PTO #4 engagement actuator status - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x3000,
-            'shift': 12,
-            'string': 'PTO #3 engagement control switch status - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc000,
-            'shift': 14,
-            'string': 'PTO #4 engagement control switch status - ',
-            'values': onOffErrorNa
-        },
-    ],
-    151: [
-        {
-            'mask': 0x3,
-            'shift': 0,
-            'string': 'ATC deep snow/mud function switch - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc,
-            'shift': 2,
-            'string': 'VDC brake control - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x30,
-            'shift': 4,
-            'string': 'VDC engine control - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x300,
-            'shift': 8,
-            'string': 'ATC status lamp - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc00,
-            'shift': 10,
-            'string': 'ATC brake control - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x3000,
-            'shift': 12,
-            'string': 'ATC engine control - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc000,
-            'shift': 14,
-            'string': 'ATC spin-out signal detection - ',
-            'values': onOffErrorNa
-        },
-    ],
-    209: [
-        {
-            'mask': 0x3,
-            'shift': 0,
-            'string': 'Tractor Mounted Trailer ABS Lamp - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc,
-            'shift': 2,
-            'string': 'Trailer ABS Control Status - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x30,
-            'shift': 4,
-            'string': 'ABS warning lamp Trailer #1 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc0,
-            'shift': 8,
-            'string': 'ABS brake control Status Trailer #1 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x300,
-            'shift': 0,
-            'string': 'ABS warning Lamp Trailer #2 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc00,
-            'shift': 2,
-            'string': 'ABS brake control Status Trailer #2 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x3000,
-            'shift': 4,
-            'string': 'ABS warning Lamp Trailer #3 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc000,
-            'shift': 8,
-            'string': 'ABS brake control Status Trailer #3 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x30000,
-            'shift': 0,
-            'string': 'ABS warning Lamp Trailer #4 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc0000,
-            'shift': 2,
-            'string': 'ABS brake control Status Trailer #4 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0x300000,
-            'shift': 4,
-            'string': 'ABS warning Lamp Trailer #5 - ',
-            'values': onOffErrorNa
-        },
-        {
-            'mask': 0xc00000,
-            'shift': 8,
-            'string': 'ABS brake control Status Trailer #5 - ',
-            'values': onOffErrorNa
-        },
-    ]
-}
\ No newline at end of file
+        source_records = {"Time Records": self.root.data_package["Time Records"][source_key],
+                          "Component Information": self.root.data_package["Component Information"][source_key]}
+        value, units, meaning = get_j1587_value(self.J1587db, mid, pid, data, source_records)
+        if meaning is not None:
+            self.J1587_unique_ids[pid_key]["Meaning"] = meaning
+        return (value, units)
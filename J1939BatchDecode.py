@@ -0,0 +1,138 @@
+"""
+Vectorized decoding of J1939 Suspect Parameter Numbers (SPNs) for many frames
+at once.
+
+Decoding a log file one frame at a time spends most of its time in the Python
+interpreter. When all the frames of a Parameter Group Number (PGN) are stacked
+into an (N, 8) uint8 array, the decode plan steps from J1939DecodePlan can be
+run as NumPy bit operations on whole columns. The results are the same numbers
+the scalar decoder computes for each frame.
+"""
+import numpy as np
+import struct
+import time
+from collections import namedtuple
+from J1939DecodePlan import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The unsigned types to reverse the byte order of a value, keyed by the
+# number of bytes in the value.
+SWAP_TYPES = {2: np.uint16,
+              4: np.uint32,
+              8: np.uint64}
+
+SPNColumn = namedtuple("SPNColumn", ["values", "too_high", "too_low"])
+
+
+def frame_words(frames, byte_offset):
+    """
+    Return the 8 bytes starting at byte_offset of each frame as big endian
+    64-bit words. Frames that are too short are padded with 0xFF like the
+    scalar decoder does.
+    """
+    count, width = frames.shape
+    if byte_offset == 0 and width == 8:
+        return frames.view(">u8")[:, 0]
+    chunk = np.full((count, 8), 0xFF, dtype=np.uint8)
+    available = max(0, min(8, width - byte_offset))
+    chunk[:, :available] = frames[:, byte_offset:byte_offset + available]
+    return chunk.view(">u8")[:, 0]
+
+def decode_step_batch(step, words):
+    """
+    Run a numeric decode step against an array of 64-bit words. Returns the
+    float64 values.
+    """
+    decimal_values = (words.astype(np.uint64) & np.uint64(step.mask & 0xFFFFFFFFFFFFFFFF)) >> np.uint64(step.shift)
+    if step.swap is not None:
+        # The data is little endian, so reverse the byte order
+        swap_type = SWAP_TYPES[step.swap[0].size]
+        decimal_values = decimal_values.astype(swap_type).byteswap().astype(np.uint64)
+    return decimal_values.astype(np.float64) * step.scale + step.offset
+
+def decode_pgn_batch(plan, frames):
+    """
+    Decode every numeric SPN of a PGN for a batch of frames.
+
+    frames is an (N, 8) uint8 array with one frame per row. Wider arrays are
+    accepted for PGNs that are longer than 8 bytes. Returns a dictionary keyed
+    by SPN with an SPNColumn of float64 values and the boolean masks of the
+    values above OperationalHigh and below OperationalLow. SPNs that are not
+    numbers, like ASCII strings, are left out.
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    if frames.ndim != 2:
+        raise ValueError("Frames must be a 2 dimensional array with one frame per row.")
+    columns = {}
+    words = {}
+    for step in plan:
+        if step.kind > DECODE_BITS:
+            continue
+        if step.byte_offset not in words:
+            words[step.byte_offset] = frame_words(frames, step.byte_offset)
+        values = decode_step_batch(step, words[step.byte_offset])
+        too_high = values > step.high
+        too_low = (values < step.low) & ~too_high
+        columns[step.spn] = SPNColumn(values, too_high, too_low)
+    return columns
+
+def decode_batch(decode_plans, pgn, frames):
+    """
+    Decode a batch of frames for a PGN using a J1939DecodePlans cache. Returns
+    an empty dictionary if the PGN is not in the database.
+    """
+    plan = decode_plans.get(pgn)
+    if plan is None:
+        return {}
+    return decode_pgn_batch(plan, frames)
+
+def verify(plan, frames):
+    """
+    Compare the batch decoder with the scalar decoder for each frame. Returns
+    the number of values that do not match.
+    """
+    columns = decode_pgn_batch(plan, frames)
+    mismatches = 0
+    for step in plan:
+        if step.spn not in columns:
+            continue
+        column = columns[step.spn]
+        for row in range(len(frames)):
+            value = decode_numeric(step, bytes(frames[row]))
+            if (value != column.values[row] or
+                    (value > step.high) != column.too_high[row] or
+                    (value < step.low and not value > step.high) != column.too_low[row]):
+                mismatches += 1
+    return mismatches
+
+def benchmark(j1939db, pgn=61444, frames=1000000, scalar_frames=20000):
+    """
+    Compare the per frame cost of the scalar and the batch decoders.
+    """
+    plans = J1939DecodePlans(j1939db)
+    plan = plans.get(pgn)
+    data = np.random.randint(0, 256, size=(frames, 8), dtype=np.uint8)
+
+    mismatches = verify(plan, data[:1000])
+    print("Batch and scalar values differ in {} places.".format(mismatches))
+
+    scalar_data = [bytes(row) for row in data[:scalar_frames]]
+    start_time = time.perf_counter()
+    for data_bytes in scalar_data:
+        decode_pgn(plan, data_bytes)
+    scalar_time = (time.perf_counter() - start_time) / scalar_frames
+
+    start_time = time.perf_counter()
+    decode_pgn_batch(plan, data)
+    batch_time = (time.perf_counter() - start_time) / frames
+
+    print("Decoded {} frames of PGN {} with {} SPNs".format(frames, pgn, len(plan)))
+    print("Scalar decoder: {:10.4f} us/frame".format(1e6 * scalar_time))
+    print("Batch decoder:  {:10.4f} us/frame".format(1e6 * batch_time))
+    print("Speed up:       {:10.1f}x".format(scalar_time / batch_time))
+
+if __name__ == '__main__':
+    from J1939Database import load_j1939db
+    benchmark(load_j1939db("J1939db.json"))
@@ -0,0 +1,304 @@
+"""
+Load the J1939 database from J1939db.json through a compiled binary cache.
+
+Parsing the 3.4 MB JSON file takes a noticeable amount of time at every
+launch and leaves every table keyed by strings. The first time the database is
+loaded, the tables are re-keyed by integers (PGN, SPN, source address, FMI)
+and written to a cache file next to the JSON file. Later launches read the
+cache directly as long as the SHA-256 hash of the JSON file has not changed.
+
+Every entry of every section is pickled on its own, so the cache can be memory
+mapped and an SPN definition or a bit decoding table is only turned into
+Python objects the first time it is looked up. Most sessions only see a few
+hundred of the thousands of SPNs in the database.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+import traceback
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+import logging
+logger = logging.getLogger(__name__)
+
+J1939DB_SECTIONS = ["J1939BitDecodings",
+                    "J1939FMITabledb",
+                    "J1939LampFlashTabledb",
+                    "J1939OBDTabledb",
+                    "J1939PGNdb",
+                    "J1939SAHWTabledb",
+                    "J1939SATabledb",
+                    "J1939SPNdb"]
+
+CACHE_MAGIC = b'J1939DB\x00'
+CACHE_VERSION = 2
+# magic, cache format version, SHA-256 of the JSON file, offset of the index,
+# modification time in ns and size of the JSON file
+CACHE_HEADER = struct.Struct("<8sH32sQqQ")
+# The type code of the arrays of keys and byte offsets in the index
+INDEX_TYPE = 'q'
+
+
+def empty_j1939db():
+    """
+    Make a data structure to do something anyways when the database is missing.
+    """
+    return {section: {} for section in J1939DB_SECTIONS}
+
+def integer_keys(table):
+    """
+    Return a copy of a table with keys that are integer strings converted to
+    integers. Repeated string values are interned so they are only stored once.
+    """
+    new_table = {}
+    for key, value in table.items():
+        try:
+            key = int(key)
+        except ValueError:
+            pass
+        if isinstance(value, str):
+            value = sys.intern(value)
+        elif isinstance(value, dict):
+            value = {k: sys.intern(v) if isinstance(v, str) else v for k, v in value.items()}
+        new_table[key] = value
+    return new_table
+
+def index_j1939db(json_db):
+    """
+    Convert the sections of the JSON database into integer keyed tables.
+    """
+    j1939db = empty_j1939db()
+    for section, table in json_db.items():
+        j1939db[section] = integer_keys(table)
+    # The bit decodings are keyed by SPN, then by the integer value of the bits.
+    j1939db["J1939BitDecodings"] = {spn: integer_keys(decodings)
+                                    for spn, decodings in j1939db["J1939BitDecodings"].items()}
+    return j1939db
+
+def get_cache_path(json_path):
+    return os.path.splitext(json_path)[0] + ".cache"
+
+
+class LazyJ1939Table(Mapping):
+    """
+    A read only section of the J1939 database. Each entry is pickled on its
+    own in the cache and is only unpickled the first time it is looked up.
+    The keys are kept as a sorted array with the byte offsets of the entries,
+    so the index costs 16 bytes per entry until an entry is used.
+    """
+    def __init__(self, buffer, keys, offsets):
+        self.buffer = buffer
+        self.keys_array = keys
+        self.offsets = offsets
+        self.entries = {}
+
+    def find(self, key):
+        """
+        Return the position of a key in the index or -1 if it is missing.
+        """
+        if not isinstance(key, int):
+            return -1
+        position = bisect_left(self.keys_array, key)
+        if position < len(self.keys_array) and self.keys_array[position] == key:
+            return position
+        return -1
+
+    def __getitem__(self, key):
+        try:
+            return self.entries[key]
+        except KeyError:
+            position = self.find(key)
+            if position < 0:
+                raise
+            value = pickle.loads(self.buffer[self.offsets[position]:self.offsets[position + 1]])
+            if isinstance(value, dict):
+                # Share the field names between entries like a single pickle would.
+                value = {sys.intern(k) if isinstance(k, str) else k: v for k, v in value.items()}
+            self.entries[key] = value
+            return value
+
+    def __contains__(self, key):
+        return key in self.entries or self.find(key) >= 0
+
+    def __iter__(self):
+        return iter(self.keys_array)
+
+    def __len__(self):
+        return len(self.keys_array)
+
+    def __repr__(self):
+        return "<LazyJ1939Table with {} of {} entries loaded>".format(len(self.entries), len(self.keys_array))
+
+
+class LazyJ1939db(Mapping):
+    """
+    The J1939 database read from a cache buffer. It has the same read API as
+    the dictionary made from J1939db.json, but with integer keys.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        magic, version, digest, index_offset, json_mtime, json_size = CACHE_HEADER.unpack_from(buffer)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError("The buffer is not a version {} J1939 database cache.".format(CACHE_VERSION))
+        self.digest = digest
+        index = pickle.loads(buffer[index_offset:])
+        self.sections = {}
+        for section in J1939DB_SECTIONS:
+            keys = array(INDEX_TYPE)
+            offsets = array(INDEX_TYPE, [index_offset])
+            if section in index:
+                keys.frombytes(index[section][0])
+                offsets = array(INDEX_TYPE)
+                offsets.frombytes(index[section][1])
+            self.sections[section] = LazyJ1939Table(buffer, keys, offsets)
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def loaded_entries(self):
+        """
+        Return the number of entries that have been unpickled in each section.
+        """
+        return {section: len(table.entries) for section, table in self.sections.items()}
+
+
+def build_j1939db_cache(j1939db, digest, json_stat):
+    """
+    Serialize an integer keyed database into the cache format: a header, one
+    pickle for every entry of every section and an index with the sorted keys
+    and the byte offsets of the entries of each section.
+    """
+    cache = bytearray(CACHE_HEADER.size)
+    index = {}
+    for section, table in j1939db.items():
+        keys = array(INDEX_TYPE, sorted(table))
+        offsets = array(INDEX_TYPE)
+        for key in keys:
+            offsets.append(len(cache))
+            cache += pickle.dumps(table[key], protocol=pickle.HIGHEST_PROTOCOL)
+        offsets.append(len(cache))
+        index[section] = (keys.tobytes(), offsets.tobytes())
+    index_offset = len(cache)
+    cache += pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+    CACHE_HEADER.pack_into(cache, 0, CACHE_MAGIC, CACHE_VERSION, digest, index_offset,
+                           json_stat.st_mtime_ns, json_stat.st_size)
+    return bytes(cache)
+
+def get_digest(json_path):
+    """
+    Return the SHA-256 hash of a file without reading it into memory at once.
+    """
+    sha = hashlib.sha256()
+    with open(json_path, 'rb') as json_file:
+        for chunk in iter(lambda: json_file.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.digest()
+
+def open_j1939db_cache(cache_path, json_path):
+    """
+    Memory map the cache file and return a LazyJ1939db. Returns None if the
+    cache is missing, unreadable or was built from a different JSON file.
+    The JSON file is only hashed when its size or modification time differs
+    from the ones recorded in the cache.
+    """
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            header = cache_file.read(CACHE_HEADER.size)
+            magic, version, digest, index_offset, json_mtime, json_size = CACHE_HEADER.unpack(header)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                logger.debug("The J1939 database cache at {} has an old format.".format(cache_path))
+                return None
+            json_stat = os.stat(json_path)
+            if ((json_stat.st_mtime_ns != json_mtime or json_stat.st_size != json_size) and
+                    get_digest(json_path) != digest):
+                logger.debug("The J1939 database cache at {} is out of date.".format(cache_path))
+                return None
+            # The map stays valid after the file is closed.
+            buffer = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return LazyJ1939db(buffer)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.debug(traceback.format_exc())
+        logger.warning("Could not read the J1939 database cache at {}".format(cache_path))
+        return None
+
+def write_j1939db_cache(cache, cache_path):
+    """
+    Write the cache bytes to the cache file. A failure to write only means the
+    cache is rebuilt at the next launch. Returns True if the file was written.
+    """
+    temp_path = cache_path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(cache)
+        os.replace(temp_path, cache_path)
+        logger.info("Wrote the J1939 database cache to {}".format(cache_path))
+        return True
+    except OSError as e:
+        logger.warning(repr(e))
+        logger.warning("Failed to create {}".format(cache_path))
+        return False
+
+def load_j1939db(json_path, cache_path=None):
+    """
+    Load the lazy, integer keyed J1939 database for the JSON file at json_path.
+    The cache is rebuilt whenever the hash of the JSON file changes.
+    Raises FileNotFoundError if the JSON file does not exist.
+    """
+    if cache_path is None:
+        cache_path = get_cache_path(json_path)
+    json_stat = os.stat(json_path)
+    j1939db = open_j1939db_cache(cache_path, json_path)
+    if j1939db is None:
+        logger.info("Building the J1939 database cache from {}".format(json_path))
+        with open(json_path, 'rb') as j1939_file:
+            json_bytes = j1939_file.read()
+        digest = hashlib.sha256(json_bytes).digest()
+        cache = build_j1939db_cache(index_j1939db(json.loads(json_bytes)), digest, json_stat)
+        if write_j1939db_cache(cache, cache_path):
+            j1939db = open_j1939db_cache(cache_path, json_path)
+        if j1939db is None:
+            j1939db = LazyJ1939db(cache)
+    return j1939db
+
+if __name__ == '__main__':
+    import tracemalloc
+    load_j1939db("J1939db.json")
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    with open("J1939db.json",'r') as j1939_file:
+        json_db = json.load(j1939_file)
+    print("json.load:     {:8.1f} ms {:8.0f} kB".format(1000 * (time.perf_counter() - start_time),
+                                                      tracemalloc.get_traced_memory()[0] / 1024))
+    del json_db
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    j1939db = load_j1939db("J1939db.json")
+    print("load_j1939db:  {:8.1f} ms {:8.0f} kB".format(1000 * (time.perf_counter() - start_time),
+                                                      (tracemalloc.get_traced_memory()[0] - start_memory) / 1024))
+    # Touch the SPNs of a few hundred PGNs like a busy network would.
+    start_time = time.perf_counter()
+    for pgn in sorted(j1939db["J1939PGNdb"])[:300]:
+        for spn in j1939db["J1939PGNdb"][pgn]["SPNs"]:
+            if spn in j1939db["J1939SPNdb"]:
+                j1939db["J1939SPNdb"][spn]["Units"]
+            if spn in j1939db["J1939BitDecodings"]:
+                j1939db["J1939BitDecodings"][spn]
+    print("300 PGNs:      {:8.1f} ms {:8.0f} kB".format(1000 * (time.perf_counter() - start_time),
+                                                      (tracemalloc.get_traced_memory()[0] - start_memory) / 1024))
+    print(j1939db.loaded_entries())
@@ -0,0 +1,347 @@
+"""
+Precompiled decode plans for J1939 Suspect Parameter Numbers (SPNs).
+
+Looking up the definition of every SPN in the J1939 database for every frame
+is expensive: the keys have to be formatted into strings, several dictionary
+lookups are needed per SPN and the bit masks have to be rebuilt. A decode plan
+does this work once per Parameter Group Number (PGN) and stores a fixed list
+of integer based steps that can be run against the data bytes of each frame.
+
+Plans are compiled the first time a PGN is seen, so PGNs that never show up on
+the network are never compiled.
+"""
+import struct
+import time
+from collections import namedtuple
+from RP1210Functions import get_printable_chars
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The kinds of decoding performed for an SPN.
+DECODE_NUMERIC      = 0  ## Scaled and offset numerical value
+DECODE_BITS         = 1  ## Numerical value with a meaning from J1939BitDecodings
+DECODE_ASCII        = 2  ## Printable characters of the data
+DECODE_RAW          = 3  ## Python representation of the data bytes
+DECODE_COMPONENT_ID = 4  ## A field of the * delimited Component ID message
+
+COMPONENT_ID_PGN = 65259
+# The position of each SPN in the * delimited Component ID string
+COMPONENT_ID_FIELDS = {586: 0, # Make
+                       587: 1, # Model
+                       588: 2, # Serial Number
+                       233: 3} # Unit Number
+
+# Struct pairs to reverse the byte order of a value based on its length.
+# A value of 8 bits or less does not need to be reversed.
+BYTE_SWAPS = ((16, (struct.Struct("<H"), struct.Struct(">H"))),
+              (32, (struct.Struct("<L"), struct.Struct(">L"))),
+              (64, (struct.Struct("<Q"), struct.Struct(">Q"))))
+
+WORD = struct.Struct(">Q")
+PADDING = b'\xFF' * 8
+
+OUT_OF_RANGE_HIGH = "Out of Range - High"
+OUT_OF_RANGE_LOW = "Out of Range - Low"
+
+SPNDecodeStep = namedtuple("SPNDecodeStep", ["spn",
+                                             "kind",
+                                             "byte_offset",
+                                             "mask",
+                                             "shift",
+                                             "swap",
+                                             "scale",
+                                             "offset",
+                                             "high",
+                                             "low",
+                                             "integer_display",
+                                             "bit_table",
+                                             "field_index"])
+
+
+def compile_bit_table(bit_decodings):
+    """
+    Convert a J1939BitDecodings entry into a dictionary keyed by integers with
+    the display ready meaning as the value.
+    """
+    table = {}
+    for value, meaning in bit_decodings.items():
+        if isinstance(value, int):
+            table[value] = meaning.strip().capitalize()
+    return table
+
+def compile_spn_step(j1939db, pgn, spn, time_spns=()):
+    """
+    Build the SPNDecodeStep for an SPN in a PGN. Returns None if the SPN is not
+    in the database.
+    """
+    try:
+        spn_def = j1939db["J1939SPNdb"][spn]
+    except KeyError:
+        return None
+    units = spn_def["Units"]
+    spn_start = spn_def["StartBit"]
+    spn_length = spn_def["SPNLength"]
+    scale = spn_def["Resolution"]
+    offset = spn_def["Offset"]
+    high_value = spn_def["OperationalHigh"]
+    low_value = spn_def["OperationalLow"]
+
+    kind = DECODE_RAW
+    byte_offset = 0
+    mask = 0
+    shift = 0
+    swap = None
+    bit_table = None
+    field_index = 0
+    if pgn == COMPONENT_ID_PGN and spn in COMPONENT_ID_FIELDS:
+        kind = DECODE_COMPONENT_ID
+        field_index = COMPONENT_ID_FIELDS[spn]
+    elif units == 'ASCII':
+        kind = DECODE_ASCII
+    elif (scale > 0 or scale == -3) and spn_length <= 64:
+        # Move to the 8 byte word that holds the end of the SPN.
+        while (spn_start + spn_length) > 64:
+            spn_start -= 64
+            byte_offset += 8
+        shift = 64 - spn_start - spn_length
+        try:
+            for m in range(spn_length):
+                mask += 1 << (63 - m - spn_start)
+        except ValueError:
+            logger.debug("Experienced a ValueError on the Bit Masks with SPN {}".format(spn))
+            return None
+        for width, structs in BYTE_SWAPS:
+            if spn_length > width // 2:
+                swap = structs
+        if scale <= 0:
+            scale = 1
+        if units == 'bit':
+            kind = DECODE_BITS
+            try:
+                bit_table = compile_bit_table(j1939db["J1939BitDecodings"][spn])
+            except KeyError:
+                bit_table = {}
+        else:
+            kind = DECODE_NUMERIC
+
+    return SPNDecodeStep(spn,
+                         kind,
+                         byte_offset,
+                         mask,
+                         shift,
+                         swap,
+                         float(scale),
+                         float(offset),
+                         high_value,
+                         low_value,
+                         scale >= 1 or spn in time_spns,
+                         bit_table,
+                         field_index)
+
+def compile_pgn_plan(j1939db, pgn, time_spns=()):
+    """
+    Build the decode plan for a PGN. The plan is a tuple of SPNDecodeSteps in
+    the order the SPNs are listed in the database. Returns None if the PGN is
+    not in the database.
+    """
+    try:
+        spn_list = j1939db["J1939PGNdb"][pgn]["SPNs"]
+    except KeyError:
+        return None
+    plan = []
+    for spn in spn_list:
+        step = compile_spn_step(j1939db, pgn, spn, time_spns)
+        if step is not None:
+            plan.append(step)
+    return tuple(plan)
+
+def decode_numeric(step, data_bytes):
+    """
+    Return the scaled numerical value of a numeric step from the data bytes.
+    """
+    byte_offset = step.byte_offset
+    if len(data_bytes) >= byte_offset + 8:
+        word = WORD.unpack_from(data_bytes, byte_offset)[0]
+    else:
+        word = WORD.unpack((bytes(data_bytes[byte_offset:byte_offset + 8]) + PADDING)[:8])[0]
+    decimal_value = (word & step.mask) >> step.shift
+    if step.swap is not None:
+        # The data is little endian, so reverse the byte order
+        decimal_value = step.swap[1].unpack(step.swap[0].pack(decimal_value))[0]
+    return decimal_value * step.scale + step.offset
+
+def decode_pgn(plan, data_bytes):
+    """
+    Run a decode plan against the data bytes of a frame. Returns a list of
+    (spn, value, meaning) tuples where value and meaning are display strings.
+    """
+    results = []
+    comp_id_list = None
+    for step in plan:
+        kind = step.kind
+        meaning = ""
+        if kind <= DECODE_BITS:
+            try:
+                numerical_value = decode_numeric(step, data_bytes)
+            except struct.error:
+                logger.debug("Could not decode SPN {} from {}".format(step.spn, data_bytes))
+                continue
+            if numerical_value > step.high:
+                meaning = OUT_OF_RANGE_HIGH
+            elif numerical_value < step.low:
+                meaning = OUT_OF_RANGE_LOW
+            elif kind == DECODE_BITS:
+                meaning = step.bit_table.get(int(numerical_value), "")
+            if step.integer_display:
+                try:
+                    value = "{:d}".format(int(numerical_value))
+                except ValueError:
+                    value = "{}".format(numerical_value)
+            else:
+                try:
+                    value = "{:0.3f}".format(numerical_value)
+                except ValueError:
+                    value = "{}".format(numerical_value)
+        elif kind == DECODE_COMPONENT_ID:
+            if comp_id_list is None:
+                comp_id_list = get_printable_chars(bytes(data_bytes)).split("*")
+            try:
+                value = comp_id_list[step.field_index]
+            except IndexError:
+                value = ""
+        elif kind == DECODE_ASCII:
+            value = get_printable_chars(bytes(data_bytes))
+        else: #Should not be converted to a decimal number
+            value = repr(data_bytes)
+        results.append((step.spn, value, meaning))
+    return results
+
+
+class J1939DecodePlans():
+    """
+    A cache of decode plans keyed by the integer PGN. Plans are compiled from
+    the J1939 database the first time they are requested.
+    """
+    def __init__(self, j1939db, time_spns=()):
+        self.j1939db = j1939db
+        self.time_spns = frozenset(time_spns)
+        self.plans = {}
+
+    def get(self, pgn):
+        """
+        Return the decode plan for the PGN, or None if the PGN has no SPNs
+        defined in the database.
+        """
+        try:
+            return self.plans[pgn]
+        except KeyError:
+            plan = compile_pgn_plan(self.j1939db, pgn, self.time_spns)
+            self.plans[pgn] = plan
+            return plan
+
+    def compile_all(self):
+        """
+        Compile the plans for every PGN in the database.
+        """
+        for pgn in self.j1939db["J1939PGNdb"]:
+            self.get(pgn)
+
+    def clear(self):
+        self.plans = {}
+
+
+def _legacy_decode(j1939db, pgn, data_bytes, time_spns):
+    """
+    The per frame lookups used before decode plans were introduced. This is
+    only kept as the baseline for the benchmark below.
+    """
+    results = []
+    spn_list = j1939db["J1939PGNdb"][pgn]["SPNs"]
+    for spn in spn_list:
+        units = j1939db["J1939SPNdb"][spn]["Units"]
+        spn_start = j1939db["J1939SPNdb"][spn]["StartBit"]
+        spn_length = j1939db["J1939SPNdb"][spn]["SPNLength"]
+        scale = j1939db["J1939SPNdb"][spn]["Resolution"]
+        offset = j1939db["J1939SPNdb"][spn]["Offset"]
+        high_value = j1939db["J1939SPNdb"][spn]["OperationalHigh"]
+        low_value = j1939db["J1939SPNdb"][spn]["OperationalLow"]
+        meaning = ""
+        if units == 'ASCII':
+            value = get_printable_chars(data_bytes)
+        elif (scale > 0 or scale == -3) and spn_length <= 64:
+            spn_data = data_bytes
+            while (spn_start+spn_length) > 64:
+                spn_start -= 64
+                spn_data = spn_data[8:]
+            if len(spn_data) < 8:
+                spn_data = bytes(list(spn_data) + [0xFF]*(8 - len(spn_data)))
+            if spn_length <= 8:
+                fmt = "B"
+                rev_fmt = "B"
+            elif spn_length <= 16:
+                fmt = ">H"
+                rev_fmt = "<H"
+            elif spn_length <= 32:
+                fmt = ">L"
+                rev_fmt = "<L"
+            else:
+                fmt = ">Q"
+                rev_fmt = "<Q"
+            shift = 64 - spn_start - spn_length
+            mask = 0
+            for m in range(spn_length):
+                mask += 1 << (63 - m - spn_start)
+            if scale <= 0:
+                scale = 1
+            decimal_value = struct.unpack(">Q",spn_data[0:8])[0] & mask
+            shifted_decimal = decimal_value >> shift
+            reversed_decimal = struct.unpack(fmt,struct.pack(rev_fmt, shifted_decimal))[0]
+            numerical_value = reversed_decimal * scale + offset
+            if numerical_value > high_value:
+                meaning = OUT_OF_RANGE_HIGH
+            elif numerical_value < low_value:
+                meaning = OUT_OF_RANGE_LOW
+            elif units == 'bit':
+                try:
+                    meaning = j1939db["J1939BitDecodings"][spn][int(numerical_value)].strip().capitalize()
+                except KeyError:
+                    meaning = ""
+            if scale >= 1 or spn in time_spns:
+                value = "{:d}".format(int(numerical_value))
+            else:
+                value = "{:0.3f}".format(numerical_value)
+        else:
+            value = repr(data_bytes)
+        results.append((spn, value, meaning))
+    return results
+
+def benchmark(j1939db, pgns=(61444, 61443, 65265, 65262, 65270, 65263), frames=20000):
+    """
+    Time the per frame cost of decoding SPNs with and without decode plans.
+    """
+    import random
+    time_spns = [959, 960, 961, 963, 962, 964]
+    pgns = [pgn for pgn in pgns if pgn in j1939db["J1939PGNdb"]]
+    messages = [(random.choice(pgns), bytes(random.randrange(256) for i in range(8)))
+                for n in range(frames)]
+
+    start_time = time.perf_counter()
+    for pgn, data_bytes in messages:
+        _legacy_decode(j1939db, pgn, data_bytes, time_spns)
+    legacy_time = time.perf_counter() - start_time
+
+    plans = J1939DecodePlans(j1939db, time_spns)
+    start_time = time.perf_counter()
+    for pgn, data_bytes in messages:
+        decode_pgn(plans.get(pgn), data_bytes)
+    plan_time = time.perf_counter() - start_time
+
+    print("Decoded {} frames from PGNs {}".format(frames, pgns))
+    print("Per frame lookups: {:8.2f} us/frame".format(1e6 * legacy_time / frames))
+    print("Decode plans:      {:8.2f} us/frame".format(1e6 * plan_time / frames))
+    print("Speed up:          {:8.2f}x".format(legacy_time / plan_time))
+
+if __name__ == '__main__':
+    from J1939Database import load_j1939db
+    benchmark(load_j1939db("J1939db.json"))
@@ -0,0 +1,103 @@
+"""
+Decoding of the J1939 diagnostic messages: the diagnostic trouble codes
+(DTCs) of DM01 and DM02 and the freeze frames of DM04.
+
+These functions only need the J1939 database, so the J1939 tab and the
+headless batch decoder share them.
+"""
+import struct
+from RP1210Functions import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+DM01_PGN = 65226 # Active DTCs
+DM02_PGN = 65227 # Previously active DTCs
+DM04_PGN = 65229 # Freeze frame parameters
+DM_NAMES = {DM01_PGN: "DM01",
+            DM02_PGN: "DM02",
+            DM04_PGN: "DM04"}
+
+def get_freeze_frame(j1939db, sa, data):
+    idx = 0
+    data_length = len(data)
+    logger.debug("DM04 data length is {} bytes.".format(data_length))
+    dm4_dict = {}
+    while idx < data_length - 1:
+        length = data[idx] + 1 #Need to include the length code.
+        # SPN is Suspect Parameter Number from J1939
+        # FMI is Failure Mode Indicator from J1939 docs
+        # CM is conversion mode from DM01 definition in J1939-73
+        # OC is the occurrence count
+        SPN, FMI, CM, OC = get_SPN_FMI_CM_OC(data[idx + 1:idx + 5]) 
+        dm_dict = build_dtc_dict(j1939db, sa, SPN, FMI, OC, CM)
+        dm_dict["Raw Hexadecimal"] = bytes_to_hex_string(data[idx:idx+length])
+
+        engine_torque_mode = j1939db["J1939BitDecodings"][899][data[idx + 5]].strip().capitalize()
+        boost = "{:0.1f} psi".format(data[idx+ 6] * 0.290075476) 
+        engine_speed = "{:0.3f} rpm".format(struct.unpack("<H", data[idx+7:idx+9])[0] * 0.125 )
+        engine_load = "{:0.1f} %".format(data[idx+9])
+        coolant_temp = "{:0.1f} deg F".format(data[idx+10] * 1.8 - 40 )
+        vehicle_speed = "{:0.2f} mph".format(struct.unpack("<H", data[idx+11:idx+13])[0] * 0.00242723046875 )
+        manufacture_specific = bytes_to_hex_string(data[idx+13:idx+length])
+        dm_dict["Freeze Frame Data"] =  "Engine Torque Mode (SPN 899): " + engine_torque_mode + "\n"
+        dm_dict["Freeze Frame Data"] += "Boost (SPN 102): " + boost + "\n"
+        dm_dict["Freeze Frame Data"] += "Engine Speed (SPN 190): " + engine_speed + "\n"
+        dm_dict["Freeze Frame Data"] += "Engine Load (SPN 92): " + engine_load + "\n"
+        dm_dict["Freeze Frame Data"] += "Engine Coolant Temp. (SPN 110): " + coolant_temp + "\n"
+        dm_dict["Freeze Frame Data"] += "Vehicle Speed (SPN 84): " + vehicle_speed + "\n"
+        if length > 13:
+            dm_dict["Freeze Frame Data"] += "Additional Manufacture Codes: " + manufacture_specific
+
+        dm4_dict[(sa,idx)] = dm_dict
+        idx += length
+
+        logger.debug(dm_dict)
+        logger.debug("New index is {}".format(idx))
+    return dm4_dict
+
+def get_SPN_FMI_CM_OC(data):
+    SPN = data[0] + data[1]*256 + ((data[2] & 0xE0) >> 5)*65536
+    FMI = data[2] & 0x1F
+    conversion_method = data[3] & 0x80
+    occurance_count = data[3] & 0x7F
+    return (SPN, FMI, conversion_method, occurance_count)
+
+def build_dtc_dict(j1939db, sa, SPN, FMI, occurance_count, conversion_method):
+    dm_dict = { "SA":"{:3d}".format(sa), 
+                "SPN": "{:5d}".format(SPN), 
+                "FMI": "{:2d}".format(FMI), 
+                "Count": "{:3d}".format(occurance_count), 
+                "CM": conversion_method}
+    try:
+        dm_dict["Suspect Parameter Number Label"] = j1939db["J1939SPNdb"][SPN]["Name"]
+    except KeyError:
+        dm_dict["Suspect Parameter Number Label"] = "Unknown Suspect Parameter Number"
+    try:
+        dm_dict["Source"] = j1939db["J1939SATabledb"][sa]
+    except KeyError:
+        dm_dict["Source"] = "Unknown Source"
+
+    dm_dict["FMI Meaning"] = j1939db["J1939FMITabledb"][FMI]["Name"]
+    dm_dict["FMI Severity"] = j1939db["J1939FMITabledb"][FMI]["Severity"]
+
+    return dm_dict
+
+def get_DM(j1939db, sa, data):
+    # We will start with the third byte since the Indicators Lamps are 
+    # taken care of by the SPN lookup
+    dtcs = {} #list to hold all the diagnostic trouble codes
+    byte_index = 2
+    while byte_index < len(data):
+        #SPNs are 19 bits long. See J1939-73.
+        try:
+            SPN, FMI, conversion_method, occurance_count = get_SPN_FMI_CM_OC(data[byte_index:byte_index+4])
+            dtc = build_dtc_dict(j1939db, sa, SPN, FMI, occurance_count, conversion_method)
+            dtc["Raw Hexadecimal"] = bytes_to_hex_string(data[byte_index:byte_index+4])
+            dtcs[repr((sa,byte_index-2))] = dtc
+            byte_index += 4
+        except IndexError:
+            break
+
+    return dtcs
+
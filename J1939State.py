@@ -0,0 +1,171 @@
+"""
+The latest state of every J1939 PGN and SPN from each source address.
+
+The records are kept in dictionaries keyed by packed integers, (pgn << 8) | sa
+and (spn << 8) | sa, like the shared state of J1939Worker, so a frame costs no
+string formatting or hashing of text keys. The tables read a record by column
+name, as they do for the dictionaries of the other tables, and the text of a
+cell is only formatted when the cell is drawn.
+
+Data packages that hold the records as dictionaries with string keys like
+repr((pgn, sa)) are turned back into records by import_pgn_records and
+import_spn_records.
+"""
+import base64
+from collections import OrderedDict
+from operator import attrgetter
+
+from RP1210Functions import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+def pgn_key(pgn, sa):
+    return (pgn << 8) | sa
+
+def spn_key(spn, sa):
+    return (spn << 8) | sa
+
+class PGNRecord():
+    """
+    A PGN from a source address: how often it was seen and its last data.
+    message_time and data_vda_time are the times the data last changed.
+    """
+    __slots__ = ("pgn", "sa", "count", "start_time", "last_time", "vda_time",
+                 "message_time", "data_vda_time", "data", "acronym", "label", "source")
+
+    def __init__(self, pgn, sa, start_time, acronym, label, source):
+        self.pgn = pgn
+        self.sa = sa
+        self.count = 0
+        self.start_time = start_time
+        self.last_time = start_time
+        self.vda_time = 0
+        self.message_time = start_time
+        self.data_vda_time = 0
+        self.data = b''
+        self.acronym = acronym
+        self.label = label
+        self.source = source
+
+    @property
+    def key(self):
+        return (self.pgn << 8) | self.sa
+
+    def __getitem__(self, name):
+        return PGN_FIELDS[name](self)
+
+    def period(self):
+        if self.count:
+            return 1000 * (self.last_time - self.start_time) / self.count
+        return 0
+
+    @classmethod
+    def from_dict(cls, record):
+        self = cls(int(record["PGN"]), int(record["SA"]), record.get("Start Time", 0),
+                   record.get("Acronym", "Unknown"),
+                   record.get("Parameter Group Label", "Not Provided"),
+                   record.get("Source", "Reserved"))
+        self.count = record.get("Num", 0)
+        self.message_time = record.get("Message Time", self.start_time)
+        self.last_time = self.start_time + self.count * float(record.get("Period (ms)", 0)) / 1000
+        self.vda_time = record.get("VDATime", 0)
+        self.data_vda_time = record.get("VDATime List", 0)
+        if "Bytes" in record:
+            self.data = bytes(record["Bytes"])
+        else:
+            self.data = base64.b64decode(record.get("Message List", "").encode('ascii'))
+        return self
+
+class SPNRecord():
+    """
+    The last value of an SPN from a source address.
+    """
+    __slots__ = ("spn", "sa", "pgn", "value", "last_value", "meaning",
+                 "units", "acronym", "source", "label")
+
+    def __init__(self, spn, sa, pgn, units, acronym, source, label):
+        self.spn = spn
+        self.sa = sa
+        self.pgn = pgn
+        self.value = ""
+        self.last_value = ""
+        self.meaning = ""
+        self.units = units
+        self.acronym = acronym
+        self.source = source
+        self.label = label
+
+    @property
+    def key(self):
+        return (self.spn << 8) | self.sa
+
+    def __getitem__(self, name):
+        return SPN_FIELDS[name](self)
+
+    @classmethod
+    def from_dict(cls, record):
+        self = cls(int(record["SPN"]), int(record["SA"]), int(record["PGN"]),
+                   record.get("Units", ""), record.get("Acronym", ""),
+                   record.get("Source", "Unknown"),
+                   record.get("Suspect Parameter Number Label", ""))
+        self.value = record.get("Value", "")
+        self.last_value = record.get("Last Value", "")
+        self.meaning = record.get("Meaning", "")
+        return self
+
+# The columns of the records. The names are the keys the records had when
+# they were dictionaries.
+PGN_FIELDS = OrderedDict([
+    ("Num", attrgetter("count")),
+    ("Start Time", attrgetter("start_time")),
+    ("Acronym", attrgetter("acronym")),
+    ("Parameter Group Label", attrgetter("label")),
+    ("Source", attrgetter("source")),
+    ("PGN", lambda record: "{:6d}".format(record.pgn)),
+    ("SA", lambda record: "{:3d}".format(record.sa)),
+    ("Message Time", attrgetter("message_time")),
+    ("VDATime List", attrgetter("data_vda_time")),
+    ("Raw Hexadecimal", lambda record: bytes_to_hex_string(record.data)),
+    ("Message Count", lambda record: "{:12d}".format(record.count)),
+    ("VDATime", attrgetter("vda_time")),
+    ("Period (ms)", lambda record: "{:10.2f}".format(record.period())),
+    ("Bytes", attrgetter("data")),
+    ])
+
+SPN_FIELDS = OrderedDict([
+    ("Value", attrgetter("value")),
+    ("Last Value", attrgetter("last_value")),
+    ("Units", attrgetter("units")),
+    ("Meaning", attrgetter("meaning")),
+    ("Acronym", attrgetter("acronym")),
+    ("PGN", lambda record: "{:6d}".format(record.pgn)),
+    ("SA", lambda record: "{:3d}".format(record.sa)),
+    ("Source", attrgetter("source")),
+    ("SPN", lambda record: "{:5d}".format(record.spn)),
+    ("Suspect Parameter Number Label", attrgetter("label")),
+    ])
+
+def import_pgn_records(records):
+    """
+    Return the PGN records of a data package as PGNRecords keyed by
+    (pgn << 8) | sa. Records that are PGNRecords already are kept.
+    """
+    j1939_unique_ids = OrderedDict()
+    for record in records.values():
+        if not isinstance(record, PGNRecord):
+            record = PGNRecord.from_dict(record)
+        j1939_unique_ids[record.key] = record
+    return j1939_unique_ids
+
+def import_spn_records(records):
+    """
+    Return the SPN records of a data package as SPNRecords keyed by
+    (spn << 8) | sa. Records that are SPNRecords already are kept.
+    """
+    unique_spns = OrderedDict()
+    for record in records.values():
+        if not isinstance(record, SPNRecord):
+            record = SPNRecord.from_dict(record)
+        unique_spns[record.key] = record
+    return unique_spns
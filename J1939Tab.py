@@ -42,6 +42,10 @@ from collections import OrderedDict
 from RP1210Functions import *
 from TableModel.TableModel import *
 from ISO15765 import *
+from J1939DecodePlan import *
+from J1939Diagnostics import *
+from J1939State import *
+from RingBuffer import *
 
 import logging
 logger = logging.getLogger(__name__)
@@ -52,11 +56,10 @@ class J1939Tab(QWidget):
         self.root = parent
         self.tabs = tabs
         
-        self.iso_queue = queue.Queue()
+        self.iso_queue = FrameRingBuffer(1000)
         self.iso_recorder = ISO15765Driver(self.root, self.iso_queue)
 
         self.previous_spn_length = 0
-        self.previous_uds_length = 0
         self.reset_data()
 
         self.spn_needs_updating = True
@@ -70,6 +73,7 @@ class J1939Tab(QWidget):
         
         self.j1939db = self.root.j1939db
         self.time_spns = [959, 960, 961, 963, 962, 964]
+        self.decode_plans = J1939DecodePlans(self.j1939db, self.time_spns)
         
         
 
@@ -114,7 +118,7 @@ class J1939Tab(QWidget):
     def get_pgn_label(self, pgn):
 
         try:
-            return self.j1939db["J1939PGNdb"]["{}".format(pgn)]["Name"]
+            return self.j1939db["J1939PGNdb"][pgn]["Name"]
         except KeyError:
             
             return "Not Provided"
@@ -124,7 +128,6 @@ class J1939Tab(QWidget):
         self.ecm_time = {}
         self.battery_potential = {}
         self.speed_record = {}
-        self.pgn_rows = []
         self.j1939_unique_ids = OrderedDict()
         self.unique_spns = OrderedDict()
         self.active_trouble_codes = {}
@@ -342,28 +345,20 @@ class J1939Tab(QWidget):
     def fill_uds_table(self):
         #self.root.data_package["UDS Messages"].update(self.iso_recorder.uds_messages)
         if self.tabs.currentIndex() == self.tabs.indexOf(self.uds_tab):
-            if len(self.iso_recorder.uds_messages) > self.previous_uds_length:
-                self.previous_uds_length = len(self.iso_recorder.uds_messages)
-                self.uds_data_model.aboutToUpdate()
-                self.uds_data_model.setDataDict(self.iso_recorder.uds_messages)
-                self.uds_data_model.signalUpdate()
-                self.uds_table.resizeRowsToContents()
-                for r in self.uds_resizable_cols:
-                    self.uds_table.resizeColumnToContents(r)
+            start = self.uds_data_model.rowCount()
+            if self.uds_data_model.appendRows():
+                self.fit_new_rows(self.uds_table, self.uds_table_proxy, self.uds_data_model, start,
+                                  self.uds_resizable_cols)
                 self.uds_table.scrollToBottom()
 
     def fill_dm01_table(self):
         #if self.tabs.currentIndex() == self.tabs.indexOf(self.j1939_dtc_tab):
-        self.dm01_data_model.aboutToUpdate()
-        self.dm01_data_model.signalUpdate()
         self.dm01_table.resizeColumnsToContents()
         self.dm01_table.resizeRowsToContents()
         self.root.data_package["Diagnostic Codes"]["DM01"] = self.active_trouble_codes
 
     def fill_dm02_table(self):
         #if self.tabs.currentIndex() == self.tabs.indexOf(self.j1939_dtc_tab):
-        self.dm02_data_model.aboutToUpdate()
-        self.dm02_data_model.signalUpdate()
         self.dm02_table.resizeColumnsToContents()
         self.dm02_table.resizeRowsToContents()
         self.root.data_package["Diagnostic Codes"]["DM02"] = self.previous_trouble_codes
@@ -371,8 +366,6 @@ class J1939Tab(QWidget):
 
     def fill_dm04_table(self):
         #if self.tabs.currentIndex() == self.tabs.indexOf(self.j1939_dm04_tab):
-        self.dm04_data_model.aboutToUpdate()
-        self.dm04_data_model.signalUpdate()
         self.dm04_table.resizeColumnsToContents()
         self.dm04_table.resizeRowsToContents()
         #for row in range(self.dm04_data_model.rowCount()):
@@ -381,15 +374,26 @@ class J1939Tab(QWidget):
 
     def fill_spn_table(self):
         if self.tabs.currentIndex() == self.tabs.indexOf(self.j1939_spn_tab):
-            if len(self.unique_spns) > self.previous_spn_length:
-                self.previous_spn_length = len(self.unique_spns)
-                self.spn_data_model.aboutToUpdate()
-                self.spn_data_model.signalUpdate()
-                self.spn_table.resizeRowsToContents()
-                for r in self.spn_resizable_rows:
-                    self.spn_table.resizeColumnToContents(r)
+            if self.spn_data_model.rowCount() > self.previous_spn_length:
+                self.fit_new_rows(self.spn_table, self.spn_table_proxy, self.spn_data_model,
+                                  self.previous_spn_length, self.spn_resizable_rows)
+                self.previous_spn_length = self.spn_data_model.rowCount()
         #self.spn_table.scrollToBottom()
 
+    def fit_new_rows(self, table, proxy, model, start, columns):
+        """
+        Fit the rows of model from row start on and widen the columns that
+        are too narrow for them, without measuring the rows that were there
+        before.
+        """
+        for row in range(start, model.rowCount()):
+            view_row = proxy.mapFromSource(model.index(row, 0)).row()
+            table.resizeRowToContents(view_row)
+            for column in columns:
+                width = table.sizeHintForIndex(proxy.index(view_row, column)).width()
+                if width > table.columnWidth(column):
+                    table.setColumnWidth(column, width)
+
     def clear_j1939_table(self):
 
         self.pgn_data_model.beginResetModel()
@@ -401,6 +405,7 @@ class J1939Tab(QWidget):
         self.unique_spns = OrderedDict()
         self.spn_data_model.setDataDict(self.unique_spns)
         self.spn_data_model.endResetModel()
+        self.previous_spn_length = 0
         
         self.dm01_data_model.beginResetModel()
         self.active_trouble_codes = {}
@@ -421,28 +426,36 @@ class J1939Tab(QWidget):
         self.iso_recorder.uds_messages = OrderedDict()
         self.uds_data_model.setDataDict(self.iso_recorder.uds_messages)
         self.uds_data_model.endResetModel()
+
+        self.share_data_package()
+
+    def share_data_package(self):
+        """
+        Put the tables themselves in the data package, so it is current
+        without merging them into it after every message.
+        """
+        self.root.data_package["J1939 Parameter Group Numbers"] = self.j1939_unique_ids
+        self.root.data_package["J1939 Suspect Parameter Numbers"] = self.unique_spns
+        self.root.data_package["UDS Messages"] = self.iso_recorder.uds_messages
         
     def fill_j1939_table(self, j1939_buffer):
         #See The J1939 Message from RP1210_ReadMessage in RP1210
+        # The data can be a memoryview of a ring buffer slot, so it is only
+        # valid during this call. The payload is copied when it changed.
         current_time = j1939_buffer['current_time']
         rx_buffer = j1939_buffer['data']
         try:
-            vda_time = struct.unpack(">L", rx_buffer[0:4])[0]
-            pgn = rx_buffer[5] + (rx_buffer[6] << 8) + (rx_buffer[7] << 16)
-            pri = rx_buffer[8] # how/priority
-            sa = rx_buffer[9] #Source Address
-            da = rx_buffer[10] #Destination Address
-        except (struct.error, IndexError):
+            vda_time, echo, pgn, pri, sa, da = parse_j1939_header(rx_buffer)
+        except struct.error:
             logger.debug(traceback.format_exc())
             return
 
         if pgn == 0xDA00: #ISO
-            self.iso_queue.put((pgn, pri, sa, da, rx_buffer[11:]))
+            self.iso_queue.put(current_time, vda_time, rx_buffer)
             self.iso_recorder.read_message(True)
-            self.root.data_package["UDS Messages"].update(self.iso_recorder.uds_messages)
             return
         
-        if rx_buffer[4] == 1: #Echo message
+        if echo == 1: #Echo message
             # Return when the VDA is the one that sent the message. 
             # The message gets logged, but not displayed in the table
             return 
@@ -451,7 +464,44 @@ class J1939Tab(QWidget):
             # Return when we aren't interested in the data.
             return
 
-        pgn_key = repr((pgn,sa))
+        data_bytes = rx_buffer[J1939_HEADER_LENGTH:]
+        self.update_j1939_message(current_time, vda_time, pgn, sa, data_bytes)
+
+    def fill_j1939_state(self, changes):
+        """
+        Render the PGN and SPN records that changed in the shared state of the
+        J1939 worker process. The worker has already counted and decoded the
+        messages.
+        """
+        pgn_changes, spn_changes = changes
+        decoded = {}
+        for spn, sa, pgn, value, meaning in spn_changes:
+            decoded.setdefault((pgn, sa), []).append((spn, value, meaning))
+        for pgn, sa, count, start_time, current_time, vda_time, data_bytes in pgn_changes:
+            if pgn in self.pgns_to_not_decode:
+                continue
+            try:
+                new_count = count - self.j1939_unique_ids[(pgn << 8) | sa].count
+            except KeyError:
+                new_count = count
+            spns = decoded.get((pgn, sa))
+            plan = self.decode_plans.get(pgn)
+            if spns is not None and (plan is None or len(spns) != len(plan)):
+                # Some values did not fit in the shared state.
+                spns = None
+            if new_count > 0:
+                self.update_j1939_message(current_time, vda_time, pgn, sa, data_bytes,
+                                          new_count, start_time, spns)
+
+    def update_j1939_message(self, current_time, vda_time, pgn, sa, data_bytes, count=1, start_time=None, decoded=None):
+        """
+        Update the tables with count messages of a PGN from a source address,
+        the last of which had data_bytes. decoded is the list of (spn, value,
+        meaning) for the data if it was decoded already.
+        """
+        if start_time is None:
+            start_time = current_time
+        key = (pgn << 8) | sa
         source_key = "{} on J1939".format(self.get_sa_name(sa))
         if sa not in self.battery_potential.keys():
             self.battery_potential[sa] = []
@@ -475,89 +525,70 @@ class J1939Tab(QWidget):
         
          
 
-        data_bytes = rx_buffer[11:]
-        
-        try:
-            self.j1939_unique_ids[pgn_key]["Num"] += 1
-            previous_data_bytes = base64.b64decode(self.j1939_unique_ids[pgn_key]["Message List"].encode('ascii'))
-        except KeyError:
-            previous_data_bytes = base64.b64encode(b'').decode()
-            self.j1939_unique_ids[pgn_key] = {"Num": 1}
-            self.pgn_rows = list(self.j1939_unique_ids.keys())
-            #self.j1939_unique_ids[pgn_key]["Table Key"] = pgn_key
-            self.j1939_unique_ids[pgn_key]["Start Time"] = current_time
-            self.j1939_unique_ids[pgn_key]["Message Time"] = current_time
-            self.j1939_unique_ids[pgn_key]["Message List"] = base64.b64encode(data_bytes).decode()
-            self.j1939_unique_ids[pgn_key]["VDATime List"] = vda_time
+        # The last payload is kept as bytes, so a repeated frame costs one
+        # comparison. The SPNs are decoded once for each frame that changed.
+        record = self.j1939_unique_ids.get(key)
+        new_pgn = record is None
+        if new_pgn:
             try:
-                self.j1939_unique_ids[pgn_key]["Acronym"] = self.j1939db["J1939PGNdb"]["{}".format(pgn)]["Label"]
+                acronym = self.j1939db["J1939PGNdb"][pgn]["Label"]
             except KeyError:
-                self.j1939_unique_ids[pgn_key]["Acronym"] = "Unknown"
+                acronym = "Unknown"
             try:
-                self.j1939_unique_ids[pgn_key]["Parameter Group Label"] = self.j1939db["J1939PGNdb"]["{}".format(pgn)]["Name"]
+                label = self.j1939db["J1939PGNdb"][pgn]["Name"]
             except KeyError:
-                self.j1939_unique_ids[pgn_key]["Parameter Group Label"] = "Not Provided"
+                label = "Not Provided"
             try:
-                self.j1939_unique_ids[pgn_key]["Source"] = self.j1939db["J1939SATabledb"]["{}".format(sa)]
+                source = self.j1939db["J1939SATabledb"][sa]
             except KeyError:
-                self.j1939_unique_ids[pgn_key]["Source"] = "Reserved"
-            self.look_up_spns(pgn, sa, data_bytes)
-
-        self.j1939_unique_ids[pgn_key]["Message Count"] = "{:12d}".format(self.j1939_unique_ids[pgn_key]["Num"])
-        self.j1939_unique_ids[pgn_key]["VDATime"] = vda_time
-        self.j1939_unique_ids[pgn_key]["PGN"] = "{:6d}".format(pgn)
-        self.j1939_unique_ids[pgn_key]["SA"] = "{:3d}".format(sa)
-        self.j1939_unique_ids[pgn_key]["Bytes"] = data_bytes
-        self.j1939_unique_ids[pgn_key]["Raw Hexadecimal"] = bytes_to_hex_string(data_bytes)
-        self.j1939_unique_ids[pgn_key]["Period (ms)"] = "{:10.2f}".format(1000 * (current_time - self.j1939_unique_ids[pgn_key]["Start Time"])/self.j1939_unique_ids[pgn_key]["Num"])
-        
-        if self.j1939_unique_ids[pgn_key]["Num"] == 1:
+                source = "Reserved"
+            record = PGNRecord(pgn, sa, start_time, acronym, label, source)
+            self.j1939_unique_ids[key] = record
+            changed = True
+        else:
+            changed = record.data != data_bytes
+        record.count += count
+        record.last_time = current_time
+        record.vda_time = vda_time
+
+        if changed:
+            # The data can be a memoryview of a ring buffer slot, so copy it.
+            data_bytes = bytes(data_bytes)
+            record.data = data_bytes
+            record.message_time = current_time
+            record.data_vda_time = vda_time
+        
+        if new_pgn:
             #logger.debug("Adding Row to PGN Table:")
-            #logger.debug(self.j1939_unique_ids[pgn_key])
-            self.pgn_data_model.aboutToUpdate()
-            self.pgn_data_model.setDataDict(self.j1939_unique_ids)
-            self.pgn_data_model.signalUpdate()
-            self.j1939_id_table.resizeRowsToContents()     
+            #logger.debug(self.j1939_unique_ids[key])
+            start = self.pgn_data_model.rowCount()
+            self.pgn_data_model.appendRows([key])
+            self.fit_new_rows(self.j1939_id_table, self.pgn_table_proxy, self.pgn_data_model, start,
+                              self.pgn_resizable_rows)
             self.j1939_id_table.scrollToBottom()
-            for r in self.pgn_resizable_rows:
-                self.j1939_id_table.resizeColumnToContents(r)
 
             QCoreApplication.processEvents()
 
         elif self.add_message_button.isChecked():
            
-            row = self.pgn_rows.index(pgn_key)
-            col = self.j1939_id_table_columns.index("Message Count")
-            idx = self.pgn_data_model.index(row, col)
-            entry = self.j1939_unique_ids[pgn_key]["Message Count"]
-            self.pgn_data_model.setData(idx, entry)
-                
-            col = self.j1939_id_table_columns.index("Period (ms)")
-            idx = self.pgn_data_model.index(row, col)
-            entry = self.j1939_unique_ids[pgn_key]["Period (ms)"]
-            self.pgn_data_model.setData(idx, entry)
-            
-            if not base64.b64encode(data_bytes).decode() == self.j1939_unique_ids[pgn_key]["Message List"]:
-                self.j1939_unique_ids[pgn_key]["Message Time"] = current_time
-                self.j1939_unique_ids[pgn_key]["Message List"] = base64.b64encode(data_bytes).decode()
-                self.j1939_unique_ids[pgn_key]["VDATime List"] = vda_time
-                self.look_up_spns(pgn, sa, data_bytes)
-
-                col = self.j1939_id_table_columns.index("Raw Hexadecimal")
-                idx = self.pgn_data_model.index(row, col)
-                entry = self.j1939_unique_ids[pgn_key]["Raw Hexadecimal"]
-                self.pgn_data_model.setData(idx, entry)
-        
-        # Update if something has changed or if the time or voltage PGN comes in.
-        if  data_bytes != previous_data_bytes or pgn in [65254, 65271]:
-            self.look_up_spns(pgn, sa, data_bytes)
+            # The views are told about the changed cells a few times a second.
+            self.pgn_data_model.keyChanged(key, "Message Count")
+            self.pgn_data_model.keyChanged(key, "Period (ms)")
+            if changed:
+                self.pgn_data_model.keyChanged(key, "Raw Hexadecimal")
+        
+        if changed:
+            self.look_up_spns(pgn, sa, data_bytes, decoded)
+        # The time PGN also updates the difference to the PC time when it
+        # repeats.
+        if changed or pgn == 65254:
             if pgn == 65254:  #Time / Date PGN    
-                seconds = int(self.unique_spns[repr((959, sa))]["Value"])
-                minutes = int(self.unique_spns[repr((960, sa))]["Value"])
-                hours   = int(self.unique_spns[repr((961, sa))]["Value"])
-                month   = int(self.unique_spns[repr((963, sa))]["Value"])
-                day     = int(self.unique_spns[repr((962, sa))]["Value"])
-                year    = int(self.unique_spns[repr((964, sa))]["Value"])
+                seconds = int(self.unique_spns[spn_key(959, sa)].value)
+                minutes = int(self.unique_spns[spn_key(960, sa)].value)
+                hours   = int(self.unique_spns[spn_key(961, sa)].value)
+                month   = int(self.unique_spns[spn_key(963, sa)].value)
+                day     = int(self.unique_spns[spn_key(962, sa)].value)
+                year    = int(self.unique_spns[spn_key(964, sa)].value)
                 time_struct = time.strptime("{:02d} {:02d} {} ".format(day, month, year) + 
                     "{:02d} {:02d} {:02d}".format(hours, minutes, seconds), "%d %m %Y %H %M %S")
             
@@ -568,327 +599,122 @@ class J1939Tab(QWidget):
                 self.root.data_package["Time Records"][source_key]["PC Time minus ECM Time"] = time.time() - new_ecm_time
 
             elif pgn == 65259: #Component ID
-                make   = self.unique_spns[repr((586, sa))]["Value"]
-                model  = self.unique_spns[repr((587, sa))]["Value"]
-                serial = self.unique_spns[repr((588, sa))]["Value"]
-                unit   = self.unique_spns[repr((233, sa))]["Value"]
+                make   = self.unique_spns[spn_key(586, sa)].value
+                model  = self.unique_spns[spn_key(587, sa)].value
+                serial = self.unique_spns[spn_key(588, sa)].value
+                unit   = self.unique_spns[spn_key(233, sa)].value
                 self.root.data_package["Component Information"][source_key].update({"Make": make,
                                                                                     "Model":model,
                                                                                     "Serial":serial, 
                                                                                     "Unit":unit})
             elif pgn == 65260: #VIN
-                VIN = self.unique_spns[repr((237, sa))]["Value"].replace(b'\x00'.decode('ascii','ignore'),'') #Take out non-printable characters
+                VIN = self.unique_spns[spn_key(237, sa)].value.replace(b'\x00'.decode('ascii','ignore'),'') #Take out non-printable characters
                 self.root.data_package["Component Information"][source_key].update({"VIN": VIN})
             elif pgn == 65242: #Software ID
-                #num_fields = self.unique_spns[repr((965, sa))]["Value"]
-                software = self.unique_spns[repr((234, sa))]["Value"].replace(b'\x00'.decode('ascii','ignore'),'') #Take out non-printable characters
+                #num_fields = self.unique_spns[spn_key(965, sa)].value
+                software = self.unique_spns[spn_key(234, sa)].value.replace(b'\x00'.decode('ascii','ignore'),'') #Take out non-printable characters
                 self.root.data_package["Component Information"][source_key].update({"Software": software})
             elif pgn == 65253:  # Engine Hours / Revolutions
-                if "Out" not in self.unique_spns[repr((247,sa))]["Meaning"]: 
+                if "Out" not in self.unique_spns[spn_key(247, sa)].meaning: 
                     # The value is not out of range
-                    val = float(self.unique_spns[repr((247,sa))]["Value"])
-                    units = self.unique_spns[repr((247,sa))]["Units"]
+                    val = float(self.unique_spns[spn_key(247, sa)].value)
+                    units = self.unique_spns[spn_key(247, sa)].units
                     self.root.data_package["ECU Time Information"][source_key].update({"Total Engine Hours of Operation":"{:0.2f} {}".format(val,units)})
             
             elif pgn == 65255:  # Vehicle Hours
-                if "Out" not in self.unique_spns[repr((246,sa))]["Meaning"]: 
+                if "Out" not in self.unique_spns[spn_key(246, sa)].meaning: 
                     # The value is not out of range
-                    val = float(self.unique_spns[repr((246,sa))]["Value"])
-                    units = self.unique_spns[repr((246,sa))]["Units"]
+                    val = float(self.unique_spns[spn_key(246, sa)].value)
+                    units = self.unique_spns[spn_key(246, sa)].units
                     self.root.data_package["ECU Time Information"][source_key].update({"Total Vehicle Hours":"{:0.2f} {}".format(val,units)})
             
             elif pgn == 65248:  # Total Vehicle Distance
-                if "Out" not in self.unique_spns[repr((245,sa))]["Meaning"]: 
+                if "Out" not in self.unique_spns[spn_key(245, sa)].meaning: 
                     # The value is not out of range
-                    val = float(self.unique_spns[repr((245,sa))]["Value"])
-                    units = self.unique_spns[repr((245,sa))]["Units"]
+                    val = float(self.unique_spns[spn_key(245, sa)].value)
+                    units = self.unique_spns[spn_key(245, sa)].units
                     self.root.data_package["Distance Information"][source_key].update({"Total Vehicle Distance":"{:0.2f} {}".format(val,units)})
             
             elif pgn == 65217:  # High Resolution Distance
-                if "Out" not in self.unique_spns[repr((917,sa))]["Meaning"]: 
+                if "Out" not in self.unique_spns[spn_key(917, sa)].meaning: 
                     # The value is not out of range
-                    val = float(self.unique_spns[repr((917,sa))]["Value"])
-                    units = self.unique_spns[repr((917,sa))]["Units"]
+                    val = float(self.unique_spns[spn_key(917, sa)].value)
+                    units = self.unique_spns[spn_key(917, sa)].units
                     if "METER" in units.upper():
                         val = val * 0.000621371192 
                         units = "miles"
                     self.root.data_package["Distance Information"][source_key].update({"High Resolution Total Vehicle Distance":"{:0.4f} {}".format(val,units)})
             
             elif pgn == 65226: # DM01
-                self.dm01_data_model.aboutToUpdate()
-                self.active_trouble_codes.update(self.get_DM(sa, data_bytes))
-                self.dm01_data_model.setDataDict(self.active_trouble_codes)
+                dtcs = get_DM(self.j1939db, sa, data_bytes)
+                self.active_trouble_codes.update(dtcs)
+                self.dm01_data_model.appendRows()
+                self.dm01_data_model.keysChanged(dtcs)
                 self.fill_dm01_table()
 
             elif pgn == 65227: # DM02
-                self.dm02_data_model.aboutToUpdate()
-                self.previous_trouble_codes.update(self.get_DM(sa, data_bytes))
-                self.dm02_data_model.setDataDict(self.previous_trouble_codes)
+                dtcs = get_DM(self.j1939db, sa, data_bytes)
+                self.previous_trouble_codes.update(dtcs)
+                self.dm02_data_model.appendRows()
+                self.dm02_data_model.keysChanged(dtcs)
                 self.fill_dm02_table()
 
             elif pgn == 65229: # DM04
                 logger.debug("Found DM04.")
-                self.dm04_data_model.aboutToUpdate()
-                self.freeze_frame.update(self.get_freeze_frame(sa, data_bytes))
-                self.dm04_data_model.setDataDict(self.freeze_frame)
+                freeze_frame = get_freeze_frame(self.j1939db, sa, data_bytes)
+                self.freeze_frame.update(freeze_frame)
+                self.dm04_data_model.appendRows()
+                self.dm04_data_model.keysChanged(freeze_frame)
                 self.fill_dm04_table()
 
-        self.root.data_package["J1939 Parameter Group Numbers"].update(self.j1939_unique_ids)
-
-    def get_freeze_frame(self, sa, data):
-        idx = 0
-        data_length = len(data)
-        logger.debug("DM04 data length is {} bytes.".format(data_length))
-        dm4_dict = {}
-        while idx < data_length - 1:
-            length = data[idx] + 1 #Need to include the length code.
-            # SPN is Suspect Parameter Number from J1939
-            # FMI is Failure Mode Indicator from J1939 docs
-            # CM is conversion mode from DM01 definition in J1939-73
-            # OC is the occurrence count
-            SPN, FMI, CM, OC = self.get_SPN_FMI_CM_OC(data[idx + 1:idx + 5]) 
-            dm_dict = self.build_dtc_dict(sa, SPN, FMI, OC, CM)
-            dm_dict["Raw Hexadecimal"] = bytes_to_hex_string(data[idx:idx+length])
-                            
-            engine_torque_mode = self.j1939db["J1939BitDecodings"]["899"]["{:d}".format(data[idx + 5])].strip().capitalize()
-            boost = "{:0.1f} psi".format(data[idx+ 6] * 0.290075476) 
-            engine_speed = "{:0.3f} rpm".format(struct.unpack("<H", data[idx+7:idx+9])[0] * 0.125 )
-            engine_load = "{:0.1f} %".format(data[idx+9])
-            coolant_temp = "{:0.1f} deg F".format(data[idx+10] * 1.8 - 40 )
-            vehicle_speed = "{:0.2f} mph".format(struct.unpack("<H", data[idx+11:idx+13])[0] * 0.00242723046875 )
-            manufacture_specific = bytes_to_hex_string(data[idx+13:idx+length])
-            dm_dict["Freeze Frame Data"] =  "Engine Torque Mode (SPN 899): " + engine_torque_mode + "\n"
-            dm_dict["Freeze Frame Data"] += "Boost (SPN 102): " + boost + "\n"
-            dm_dict["Freeze Frame Data"] += "Engine Speed (SPN 190): " + engine_speed + "\n"
-            dm_dict["Freeze Frame Data"] += "Engine Load (SPN 92): " + engine_load + "\n"
-            dm_dict["Freeze Frame Data"] += "Engine Coolant Temp. (SPN 110): " + coolant_temp + "\n"
-            dm_dict["Freeze Frame Data"] += "Vehicle Speed (SPN 84): " + vehicle_speed + "\n"
-            if length > 13:
-                dm_dict["Freeze Frame Data"] += "Additional Manufacture Codes: " + manufacture_specific
-                                  
-            dm4_dict[(sa,idx)] = dm_dict
-            idx += length
-
-            logger.debug(dm_dict)
-            logger.debug("New index is {}".format(idx))
-        return dm4_dict
-
-    def get_SPN_FMI_CM_OC(self,data):
-        SPN = data[0] + data[1]*256 + ((data[2] & 0xE0) >> 5)*65536
-        FMI = data[2] & 0x1F
-        conversion_method = data[3] & 0x80
-        occurance_count = data[3] & 0x7F
-        return (SPN, FMI, conversion_method, occurance_count)
-    
-    def build_dtc_dict(self, sa, SPN, FMI, occurance_count, conversion_method):
-        dm_dict = { "SA":"{:3d}".format(sa), 
-                    "SPN": "{:5d}".format(SPN), 
-                    "FMI": "{:2d}".format(FMI), 
-                    "Count": "{:3d}".format(occurance_count), 
-                    "CM": conversion_method}
-        try:
-            dm_dict["Suspect Parameter Number Label"] = self.j1939db["J1939SPNdb"]["{}".format(SPN)]["Name"]
-        except KeyError:
-            dm_dict["Suspect Parameter Number Label"] = "Unknown Suspect Parameter Number"
-        try:
-            dm_dict["Source"] = self.j1939db["J1939SATabledb"]["{}".format(sa)]
-        except KeyError:
-            dm_dict["Source"] = "Unknown Source"
-
-        dm_dict["FMI Meaning"] = self.j1939db["J1939FMITabledb"]["{}".format(FMI)]["Name"]
-        dm_dict["FMI Severity"] = self.j1939db["J1939FMITabledb"]["{}".format(FMI)]["Severity"]
-
-        return dm_dict
-
-    def get_DM(self, sa, data):
-        # We will start with the third byte since the Indicators Lamps are 
-        # taken care of by the SPN lookup
-        dtcs = {} #list to hold all the diagnostic trouble codes
-        byte_index = 2
-        while byte_index < len(data):
-            #SPNs are 19 bits long. See J1939-73.
-            try:
-                SPN, FMI, conversion_method, occurance_count = self.get_SPN_FMI_CM_OC(data[byte_index:byte_index+4])
-                dtc = self.build_dtc_dict(sa, SPN, FMI, occurance_count, conversion_method)
-                dtc["Raw Hexadecimal"] = bytes_to_hex_string(data[byte_index:byte_index+4])
-                dtcs[repr((sa,byte_index-2))] = dtc
-                byte_index += 4
-            except IndexError:
-                break
-            
-        return dtcs
 
     def clear_voltage_history(self):
         for key in self.battery_potential:
             self.battery_potential[key]=[]
 
-    def look_up_spns(self, pgn, sa, data_bytes):
-        try:
-            spn_list = self.j1939db["J1939PGNdb"]["{}".format(pgn)]["SPNs"]
-        except KeyError:
-            return False #We don't have meaning for the data
+    def look_up_spns(self, pgn, sa, data_bytes, decoded=None):
         if pgn in self.pgns_to_not_decode:
             return False
-
-        for spn in spn_list:
-            spn_key = repr((spn, sa))
-            if spn_key in self.unique_spns:
-                spn_dict = self.unique_spns[spn_key]
-            else:
-                spn_dict = {}
-                spn_dict["Value"] = ""
-                spn_dict["Last Value"] = ""
-                spn_dict["Units"] = self.j1939db["J1939SPNdb"]["{}".format(spn)]["Units"]
-                spn_dict["Meaning"] = ""
-                #spn_dict["Value List"] = []
-                #spn_dict["Time List"] = []
-                #spn_dict["Table Key"] = repr(spn_key)
-                spn_dict["Acronym"] = self.j1939db["J1939PGNdb"]["{}".format(pgn)]["Label"]
-                spn_dict["PGN"] = "{:6d}".format(pgn)
-                spn_dict["SA"] = "{:3d}".format(sa)
-                spn_dict["Source"] = self.get_sa_name(sa)
-                spn_dict["SPN"] = "{:5d}".format(spn)
-                spn_dict["Suspect Parameter Number Label"] = self.j1939db["J1939SPNdb"]["{}".format(spn)]["Name"]
-                self.unique_spns[spn_key] = spn_dict
+        if decoded is None:
+            plan = self.decode_plans.get(pgn)
+            if plan is None:
+                return False #We don't have meaning for the data
+            decoded = decode_pgn(plan, data_bytes)
+
+        for spn, value, meaning in decoded:
+            key = (spn << 8) | sa
+            spn_record = self.unique_spns.get(key)
+            if spn_record is None:
+                spn_record = SPNRecord(spn, sa, pgn,
+                                       self.j1939db["J1939SPNdb"][spn]["Units"],
+                                       self.j1939db["J1939PGNdb"][pgn]["Label"],
+                                       self.get_sa_name(sa),
+                                       self.j1939db["J1939SPNdb"][spn]["Name"])
+                self.unique_spns[key] = spn_record
                 #self.spn_needs_updating = True
-                self.spn_data_model.aboutToUpdate()
-                self.spn_data_model.setDataDict(self.unique_spns)
+                self.spn_data_model.appendRows([key])
                 self.fill_spn_table()
 
-
-            spn_start = self.j1939db["J1939SPNdb"]["{}".format(spn)]["StartBit"]
-            spn_length = self.j1939db["J1939SPNdb"]["{}".format(spn)]["SPNLength"]
-            scale = self.j1939db["J1939SPNdb"]["{}".format(spn)]["Resolution"]
-            offset = self.j1939db["J1939SPNdb"]["{}".format(spn)]["Offset"]
-            high_value = self.j1939db["J1939SPNdb"]["{}".format(spn)]["OperationalHigh"]
-            low_value = self.j1939db["J1939SPNdb"]["{}".format(spn)]["OperationalLow"]
-            
-            if pgn == 65259: # Component ID
-                    comp_id_string = get_printable_chars(data_bytes)
-                    comp_id_list = comp_id_string.split("*")
-                    if spn == 586: # Make
-                        value = comp_id_list[0]
-                    elif spn == 587: # Model
-                        try:
-                            value = comp_id_list[1]
-                        except IndexError:
-                            value = ""
-                    elif spn == 588: #Serial Number
-                        try:
-                            value = comp_id_list[2]
-                        except IndexError:
-                            value = ""
-                    elif spn == 233: #Unit Number
-                        try:
-                            value = comp_id_list[3]
-                        except IndexError:
-                            value = ""
-            elif spn_dict["Units"] == 'ASCII':
-                value = get_printable_chars(data_bytes)
-            
-            elif scale > 0 or scale == -3:
-                while (spn_start+spn_length) > 64:
-                    spn_start -= 64
-                    data_bytes = data_bytes[8:]
-                if len(data_bytes) < 8:
-                    data_bytes = bytes(list(data_bytes) + [0xFF]*(8 - len(data_bytes)))
-
-                if spn_length <= 8:
-                        fmt = "B"
-                        rev_fmt = "B"
-                elif spn_length <= 16:
-                    fmt = ">H"
-                    rev_fmt = "<H"
-                elif spn_length <= 32:
-                    fmt = ">L"
-                    rev_fmt = "<L"
-                elif spn_length <= 64:
-                    fmt = ">Q"
-                    rev_fmt = "<Q"
-                shift = 64 - spn_start - spn_length
-                
-                #Create a mask one bit at a time
-                try:
-                    mask = 0
-                    for m in range(spn_length):
-                        mask += 1 << (63 - m - spn_start) 
-                except ValueError:
-                    logger.debug("Experienced a ValueError on the Bit Masks with SPN {}".format(spn))
-                    logger.debug("mask: {:08X}".format(mask))
-                    logger.debug("spn_start: {}".format(spn_start))
-                    logger.debug("spn_length: {}".format(spn_length))
-                    return
-                if scale <= 0:
-                    scale = 1
-                try:
-                    
-                    decimal_value = struct.unpack(">Q",data_bytes[0:8])[0] & mask
-                except:
-                    logger.debug(traceback.format_exc())
-                    return
-                #the < takes care of reverse byte orders
-                shifted_decimal = decimal_value >> shift
-                #reverse the byte order
-                reversed_decimal = struct.unpack(fmt,struct.pack(rev_fmt, shifted_decimal))[0]
-                numerical_value = reversed_decimal * scale + offset
-                
-                # Check for out of range numbers
-                if numerical_value > high_value:
-                    spn_dict["Meaning"] = "Out of Range - High"
-                elif numerical_value < low_value:
-                    spn_dict["Meaning"] = "Out of Range - Low"
-                elif spn_dict["Units"] == 'bit':
-                    spn_dict["Meaning"] = self.get_j1939_bits_decoded(spn,numerical_value)
-                else:
-                    spn_dict["Meaning"] = ""
-                
-                # Display the results
-                if scale >= 1 or spn in self.time_spns:
-                    try:
-
-                        value = "{:d}".format(int(numerical_value))
-                    except ValueError:
-                        value = "{}".format(numerical_value)
-                else:
-                    try:
-                        value = "{:0.3f}".format(numerical_value)
-                    except ValueError:
-                        value = "{}".format(numerical_value)
-
-            else: #Should not be converted to a decimal number
-                value = repr(data_bytes)
-
-            spn_dict["Value"] = value
-            self.unique_spns[spn_key].update(spn_dict)
-            
-            if spn_dict["Value"] != self.unique_spns[spn_key]["Last Value"]: #Check to see if the SPN value changed from last time.
-                self.spn_rows = list(self.unique_spns.keys())
-                row = self.spn_rows.index(spn_key)
-                col = self.spn_table_columns.index("Value")
-                idx = self.spn_data_model.index(row, col)
-                entry = str(spn_dict["Value"])
-                self.spn_data_model.setData(idx, entry)
-                
-                col = self.spn_table_columns.index("Meaning")
-                idx = self.spn_data_model.index(row, col)
-                entry = str(spn_dict["Meaning"])
-                self.spn_data_model.setData(idx, entry)
-                self.unique_spns[spn_key]["Last Value"] = spn_dict["Value"]
+            spn_record.value = value
+            spn_record.meaning = meaning
             
-            self.root.data_package["J1939 Suspect Parameter Numbers"].update(self.unique_spns)        
+            if spn_record.value != spn_record.last_value: #Check to see if the SPN value changed from last time.
+                self.spn_data_model.keyChanged(key, "Value")
+                self.spn_data_model.keyChanged(key, "Meaning")
+                spn_record.last_value = spn_record.value
             
             #logger.debug("Updated SPN Dictionary")
             #logger.debug(self.unique_spns[spn_key])
         return True
     def get_sa_name(self, sa):
         try:
-            return self.j1939db["J1939SATabledb"]["{}".format(sa)]
+            return self.j1939db["J1939SATabledb"][sa]
         except KeyError:
             return "Unknown"
 
     def get_j1939_bits_decoded(self, spn, value):
         try:
-            return self.j1939db["J1939BitDecodings"]["{}".format(spn)]["{:d}".format(int(value))].strip().capitalize()
+            return self.j1939db["J1939BitDecodings"][spn][int(value)].strip().capitalize()
         except KeyError:
             return ""
 
@@ -905,7 +731,6 @@ class J1939Responder(threading.Thread):
         threading.Thread.__init__(self)
         self.root = parent
         self.rxqueue = rxqueue #Sign up for a CAN queue
-        self.response_dict = self.root.data_package["J1939 Parameter Group Numbers"]
         self.rx_count = 0
         self.runSignal = True
         self.pgns_to_ignore = [65254]
@@ -929,9 +754,9 @@ class J1939Responder(threading.Thread):
             # if (current_time - previous_time) > 5:
             #     previous_time = current_time
             #     for pgn in periodic_responses_5000:
-            #         pgn_key = repr((pgn,0))
+            #         key = pgn_key(pgn, 0)
             #         try:
-            #             response = hex_string_to_bytes(self.response_dict[pgn_key]["Raw Hexadecimal"])
+            #             response = self.root.data_package["J1939 Parameter Group Numbers"][key].data
             #         except KeyError:
             #             logger.debug("PGN {} not in data set.".format(pgn_request))
             #             continue
@@ -949,10 +774,10 @@ class J1939Responder(threading.Thread):
                     if pgn_request in self.pgns_to_ignore:
                         continue
 
-                    pgn_key = repr((pgn_request,da_request)) #Switch SA to DA
+                    key = pgn_key(pgn_request, da_request) #Switch SA to DA
                     logger.debug("Received Request: {}".format(bytes_to_hex_string(rxmessage[6:])))
                     try:
-                        response = hex_string_to_bytes(self.response_dict[pgn_key]["Raw Hexadecimal"])
+                        response = self.root.data_package["J1939 Parameter Group Numbers"][key].data
                     except KeyError:
                         logger.debug("PGN {} not in data set.".format(pgn_request))
                         continue
@@ -0,0 +1,474 @@
+"""
+Read and decode J1939 in a separate process.
+
+The read threads, the decoders and the Qt GUI share one interpreter, so a busy
+network makes fill_j1939_table compete with RP1210ReadMessageThread and the
+repaints for the GIL. In the worker mode a child process connects its own
+J1939 client, reads the adapter and decodes every frame. It keeps the latest
+state of every PGN and SPN and publishes the ones that changed a few times a
+second to a shared memory block. The GUI process only reads the records that
+changed and renders them, so its work depends on the number of different
+messages on the network and not on the bus load.
+
+The shared memory has a header followed by fixed size PGN records and SPN
+records. Each record starts with a sequence number that is odd while the
+worker writes the record, so the GUI can tell a record that changed or that
+was read while it was written (a sequence lock).
+
+ISO 15765 messages need every frame and are passed to the GUI through a
+multiprocessing.Queue. Messages the GUI sends and filter changes go to the
+worker through another queue.
+"""
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+import traceback
+from array import array
+from multiprocessing import shared_memory
+
+from RP1210Functions import *
+from J1939DecodePlan import *
+from RingBuffer import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+STATE_MAGIC = b'J1939SHM'
+# magic, PGN records in use, SPN records in use, messages received, publish time
+STATE_HEADER = struct.Struct("<8sLLQd")
+SEQUENCE = struct.Struct("<L")
+# sequence, (PGN << 8) | SA, count, first PC time, last PC time, VDA time, data length
+PGN_RECORD = struct.Struct("<LLQddLH2x")
+PGN_DATA_SIZE = 1792 # Longest J1939 message
+PGN_SLOT_SIZE = PGN_RECORD.size + PGN_DATA_SIZE
+PGN_SLOTS = 1024
+# sequence, (SPN << 8) | SA, PGN, length of the value, length of the meaning
+SPN_RECORD = struct.Struct("<LLLHH")
+SPN_VALUE_SIZE = 256
+SPN_MEANING_SIZE = 64
+SPN_SLOT_SIZE = SPN_RECORD.size + SPN_VALUE_SIZE + SPN_MEANING_SIZE
+SPN_SLOTS = 8192
+STATE_SIZE = STATE_HEADER.size + PGN_SLOTS * PGN_SLOT_SIZE + SPN_SLOTS * SPN_SLOT_SIZE
+
+# Seconds between updates of the shared state
+PUBLISH_INTERVAL = 0.05
+# These are decoded even when the data did not change.
+ALWAYS_DECODE_PGNS = frozenset([65254, 65271])
+ISO_PGN = 0xDA00
+
+# Commands to the worker process
+WORKER_STOP = "Stop"
+WORKER_SEND = "Send"
+WORKER_FILTERS = "Filters"
+# Events from the worker process
+WORKER_CONNECTED = "Connected"
+WORKER_FAILED = "Failed"
+WORKER_ISO = "ISO"
+
+
+class SharedJ1939State():
+    """
+    The PGN and SPN state in shared memory. The worker process is the only
+    writer and the GUI process is the only reader.
+    """
+    def __init__(self, name=None):
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=STATE_SIZE)
+            STATE_HEADER.pack_into(self.memory.buf, 0, STATE_MAGIC, 0, 0, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            if bytes(self.memory.buf[:len(STATE_MAGIC)]) != STATE_MAGIC:
+                raise ValueError("{} is not a shared J1939 state.".format(name))
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+        self.pgn_start = STATE_HEADER.size
+        self.spn_start = self.pgn_start + PGN_SLOTS * PGN_SLOT_SIZE
+        # Writer
+        self.pgn_slots = {}
+        self.spn_slots = {}
+        self.sequences = {}
+        self.message_count = 0
+        # Reader
+        self.pgn_seen = array('L')
+        self.spn_seen = array('L')
+
+    # Writer methods
+    def begin_write(self, offset):
+        sequence = self.sequences.get(offset, 0) + 1
+        SEQUENCE.pack_into(self.buffer, offset, sequence)
+        return sequence
+
+    def end_write(self, offset, sequence):
+        self.sequences[offset] = sequence + 1
+        SEQUENCE.pack_into(self.buffer, offset, sequence + 1)
+
+    def write_pgn(self, key, count, start_time, last_time, vda_time, data):
+        """
+        Update the record of a PGN and source address. Returns False if there
+        is no room for a new record.
+        """
+        slot = self.pgn_slots.get(key)
+        if slot is None:
+            if len(self.pgn_slots) >= PGN_SLOTS:
+                return False
+            slot = len(self.pgn_slots)
+            self.pgn_slots[key] = slot
+        offset = self.pgn_start + slot * PGN_SLOT_SIZE
+        length = min(len(data), PGN_DATA_SIZE)
+        sequence = self.begin_write(offset)
+        PGN_RECORD.pack_into(self.buffer, offset, sequence, key, count, start_time, last_time, vda_time, length)
+        start = offset + PGN_RECORD.size
+        self.buffer[start:start + length] = data[:length]
+        self.end_write(offset, sequence)
+        return True
+
+    def write_spn(self, key, pgn, value, meaning):
+        """
+        Update the record of an SPN and source address. Returns False if the
+        text does not fit or there is no room for a new record.
+        """
+        value = value.encode('utf-8')
+        meaning = meaning.encode('utf-8')
+        if len(value) > SPN_VALUE_SIZE or len(meaning) > SPN_MEANING_SIZE:
+            return False
+        slot = self.spn_slots.get(key)
+        if slot is None:
+            if len(self.spn_slots) >= SPN_SLOTS:
+                return False
+            slot = len(self.spn_slots)
+            self.spn_slots[key] = slot
+        offset = self.spn_start + slot * SPN_SLOT_SIZE
+        sequence = self.begin_write(offset)
+        SPN_RECORD.pack_into(self.buffer, offset, sequence, key, pgn, len(value), len(meaning))
+        start = offset + SPN_RECORD.size
+        self.buffer[start:start + len(value)] = value
+        start += SPN_VALUE_SIZE
+        self.buffer[start:start + len(meaning)] = meaning
+        self.end_write(offset, sequence)
+        return True
+
+    def write_header(self, publish_time):
+        # The counts are written last, so new records are complete when the
+        # reader finds them.
+        STATE_HEADER.pack_into(self.buffer, 0, STATE_MAGIC, len(self.pgn_slots), len(self.spn_slots),
+                               self.message_count, publish_time)
+
+    # Reader methods
+    def read_header(self):
+        """
+        Return the number of PGN records, SPN records, the message count and
+        the time of the last update.
+        """
+        return STATE_HEADER.unpack_from(self.buffer)[1:]
+
+    def read_changes(self):
+        """
+        Return the PGN records and the SPN records that changed since the last
+        call. PGN records are (pgn, sa, count, start_time, last_time,
+        vda_time, data) tuples and SPN records are (spn, sa, pgn, value,
+        meaning) tuples. A record the worker is writing is picked up at the
+        next call.
+        """
+        pgn_count, spn_count, message_count, publish_time = self.read_header()
+        while len(self.pgn_seen) < pgn_count:
+            self.pgn_seen.append(0)
+        while len(self.spn_seen) < spn_count:
+            self.spn_seen.append(0)
+        buffer = self.buffer
+        pgn_changes = []
+        for slot in range(pgn_count):
+            offset = self.pgn_start + slot * PGN_SLOT_SIZE
+            sequence = SEQUENCE.unpack_from(buffer, offset)[0]
+            if sequence == self.pgn_seen[slot] or sequence & 1:
+                continue
+            (sequence, key, count, start_time, last_time,
+             vda_time, length) = PGN_RECORD.unpack_from(buffer, offset)
+            start = offset + PGN_RECORD.size
+            data = bytes(buffer[start:start + length])
+            if SEQUENCE.unpack_from(buffer, offset)[0] != sequence:
+                continue
+            self.pgn_seen[slot] = sequence
+            pgn_changes.append((key >> 8, key & 0xFF, count, start_time, last_time, vda_time, data))
+        spn_changes = []
+        for slot in range(spn_count):
+            offset = self.spn_start + slot * SPN_SLOT_SIZE
+            sequence = SEQUENCE.unpack_from(buffer, offset)[0]
+            if sequence == self.spn_seen[slot] or sequence & 1:
+                continue
+            sequence, key, pgn, value_length, meaning_length = SPN_RECORD.unpack_from(buffer, offset)
+            start = offset + SPN_RECORD.size
+            value = bytes(buffer[start:start + value_length])
+            start += SPN_VALUE_SIZE
+            meaning = bytes(buffer[start:start + meaning_length])
+            if SEQUENCE.unpack_from(buffer, offset)[0] != sequence:
+                continue
+            self.spn_seen[slot] = sequence
+            spn_changes.append((key >> 8, key & 0xFF, pgn,
+                                value.decode('utf-8', 'ignore'), meaning.decode('utf-8', 'ignore')))
+        return pgn_changes, spn_changes
+
+    def close(self, unlink=False):
+        self.buffer = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class J1939StateDecoder():
+    """
+    Keeps the latest state of every PGN and SPN in the worker process. Frames
+    are decoded when their data changes, like fill_j1939_table does, and the
+    records that changed are written to the shared state by publish.
+    """
+    def __init__(self, j1939db, state, time_spns=()):
+        self.decode_plans = J1939DecodePlans(j1939db, time_spns)
+        self.state = state
+        self.pgns = {}
+        self.spns = {}
+        self.changed_pgns = set()
+        self.changed_spns = set()
+
+    def process(self, current_time, vda_time, pgn, sa, data):
+        key = (pgn << 8) | sa
+        record = self.pgns.get(key)
+        if record is None:
+            # count, first time, last time, VDA time, data
+            record = [0, current_time, current_time, vda_time, None]
+            self.pgns[key] = record
+        record[0] += 1
+        record[2] = current_time
+        record[3] = vda_time
+        if record[4] is None or data != record[4]:
+            record[4] = bytes(data)
+            self.decode(pgn, sa, record[4])
+        elif pgn in ALWAYS_DECODE_PGNS:
+            self.decode(pgn, sa, record[4])
+        self.changed_pgns.add(key)
+
+    def decode(self, pgn, sa, data_bytes):
+        plan = self.decode_plans.get(pgn)
+        if plan is None:
+            return
+        for spn, value, meaning in decode_pgn(plan, data_bytes):
+            key = (spn << 8) | sa
+            self.spns[key] = (pgn, value, meaning)
+            self.changed_spns.add(key)
+
+    def publish(self, current_time):
+        """
+        Write the changed SPNs, then the changed PGNs, so the SPNs of a new
+        PGN record are already there when the reader sees it.
+        """
+        for key in self.changed_spns:
+            pgn, value, meaning = self.spns[key]
+            self.state.write_spn(key, pgn, value, meaning)
+        self.changed_spns.clear()
+        for key in self.changed_pgns:
+            count, start_time, last_time, vda_time, data = self.pgns[key]
+            self.state.write_pgn(key, count, start_time, last_time, vda_time, data)
+        self.changed_pgns.clear()
+        self.state.write_header(current_time)
+
+
+def run_j1939_worker(dll_name, deviceID, speed, filter_settings, state_name, json_path,
+                     event_queue, command_queue):
+    """
+    The main function of the worker process. It connects a J1939 client,
+    starts an RP1210ReadMessageThread into a ring buffer and decodes the
+    messages from the ring buffer until it gets the stop command.
+    """
+    from RP1210 import RP1210ReadMessageThread
+    from RP1210Backends import create_rp1210
+    from RP1210Filters import RP1210FilterSet
+    from J1939Database import load_j1939db, empty_j1939db
+    try:
+        j1939db = load_j1939db(json_path)
+    except FileNotFoundError:
+        j1939db = empty_j1939db()
+    state = SharedJ1939State(state_name)
+    decoder = J1939StateDecoder(j1939db, state, [959, 960, 961, 963, 962, 964])
+    rp1210 = create_rp1210(dll_name)
+    nClientID = rp1210.get_client_id("J1939", deviceID, "{}".format(speed))
+    if nClientID is None:
+        event_queue.put((WORKER_FAILED, None))
+        state.close()
+        return
+    rp1210.message_filters.add_client("J1939", nClientID)
+    filter_set = RP1210FilterSet.from_dict("J1939", filter_settings) if filter_settings else None
+    return_value = rp1210.message_filters.set_filters("J1939", filter_set)
+    if return_value != 0:
+        event_queue.put((WORKER_FAILED, return_value))
+        state.close()
+        return
+    rp1210.send_command(RP1210_Echo_Transmitted_Messages, nClientID, bytes([ECHO_ON]))
+    rp1210.send_command(RP1210_Set_J1939_Interpacket_Time, nClientID, bytes(4))
+
+    rx_queue = FrameRingBuffer(overflow_policy=DROP_OLDEST)
+    extra_queue = FrameRingBuffer(16)
+    read_thread = RP1210ReadMessageThread(None, rx_queue, extra_queue, rp1210.ReadMessage,
+                                          nClientID, "J1939", "J1939Worker")
+    read_thread.software_filter = rp1210.message_filters.get_software_filter("J1939")
+    read_thread.setDaemon(True)
+    read_thread.start()
+    event_queue.put((WORKER_CONNECTED, nClientID))
+
+    publish_time = time.time()
+    running = True
+    while running:
+        iso_messages = []
+        for current_time, vda_time, data in rx_queue.iter_views():
+            try:
+                vda_time, echo, pgn, priority, sa, da = parse_j1939_header(data)
+            except struct.error:
+                continue
+            if pgn == ISO_PGN:
+                iso_messages.append((current_time, vda_time, bytes(data)))
+                continue
+            if echo == 1:
+                continue
+            decoder.process(current_time, vda_time, pgn, sa, data[J1939_HEADER_LENGTH:])
+        # The extra queue is only needed in the GUI process.
+        extra_queue.get_batch()
+        if iso_messages:
+            event_queue.put((WORKER_ISO, iso_messages))
+
+        current_time = time.time()
+        if current_time - publish_time >= PUBLISH_INTERVAL:
+            state.message_count = read_thread.message_count
+            decoder.publish(current_time)
+            publish_time = current_time
+
+        try:
+            while True:
+                command, argument = command_queue.get_nowait()
+                if command == WORKER_STOP:
+                    running = False
+                elif command == WORKER_SEND:
+                    rp1210.send_message(nClientID, argument)
+                elif command == WORKER_FILTERS:
+                    filter_set = RP1210FilterSet.from_dict("J1939", argument) if argument else None
+                    rp1210.message_filters.set_filters("J1939", filter_set)
+                    read_thread.software_filter = rp1210.message_filters.get_software_filter("J1939")
+        except queue.Empty:
+            pass
+        if not rx_queue.qsize():
+            time.sleep(0.005)
+
+    read_thread.runSignal = False
+    try:
+        rp1210.ClientDisconnect(nClientID)
+    except Exception:
+        logger.debug(traceback.format_exc())
+    state.close()
+
+
+class J1939WorkerThread(threading.Thread):
+    """
+    The GUI side of the worker process. It takes the place of the J1939
+    RP1210ReadMessageThread: it starts the worker, puts the ISO 15765
+    messages from the worker into rx_queue and extra_queue and keeps the
+    message count for the connection status. Setting runSignal to False stops
+    the worker.
+    """
+    def __init__(self, parent, rx_queue, extra_queue, dll_name, deviceID, speed, filter_settings=None,
+                 json_path="J1939db.json"):
+        threading.Thread.__init__(self)
+        self.root = parent
+        self.rx_queue = rx_queue
+        self.extra_queue = extra_queue
+        self.runSignal = True
+        self.message_count = 0
+        self.start_time = time.time()
+        self.nClientID = None
+        self.connected = threading.Event()
+        self.state = SharedJ1939State()
+        self.event_queue = multiprocessing.Queue()
+        self.command_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=run_j1939_worker,
+                                               args=(dll_name, deviceID, speed, filter_settings,
+                                                     self.state.name, os.path.abspath(json_path),
+                                                     self.event_queue, self.command_queue),
+                                               daemon=True)
+
+    def run(self):
+        self.process.start()
+        while self.runSignal and self.process.is_alive():
+            try:
+                event, argument = self.event_queue.get(timeout=0.1)
+            except queue.Empty:
+                event = None
+            if event == WORKER_ISO:
+                for current_time, vda_time, data in argument:
+                    self.rx_queue.write(current_time, vda_time, data)
+                    self.extra_queue.write(current_time, vda_time, data)
+                self.rx_queue.commit()
+                self.extra_queue.commit()
+            elif event == WORKER_CONNECTED:
+                self.nClientID = argument
+                self.connected.set()
+            elif event == WORKER_FAILED:
+                logger.warning("The J1939 worker could not connect: {}".format(argument))
+                self.connected.set()
+            self.message_count = self.read_header()[2]
+        self.connected.set()
+        self.command_queue.put((WORKER_STOP, None))
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.state.close(unlink=True)
+        logger.debug("J1939 worker is finished.")
+
+    def read_header(self):
+        try:
+            return self.state.read_header()
+        except TypeError: # closed
+            return (0, 0, self.message_count, 0)
+
+    def read_changes(self):
+        return self.state.read_changes()
+
+    def send_message(self, message_bytes):
+        self.command_queue.put((WORKER_SEND, bytes(message_bytes)))
+
+    def set_filters(self, filter_settings):
+        self.command_queue.put((WORKER_FILTERS, filter_settings))
+
+
+def benchmark(j1939db, frames=200000, keys=300):
+    """
+    Measure the worker decode and publish rate and the time the GUI needs to
+    read the changes, without an adapter.
+    """
+    import random
+    state = SharedJ1939State()
+    reader = SharedJ1939State(state.name)
+    decoder = J1939StateDecoder(j1939db, state)
+    pgns = [pgn for pgn in sorted(j1939db["J1939PGNdb"]) if decoder.decode_plans.get(pgn)][:keys]
+    messages = [(pgn, random.choice([0, 3, 11, 33])) for pgn in pgns]
+    data = [bytes([random.randint(0, 255) for i in range(8)]) for i in range(16)]
+    start_time = time.perf_counter()
+    publish_time = start_time
+    reads = 0
+    read_time = 0
+    for i in range(frames):
+        pgn, sa = messages[i % len(messages)]
+        decoder.process(i, i, pgn, sa, data[(i // 64) % 16])
+        if i % 2000 == 1999:
+            # About 50 ms of a full 1 Mbit/s bus
+            decoder.publish(time.time())
+            read_start = time.perf_counter()
+            reader.read_changes()
+            read_time += time.perf_counter() - read_start
+            reads += 1
+    total_time = time.perf_counter() - start_time
+    print("Worker: {:10.0f} frames/s".format(frames / (total_time - read_time)))
+    print("GUI:    {:10.2f} ms per read of {} records".format(1000 * read_time / reads, len(messages)))
+    reader.close()
+    state.close(unlink=True)
+
+if __name__ == '__main__':
+    from J1939Database import load_j1939db
+    benchmark(load_j1939db("J1939db.json"))
@@ -0,0 +1,149 @@
+"""
+Importing CAN Logger 2 files on a background thread.
+
+A LogImportThread reads and decodes the files and writes the messages into a
+receive ring buffer a batch at a time, waiting when the ring is full, so the
+GUI decodes them on its read timer like live traffic. Progress is reported
+with Qt signals, at most once every PROGRESS_INTERVAL seconds, so the GUI
+stays responsive however fast the file is read.
+
+Cancelling sets a flag the thread checks between batches and while it waits
+for room in the ring, so it stops within a few milliseconds.
+"""
+import os
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from CANLogger2 import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Seconds between progress signals
+PROGRESS_INTERVAL = 0.1
+# Seconds to wait for the GUI to make room in the ring buffer
+RING_WAIT = 0.002
+
+
+class LogImportThread(QThread):
+    """
+    Imports CAN Logger 2 files into rx_queue. paths is a file, a directory
+    or a list of them. With use_pool the files are decoded by the process
+    pool of Logger2BatchImport and merged in time stamp order, skipping the
+    blocks that fail their CRC check. Otherwise each file is read in order
+    and stops at its first bad block.
+    """
+    # Bytes or messages done, the total and a description
+    progress = pyqtSignal(int, int, str)
+    # A dictionary with the number of messages, the CRC failures of each
+    # file, where each file read in order stopped, whether the import was
+    # cancelled and the error if there was one
+    import_finished = pyqtSignal(dict)
+
+    def __init__(self, rx_queue, paths, use_pool=False, parent=None):
+        super(LogImportThread, self).__init__(parent)
+        self.rx_queue = rx_queue
+        self.filenames = find_logger2_files(paths)
+        self.use_pool = use_pool
+        self.cancelled = False
+        self.message_count = 0
+        self.crc_failures = {}
+        # Byte offset of the bad block and the number of blocks not imported
+        # for the files that were read in order and stopped early
+        self.stopped_at = {}
+        self.last_progress_time = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report_progress(self, done, total, text):
+        now = time.perf_counter()
+        if now - self.last_progress_time >= PROGRESS_INTERVAL:
+            self.last_progress_time = now
+            self.progress.emit(done, total, text)
+
+    def run(self):
+        error = None
+        try:
+            if self.use_pool:
+                self.import_with_pool()
+            else:
+                self.import_files()
+        except (OSError, ValueError) as e:
+            logger.warning(repr(e))
+            error = str(e)
+        self.import_finished.emit({"Messages": self.message_count,
+                                   "CRC Failures": self.crc_failures,
+                                   "Stopped At": self.stopped_at,
+                                   "Cancelled": self.cancelled,
+                                   "Error": error})
+
+    def import_files(self):
+        total_bytes = sum(os.path.getsize(filename) for filename in self.filenames)
+        done_bytes = 0
+        for filename in self.filenames:
+            logger.debug("Importing file {}".format(filename))
+            self.crc_failures[filename] = 0
+            file_bytes = 0
+            for records, file_bytes in read_logger2_chunks(filename, LOGGER2_IMPORT_BLOCKS):
+                if not self.deliver(records):
+                    return
+                self.report_progress(done_bytes + file_bytes, total_bytes,
+                                     "Processed {:0.3f} of {:0.3f} Mbytes.".format(
+                                         (done_bytes + file_bytes)/1000000, total_bytes/1000000))
+            file_blocks = os.path.getsize(filename) // LOGGER2_BLOCK_SIZE
+            if file_bytes < file_blocks * LOGGER2_BLOCK_SIZE:
+                # read_logger2_chunks stops at the first bad block, so it and
+                # every block after it are not imported.
+                self.crc_failures[filename] = 1
+                self.stopped_at[filename] = (file_bytes, file_blocks - file_bytes // LOGGER2_BLOCK_SIZE)
+            done_bytes += os.path.getsize(filename)
+
+    def import_with_pool(self):
+        batch = Logger2BatchImport(self.filenames)
+        batch.start()
+        while not batch.poll(0.05):
+            if self.cancelled:
+                batch.cancel()
+                return
+            self.report_progress(batch.bytes_processed, batch.total_bytes,
+                                 "Decoded {:0.3f} of {:0.3f} Mbytes in {} files.".format(
+                                     batch.bytes_processed/1000000, batch.total_bytes/1000000,
+                                     len(batch.filenames)))
+        self.crc_failures = batch.crc_failures
+        records = batch.get_records()
+        message_count = len(records.timestamps)
+        batch_size = LOGGER2_IMPORT_BLOCKS * LOGGER2_RECORD_COUNT
+        for start in range(0, message_count, batch_size):
+            if not self.deliver(Logger2Records(*(column[start:start + batch_size] for column in records))):
+                return
+            self.report_progress(min(start + batch_size, message_count), message_count,
+                                 "Loaded {} of {} messages.".format(min(start + batch_size, message_count),
+                                                                    message_count))
+
+    def deliver(self, records):
+        """
+        Write the messages of records into the ring buffer, committing each
+        time it fills up. Returns False if the import was cancelled.
+        """
+        rx_queue = self.rx_queue
+        timestamps = records.timestamps.tolist()
+        system_micros = records.system_micros.tolist()
+        messages = records.messages
+        count = len(timestamps)
+        start = 0
+        while start < count:
+            if self.cancelled:
+                return False
+            free_slots = rx_queue.free_slots()
+            if free_slots < 1:
+                time.sleep(RING_WAIT)
+                continue
+            end = min(count, start + free_slots)
+            for i in range(start, end):
+                rx_queue.write(timestamps[i], system_micros[i], messages[i])
+            rx_queue.commit()
+            self.message_count += end - start
+            start = end
+        return not self.cancelled
@@ -10,6 +10,7 @@ import time
 import struct
 import traceback
 from RP1210Functions import *
+from RP1210Filters import *
 
 import logging
 logger = logging.getLogger(__name__)
@@ -18,17 +19,26 @@ def get_storage_path():
     return os.getcwd()
 
 BUFFER_SIZE = 8192
+# The most messages read from the adapter before they are handed to the consumer
+BATCH_SIZE = 256
+# Seconds to wait for a read thread to commit its batch and let go of the capture
+CAPTURE_DETACH_TIMEOUT = 1.0
 
 class RP1210ReadMessageThread(threading.Thread):
     '''This thread is designed to receive messages from the vehicle diagnostic
     adapter (VDA) and put the data into a queue. The class arguments are as
     follows:
-    rx_queue - A data structure that takes the received message.
+    rx_queue - A FrameRingBuffer that takes the received messages.
+    extra_queue - A FrameRingBuffer that takes the ISO 15765 messages.
     RP1210_ReadMessage - a function handle to the VDA DLL.
     nClientID - this lets us know which network is being used to receive the
-                messages. This will likely be a 1 or 2'''
+                messages. This will likely be a 1 or 2
+    The software_filter is an RP1210FilterSet for J1939 messages the adapter
+    could not filter itself. When capture_queue is a FrameRingBuffer, every
+    message read is also copied into it for a CaptureWriterThread. The thread
+    lets go of it with detach_capture.'''
 
-    def __init__(self, parent, rx_queue, extra_queue, RP1210_ReadMessage, nClientID, protocol, title, filename="NetworkTraffic"):
+    def __init__(self, parent, rx_queue, extra_queue, RP1210_ReadMessage, nClientID, protocol, title, filename="NetworkTraffic", batch_size=BATCH_SIZE):
         threading.Thread.__init__(self)
         self.root = parent
         self.rx_queue = rx_queue
@@ -37,92 +47,98 @@ class RP1210ReadMessageThread(threading.Thread):
         self.nClientID = nClientID
         self.runSignal = True
         self.message_count = 0
+        self.batch_count = 0
         self.start_time = time.time()
         self.duration = 0
         self.filename = os.path.join(get_storage_path(), protocol + filename + ".bin")
         self.protocol = protocol
-        self.pgns_to_block=[61444, 61443, 65134, 65215]
-        self.sources_to_block=[0, 11]
-        self.can_ids_to_block = []
+        self.batch_size = batch_size
+        self.software_filter = None
+        self.capture_queue = None
+        self.capture_detach = None
         
     def run(self):
         ucTxRxBuffer = (c_char * BUFFER_SIZE)()
         # display a valid connection upon start.
         logger.debug("Read Message Client ID: {}".format(self.nClientID))
-        message_bytes = b'1210'
-        # with open(self.filename,'wb') as log_file:
-        #     pass
+        rx_view = memoryview(ucTxRxBuffer).cast('B')
         while self.runSignal: #Look into threading.events
                 self.duration = time.time() - self.start_time
+                # Wait for a message, then drain whatever else the adapter has
+                # buffered and make the whole batch visible to the consumer at once.
                 return_value = self.RP1210_ReadMessage(c_short(self.nClientID),
                                                        byref(ucTxRxBuffer),
                                                        c_short(BUFFER_SIZE),
                                                        c_short(BLOCKING_IO))
-                if return_value > 0:
-                    current_time = time.time()
-                    if ucTxRxBuffer[4] == b'\x00': #Echo is on, so we only want to see what others are sending.
-                        self.message_count +=1
-                                   
-                    if self.protocol == "CAN":
-                        vda_timestamp = struct.unpack(">L",ucTxRxBuffer[0:4])[0]
-                        extended = ucTxRxBuffer[5]
-                        if extended:
-                            can_id = struct.unpack(">L",ucTxRxBuffer[6:10])[0] #Swap endianness
-                            can_data = ucTxRxBuffer[10:return_value]
-                            dlc = int(return_value - 10)
-                        
-                        else:
-                            can_id = struct.unpack(">H",ucTxRxBuffer[6:8])[0] #Swap endianness
-                            can_data = ucTxRxBuffer[8:return_value]
-                            dlc = int(return_value - 8)
-                        
-                        # #the following conversion is to emulate the data structure from the NMFTA CAN Logger Project
-                        # # See https://github.com/Heavy-Vehicle-Networking-At-U-Tulsa/NMFTA-CAN-Logger/tree/master/_07_Low_Latency_Logger_with_Requests
-                        # try:
-                        #     microsecond_bytes = struct.pack("<L", int((dlc << 24) + (current_time % 1) * 1000000))
-                        # except struct.error:
-                        #     continue
-                        # # RP1210_ReadMessage API:
-                        # #Reverse endianess
-                        # #vda_timestamp = struct.pack("<L",struct.unpack(">L",ucTxRxBuffer[0:4])[0])  
-                        
-                        
-                        # #echo_byte = ucTxRxBuffer[4]
-                        
-                        # # Build the 24 bytes that make up a CAN message.
-                        # message_bytes = time_bytes
-                        # message_bytes += vda_timestamp
-                        # message_bytes += microsecond_bytes
-                        # message_bytes += can_id
-                        # message_bytes += can_data
-                        self.rx_queue.put( (current_time, vda_timestamp, can_id, dlc, can_data) )
-                        
-
-                    elif self.protocol == "J1708": 
-                        self.rx_queue.put((current_time, ucTxRxBuffer[:return_value]))
-                        #self.extra_queue.put((current_time, ucTxRxBuffer[5:return_value]))
-                        
-                    elif self.protocol == "J1939":
-                        pgn = struct.unpack("<L", ucTxRxBuffer[5:8] + b'\x00')[0]
-                        sa = struct.unpack("B",ucTxRxBuffer[9])[0]
-                        
-                        if (pgn not in self.pgns_to_block) or (sa not in self.sources_to_block):
-                            self.rx_queue.put({'current_time':current_time,'data':ucTxRxBuffer[:return_value]})
-                        #ISO 15765 traffic only
-                        if pgn == 0xDA00:
-                            dst_addr = struct.unpack("B",ucTxRxBuffer[10])[0]
-                            message_data = ucTxRxBuffer[11:return_value]
-                            self.extra_queue.put((pgn, 6, sa, dst_addr, message_data))
-
+                messages_read = 0
+                while return_value > 0:
+                    self.process_message(rx_view, return_value, time.time())
+                    messages_read += 1
+                    if messages_read >= self.batch_size:
+                        break
+                    return_value = self.RP1210_ReadMessage(c_short(self.nClientID),
+                                                           byref(ucTxRxBuffer),
+                                                           c_short(BUFFER_SIZE),
+                                                           c_short(NON_BLOCKING_IO))
+                if messages_read:
+                    self.batch_count += 1
+                    self.rx_queue.commit()
+                    self.extra_queue.commit()
+                    capture_queue = self.capture_queue
+                    if capture_queue is not None:
+                        capture_queue.commit()
+                self.release_capture()
                     
+        self.release_capture()
         logger.debug("RP1210 Receive Thread is finished.")
 
-    def make_log_data(self,message_bytes,return_value,time_bytes,ucTxRxBuffer):
-        length_bytes = struct.pack("<H",return_value + 4)
-        message_bytes += length_bytes
-        message_bytes += time_bytes
-        message_bytes += ucTxRxBuffer[:return_value]
-        return message_bytes
+    def detach_capture(self):
+        """
+        Stop copying messages into capture_queue once the batch being read
+        is committed to it. Returns an Event that is set when the thread no
+        longer writes to the capture queue.
+        """
+        detached = threading.Event()
+        if self.is_alive():
+            self.capture_detach = detached
+        else:
+            self.capture_queue = None
+            detached.set()
+        return detached
+
+    def release_capture(self):
+        detached = self.capture_detach
+        if detached is not None:
+            self.capture_queue = None
+            self.capture_detach = None
+            detached.set()
+
+    def process_message(self, rx_view, return_value, current_time):
+        """
+        Copy the message in the receive buffer into the ring buffers. The
+        messages are kept in the RP1210_ReadMessage format for all protocols.
+        The header is parsed from a memoryview of the ctypes buffer, so the
+        only copy of the message is the one into its ring buffer slot.
+        """
+        vda_timestamp, echo = RP1210_MESSAGE_HEADER.unpack_from(rx_view)
+        if echo == 0: #Echo is on, so we only want to see what others are sending.
+            self.message_count +=1
+        capture_queue = self.capture_queue
+        if capture_queue is not None:
+            capture_queue.write(current_time, vda_timestamp, rx_view, return_value)
+                       
+        if self.protocol == "J1939":
+            pgn_low, pgn_high, priority, sa, da = J1939_MESSAGE_HEADER.unpack_from(rx_view, 5)
+            pgn = pgn_low | (pgn_high << 16)
+            
+            software_filter = self.software_filter
+            if software_filter is None or software_filter.passes_j1939(pgn, priority, sa, da):
+                self.rx_queue.write(current_time, vda_timestamp, rx_view, return_value)
+            #ISO 15765 traffic only
+            if pgn == 0xDA00:
+                self.extra_queue.write(current_time, vda_timestamp, rx_view, return_value)
+        else:
+            self.rx_queue.write(current_time, vda_timestamp, rx_view, return_value)
 
 class RP1210Class():
     """A class to access RP1210 libraries for different devices."""
@@ -133,6 +149,7 @@ class RP1210Class():
         """
         self.nClientID = None
         self.ucTxRxBuffer = (c_char*BUFFER_SIZE)()
+        self.message_filters = RP1210FilterManager(self.send_command)
         self.dll_name = dll_name
         self.dll_path = self.find_dll_path()
         self.create_RP1210_functions()
@@ -693,3 +710,59 @@ class RP1210Class():
         message_window.setText(message)
         message_window.exec_()
 
+
+def benchmark_receive_path(frames=10000):
+    """
+    Compare the old receive path, which sliced the ctypes buffer into bytes and
+    passed a dictionary through a queue.Queue, with the ring buffer path that
+    parses the header from a memoryview. Prints the time per frame and the
+    number of Python objects that stay allocated for each queued frame.
+    """
+    import queue
+    import sys
+    from RingBuffer import FrameRingBuffer
+    ucTxRxBuffer = (c_char * BUFFER_SIZE)()
+    message = struct.pack(">LB", 123456, 0) + bytes([0xF1, 0xFE, 0x00, 6, 0, 0xFF]) + bytes(range(8))
+    memmove(ucTxRxBuffer, message, len(message))
+    return_value = len(message)
+
+    # The path before the ring buffers
+    rx_queue = queue.Queue(frames)
+    start_blocks = sys.getallocatedblocks()
+    start_time = time.perf_counter()
+    for i in range(frames):
+        current_time = time.time()
+        pgn = struct.unpack("<L", ucTxRxBuffer[5:8] + b'\x00')[0]
+        sa = struct.unpack("B", ucTxRxBuffer[9])[0]
+        rx_queue.put({'current_time':current_time,'data':ucTxRxBuffer[:return_value]})
+    queued_blocks = sys.getallocatedblocks() - start_blocks
+    for i in range(frames):
+        rx_buffer = rx_queue.get()['data']
+        vda_time = struct.unpack(">L", rx_buffer[0:4])[0]
+        pgn = rx_buffer[5] + (rx_buffer[6] << 8) + (rx_buffer[7] << 16)
+        sa = rx_buffer[9]
+        data_bytes = rx_buffer[11:]
+    old_time = (time.perf_counter() - start_time) / frames
+    del rx_queue
+
+    # The ring buffer path
+    rx_ring = FrameRingBuffer(frames)
+    reader = RP1210ReadMessageThread(None, rx_ring, FrameRingBuffer(10), None, 1, "J1939", "Benchmark")
+    rx_view = memoryview(ucTxRxBuffer).cast('B')
+    start_blocks = sys.getallocatedblocks()
+    start_time = time.perf_counter()
+    for i in range(frames):
+        reader.process_message(rx_view, return_value, time.time())
+    rx_ring.commit()
+    ring_blocks = sys.getallocatedblocks() - start_blocks
+    for current_time, vda_time, data in rx_ring.iter_views(frames):
+        vda_time, echo, pgn, priority, sa, da = parse_j1939_header(data)
+        data_bytes = bytes(data[J1939_HEADER_LENGTH:])
+    new_time = (time.perf_counter() - start_time) / frames
+
+    print("Receive path for {} J1939 frames".format(frames))
+    print("queue.Queue:     {:8.2f} us/frame {:6.2f} objects/frame queued".format(1e6 * old_time, queued_blocks / frames))
+    print("FrameRingBuffer: {:8.2f} us/frame {:6.2f} objects/frame queued".format(1e6 * new_time, ring_blocks / frames))
+
+if __name__ == '__main__':
+    benchmark_receive_path()
@@ -0,0 +1,588 @@
+"""
+Adapter backends that can stand in for an RP1210 vendor DLL.
+
+RP1210Class calls the ClientConnect, ClientDisconnect, ReadMessage,
+SendMessage and SendCommand functions of a DLL loaded with windll. A backend
+is a Python object with the same functions, taking the same ctypes arguments
+and filling the buffers in the same RP1210 formats, so everything above
+RP1210Class (the read threads, the ring buffers, the filters and the
+decoders) works the same. The backends are:
+
+RP1210     - the vendor DLL of an RP1210 adapter on Windows
+SocketCAN  - a Linux CAN interface, like can0 or a vcan interface
+VirtualBus - a CAN bus inside the process, shared by every client on it
+Simulated  - generated or replayed traffic (see RP1210Simulator)
+
+create_rp1210 returns the RP1210Class for the name chosen in SelectRP1210.
+The backends that are not DLLs show up in SelectRP1210 as extra vendors.
+"""
+from abc import ABC, abstractmethod
+import collections
+import ctypes
+import os
+import socket
+import struct
+import threading
+import time
+
+from RP1210 import RP1210Class, BUFFER_SIZE
+from RP1210Functions import *
+from RP1210Filters import J1939_FILTER, CAN_FILTER
+
+import logging
+logger = logging.getLogger(__name__)
+
+SOCKETCAN_BACKEND = "SocketCAN"
+VIRTUAL_BUS_BACKEND = "VirtualBus"
+SIMULATED_BACKEND = "Simulated"
+
+ERR_INVALID_CLIENT_ID = 129
+ERR_CLIENT_AREA_FULL = 131
+ERR_INVALID_DEVICE = 134
+ERR_INVALID_PROTOCOL = 136
+ERR_MESSAGE_TOO_LONG = 141
+ERR_HARDWARE_NOT_RESPONDING = 142
+ERR_COMMAND_NOT_SUPPORTED = 143
+
+# Commands that are accepted without changing anything in a backend
+ACCEPTED_COMMANDS = frozenset([RP1210_Reset_Device,
+                               RP1210_Set_J1939_Interpacket_Time,
+                               RP1210_Protect_J1939_Address,
+                               RP1210_Release_J1939_Address,
+                               RP1210_Set_Message_Receive,
+                               RP1210_Set_J1708_Mode,
+                               RP1210_Set_J1939_Baud,
+                               RP1210_Set_BlockTimeout,
+                               RP1210_SetMaxErrorMsgSize])
+FILTER_TYPE_COMMANDS = {RP1210_Set_J1939_Filter_Type: "J1939",
+                        RP1210_Set_CAN_Filter_Type: "CAN",
+                        RP1210_Set_J1708_Filter_Type: "J1708"}
+FILTER_COMMANDS = {RP1210_Set_Message_Filtering_For_J1939: "J1939",
+                   RP1210_Set_Message_Filtering_For_CAN: "CAN",
+                   RP1210_Set_Message_Filtering_For_J1708: "J1708"}
+
+# struct can_frame from linux/can.h: identifier, data length code, data
+CAN_FRAME = struct.Struct("=IB3x8s")
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x000007FF
+# Seconds a blocking read waits before it returns 0, so the read thread can stop
+READ_TIMEOUT = 0.1
+VIRTUAL_QUEUE_SIZE = 10000
+
+
+def get_value(argument):
+    """
+    Return the Python value of an argument that may be a ctypes object.
+    """
+    return getattr(argument, "value", argument)
+
+def get_buffer(argument):
+    """
+    Return the ctypes array behind a byref() or pointer argument.
+    """
+    return getattr(argument, "_obj", argument)
+
+def j1939_to_can(payload):
+    """
+    Convert an RP1210 J1939 message (PGN, how/priority, SA, DA and data) to
+    a 29 bit CAN identifier and the data.
+    """
+    pgn = payload[0] | (payload[1] << 8) | (payload[2] << 16)
+    pf = (pgn >> 8) & 0xFF
+    ps = payload[5] if pf < 240 else pgn & 0xFF
+    can_id = ((payload[3] & 0x07) << 26) | ((pgn >> 16) & 0x03) << 24 | (pf << 16) | (ps << 8) | payload[4]
+    return can_id | CAN_EFF_FLAG, bytes(payload[6:])
+
+def can_to_j1939(can_id, data):
+    """
+    Convert a 29 bit CAN identifier and data to an RP1210 J1939 message.
+    """
+    priority = (can_id >> 26) & 0x07
+    pf = (can_id >> 16) & 0xFF
+    ps = (can_id >> 8) & 0xFF
+    sa = can_id & 0xFF
+    pgn = (can_id >> 8) & 0x3FF00
+    if pf < 240:
+        da = ps
+    else:
+        pgn |= ps
+        da = 0xFF
+    return bytes([pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16, priority, sa, da]) + data
+
+def rp1210_can_to_can(payload):
+    """
+    Convert an RP1210 CAN message (type, identifier and data) to a CAN
+    identifier with the extended flag and the data.
+    """
+    if payload[0] == STANDARD_CAN:
+        return struct.unpack_from(">H", payload, 1)[0] & CAN_SFF_MASK, bytes(payload[3:])
+    return (struct.unpack_from(">L", payload, 1)[0] & CAN_EFF_MASK) | CAN_EFF_FLAG, bytes(payload[5:])
+
+def can_to_rp1210_can(can_id, data):
+    if can_id & CAN_EFF_FLAG:
+        return bytes([EXTENDED_CAN]) + struct.pack(">L", can_id & CAN_EFF_MASK) + data
+    return bytes([STANDARD_CAN]) + struct.pack(">H", can_id & CAN_SFF_MASK) + data
+
+
+class BackendClient():
+    """
+    The echo mode and the message filters of a client, applied to messages
+    in the RP1210 format of its protocol without the time stamp and the echo
+    byte.
+    """
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.echo = False
+        self.filter_state = FILTER_PASS_ALL
+        self.filter_type = FILTER_INCLUSIVE
+        self.filters = []
+        self.start_time = time.perf_counter()
+        self.filtered_count = 0
+        self.sent_count = 0
+
+    def passes(self, payload):
+        if self.filter_state == FILTER_PASS_ALL:
+            return True
+        if self.filter_state == FILTER_PASS_NONE:
+            return False
+        return any(self.matches(entry, payload) for entry in self.filters) != (self.filter_type == FILTER_EXCLUSIVE)
+
+    def matches(self, entry, payload):
+        if self.protocol == "J1939":
+            flags, pgn_low, pgn_high, priority, sa, da = entry
+            return ((not flags & FILTER_PGN or (payload[0] | payload[1] << 8 | payload[2] << 16) == pgn_low | pgn_high << 16) and
+                    (not flags & FILTER_PRIORITY or payload[3] & 0x07 == priority) and
+                    (not flags & FILTER_SOURCE or payload[4] == sa) and
+                    (not flags & FILTER_DESTINATION or payload[5] == da))
+        elif self.protocol == "CAN":
+            can_type, mask, header = entry
+            if payload[0] != can_type:
+                return False
+            if can_type == EXTENDED_CAN:
+                can_id = struct.unpack_from(">L", payload, 1)[0]
+            else:
+                can_id = struct.unpack_from(">H", payload, 1)[0]
+            return can_id & mask == header & mask
+        else:
+            return payload[0] == entry
+
+    def set_filters(self, command_bytes):
+        if self.protocol == "J1939":
+            entries = [J1939_FILTER.unpack_from(command_bytes, i)
+                       for i in range(0, len(command_bytes) - J1939_FILTER.size + 1, J1939_FILTER.size)]
+        elif self.protocol == "CAN":
+            entries = [CAN_FILTER.unpack_from(command_bytes, i)
+                       for i in range(0, len(command_bytes) - CAN_FILTER.size + 1, CAN_FILTER.size)]
+        else:
+            entries = list(command_bytes)
+        self.filters.extend(entries)
+        self.filter_state = FILTER_PASS_SOME
+
+    def send_command(self, command, command_bytes):
+        """
+        Carry out the echo and filter commands. Returns the RP1210 return
+        value.
+        """
+        if command == RP1210_Echo_Transmitted_Messages:
+            self.echo = bool(command_bytes and command_bytes[0])
+        elif command == RP1210_Set_All_Filters_States_to_Pass:
+            self.filters = []
+            self.filter_state = FILTER_PASS_ALL
+        elif command == RP1210_Set_All_Filters_States_to_Discard:
+            self.filters = []
+            self.filter_state = FILTER_PASS_NONE
+        elif FILTER_COMMANDS.get(command) == self.protocol:
+            self.set_filters(command_bytes)
+        elif FILTER_TYPE_COMMANDS.get(command) == self.protocol:
+            self.filter_type = command_bytes[0] if command_bytes else FILTER_INCLUSIVE
+        elif command not in ACCEPTED_COMMANDS:
+            return ERR_COMMAND_NOT_SUPPORTED
+        return 0
+
+    def get_vda_time(self):
+        return int((time.perf_counter() - self.start_time) * 1e6) & 0xFFFFFFFF
+
+
+class PythonAdapter():
+    """
+    The RP1210 functions every backend has in common. Subclasses make the
+    clients and move the messages.
+    """
+    protocols = ["J1939", "CAN"]
+
+    def __init__(self, max_clients=16):
+        self.max_clients = max_clients
+        self.clients = {}
+
+    def get_client(self, nClientID):
+        return self.clients.get(get_value(nClientID))
+
+    def ClientConnect(self, hwnd, nDeviceID, fpchProtocol, lTxBufferSize, lRcvBufferSize, nIsAppPacketizingIncomingMsgs):
+        protocol = bytes(get_value(fpchProtocol)).decode('ascii', 'ignore').split(":")[0]
+        if protocol not in self.protocols:
+            return ERR_INVALID_PROTOCOL
+        if len(self.clients) >= self.max_clients:
+            return ERR_CLIENT_AREA_FULL
+        nClientID = min(set(range(self.max_clients)) - set(self.clients))
+        client = self.connect_client(nClientID, get_value(nDeviceID), protocol)
+        if isinstance(client, int):
+            return client
+        self.clients[nClientID] = client
+        logger.debug("{} {} client {} connected.".format(type(self).__name__, protocol, nClientID))
+        return nClientID
+
+    def connect_client(self, nClientID, nDeviceID, protocol):
+        """
+        Return a new BackendClient or an RP1210 error code.
+        """
+        return BackendClient(protocol)
+
+    def ClientDisconnect(self, nClientID):
+        client = self.clients.pop(get_value(nClientID), None)
+        if client is None:
+            return ERR_INVALID_CLIENT_ID
+        self.disconnect_client(client)
+        return 0
+
+    def disconnect_client(self, client):
+        pass
+
+    def SendCommand(self, nCommandNumber, nClientID, fpchClientCommand, nMessageSize):
+        client = self.get_client(nClientID)
+        if client is None:
+            return ERR_INVALID_CLIENT_ID
+        size = get_value(nMessageSize)
+        command_bytes = bytes(get_buffer(fpchClientCommand)[:size]) if size else b''
+        return client.send_command(get_value(nCommandNumber), command_bytes)
+
+    def GetErrorMsg(self, ErrorCode, fpchDescription):
+        description = RP1210Errors.get(get_value(ErrorCode), "Unknown error").encode('ascii')[:79]
+        ctypes.memmove(get_buffer(fpchDescription), description + b'\x00', len(description) + 1)
+        return 0
+
+    def ReadVersion(self, fpchDLLMajorVersion, fpchDLLMinorVersion, fpchAPIMajorVersion, fpchAPIMinorVersion):
+        for buffer, version in zip([fpchDLLMajorVersion, fpchDLLMinorVersion, fpchAPIMajorVersion, fpchAPIMinorVersion],
+                                   [b'1', b'0', b'3', b'0']):
+            ctypes.memmove(get_buffer(buffer), version, 1)
+        return 0
+
+    def write_message(self, client, fpchAPIMessage, nBufferSize, echo, payload):
+        message = struct.pack(">LB", client.get_vda_time(), echo) + payload
+        length = min(len(message), get_value(nBufferSize))
+        ctypes.memmove(get_buffer(fpchAPIMessage), message, length)
+        return length
+
+
+class CANAdapter(PythonAdapter, ABC):
+    """
+    A backend that carries J1939 and CAN clients over CAN frames. Subclasses
+    provide receive_frame and send_frame, and cannot be made without them.
+    """
+    def ReadMessage(self, nClientID, fpchAPIMessage, nBufferSize, nBlockOnRead):
+        client = self.get_client(nClientID)
+        if client is None:
+            return -ERR_INVALID_CLIENT_ID
+        block = get_value(nBlockOnRead)
+        while True:
+            frame = self.receive_frame(client, block)
+            if frame is None:
+                return 0
+            can_id, data, echo = frame
+            if echo and not client.echo:
+                continue
+            if client.protocol == "J1939":
+                if not can_id & CAN_EFF_FLAG:
+                    continue
+                payload = can_to_j1939(can_id, data)
+            else:
+                payload = can_to_rp1210_can(can_id, data)
+            if echo or client.passes(payload):
+                return self.write_message(client, fpchAPIMessage, nBufferSize, int(echo), payload)
+            client.filtered_count += 1
+
+    def SendMessage(self, nClientID, fpchClientMessage, nMessageSize, nNotifyStatusOnTx, nBlockOnSend):
+        client = self.get_client(nClientID)
+        if client is None:
+            return ERR_INVALID_CLIENT_ID
+        message = bytes(get_buffer(fpchClientMessage)[:get_value(nMessageSize)])
+        try:
+            if client.protocol == "J1939":
+                can_id, data = j1939_to_can(message)
+            else:
+                can_id, data = rp1210_can_to_can(message)
+        except (IndexError, struct.error):
+            return ERR_MESSAGE_TOO_LONG if len(message) else ERR_INVALID_PROTOCOL
+        if len(data) > 8:
+            # Transport protocol sessions are not supported.
+            return ERR_MESSAGE_TOO_LONG
+        client.sent_count += 1
+        return self.send_frame(client, can_id, data)
+
+    @abstractmethod
+    def receive_frame(self, client, block):
+        """
+        Return the next (can_id, data, echo) for the client or None.
+        """
+
+    @abstractmethod
+    def send_frame(self, client, can_id, data):
+        """
+        Send a frame for the client and return 0 or an RP1210 error code.
+        """
+
+
+def list_socketcan_interfaces():
+    """
+    Return the names of the CAN network interfaces of a Linux computer.
+    """
+    interfaces = []
+    try:
+        for name in sorted(os.listdir("/sys/class/net")):
+            try:
+                with open(os.path.join("/sys/class/net", name, "type")) as type_file:
+                    if type_file.read().strip() == "280": # ARPHRD_CAN
+                        interfaces.append(name)
+            except OSError:
+                pass
+    except OSError:
+        pass
+    return interfaces
+
+
+class SocketCANAdapter(CANAdapter):
+    """
+    Clients on Linux SocketCAN interfaces. The device ID is the position of
+    the interface in list_socketcan_interfaces, starting at 1. The messages
+    this computer sends come back with the echo flag set when echo is on.
+    """
+    def connect_client(self, nClientID, nDeviceID, protocol):
+        interfaces = list_socketcan_interfaces()
+        if not 0 < nDeviceID <= len(interfaces):
+            return ERR_INVALID_DEVICE
+        interface = interfaces[nDeviceID - 1]
+        try:
+            can_socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+            can_socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_RECV_OWN_MSGS, 1)
+            can_socket.bind((interface,))
+        except (OSError, AttributeError) as e:
+            logger.warning(repr(e))
+            logger.warning("Could not open the SocketCAN interface {}".format(interface))
+            return ERR_HARDWARE_NOT_RESPONDING
+        client = BackendClient(protocol)
+        client.socket = can_socket
+        client.blocking = None
+        client.interface = interface
+        return client
+
+    def disconnect_client(self, client):
+        client.socket.close()
+
+    def receive_frame(self, client, block):
+        if client.blocking != block:
+            client.socket.settimeout(READ_TIMEOUT if block else 0.0)
+            client.blocking = block
+        while True:
+            try:
+                frame, ancdata, flags, address = client.socket.recvmsg(CAN_FRAME.size)
+            except (socket.timeout, BlockingIOError):
+                return None
+            except OSError as e:
+                logger.debug(repr(e))
+                return None
+            can_id, dlc, data = CAN_FRAME.unpack(frame)
+            if can_id & (CAN_ERR_FLAG | CAN_RTR_FLAG):
+                continue
+            return can_id, data[:dlc], bool(flags & socket.MSG_CONFIRM)
+
+    def send_frame(self, client, can_id, data):
+        try:
+            client.socket.send(CAN_FRAME.pack(can_id, len(data), data))
+        except OSError as e:
+            logger.debug(repr(e))
+            return ERR_HARDWARE_NOT_RESPONDING
+        return 0
+
+
+class VirtualBus():
+    """
+    A CAN bus inside the process. A frame sent by one client is received by
+    every other client on the bus, and by the sender if it has echo on.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = []
+        self.nodes = []
+
+    def add_client(self, client):
+        client.frames = collections.deque(maxlen=VIRTUAL_QUEUE_SIZE)
+        client.frame_ready = threading.Condition()
+        with self.lock:
+            self.clients.append(client)
+
+    def remove_client(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def send(self, sender, can_id, data):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            if client is sender and not client.echo:
+                continue
+            with client.frame_ready:
+                client.frames.append((can_id, data, client is sender))
+                client.frame_ready.notify()
+
+    def add_node(self, frames, rate):
+        """
+        Start a thread that sends the RP1210 J1939 messages of an iterable
+        onto the bus at rate frames per second, like an ECU on the network.
+        """
+        node = VirtualBusNode(self, frames, rate)
+        node.setDaemon(True)
+        node.start()
+        self.nodes.append(node)
+        return node
+
+
+class VirtualBusNode(threading.Thread):
+    def __init__(self, bus, frames, rate):
+        threading.Thread.__init__(self)
+        self.bus = bus
+        self.frames = frames
+        self.rate = rate
+        self.runSignal = True
+
+    def run(self):
+        start_time = time.perf_counter()
+        for count, payload in enumerate(self.frames):
+            if not self.runSignal:
+                break
+            if self.rate:
+                delay = start_time + count / self.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            can_id, data = j1939_to_can(payload)
+            self.bus.send(None, can_id, data)
+
+
+virtual_buses = {}
+
+def get_virtual_bus(nDeviceID):
+    """
+    Return the virtual bus of a device ID. All the clients of the process
+    with the same device ID share the bus.
+    """
+    return virtual_buses.setdefault(nDeviceID, VirtualBus())
+
+
+class VirtualBusAdapter(CANAdapter):
+    """
+    Clients on in-process virtual buses, one bus per device ID.
+    """
+    def connect_client(self, nClientID, nDeviceID, protocol):
+        client = BackendClient(protocol)
+        client.bus = get_virtual_bus(nDeviceID)
+        client.bus.add_client(client)
+        return client
+
+    def disconnect_client(self, client):
+        client.bus.remove_client(client)
+
+    def receive_frame(self, client, block):
+        with client.frame_ready:
+            if not client.frames and block:
+                client.frame_ready.wait(READ_TIMEOUT)
+            if client.frames:
+                return client.frames.popleft()
+        return None
+
+    def send_frame(self, client, can_id, data):
+        client.bus.send(client, can_id, data)
+        return 0
+
+
+class PythonRP1210Class(RP1210Class):
+    """
+    An RP1210Class whose functions come from a Python backend instead of a
+    vendor DLL.
+    """
+    def __init__(self, dll_name, adapter):
+        self.adapter = adapter
+        super(PythonRP1210Class, self).__init__(dll_name)
+
+    def find_dll_path(self):
+        return self.dll_name
+
+    def create_RP1210_functions(self):
+        self.ClientConnect = self.adapter.ClientConnect
+        self.ClientDisconnect = self.adapter.ClientDisconnect
+        self.SendMessage = self.adapter.SendMessage
+        self.ReadMessage = self.adapter.ReadMessage
+        self.SendCommand = self.adapter.SendCommand
+        self.ReadVersion = self.adapter.ReadVersion
+        self.ReadDetailedVersion = None
+        self.GetHardwareStatus = None
+        self.GetErrorMsg = self.adapter.GetErrorMsg
+        self.GetHardwareStatusEx = None
+        self.GetLastErrorMsg = None
+        return True
+
+
+def create_rp1210(dll_name):
+    """
+    Return the RP1210Class for a name from SelectRP1210: one of the Python
+    backends or the name of a vendor DLL.
+    """
+    if dll_name == SOCKETCAN_BACKEND:
+        return PythonRP1210Class(dll_name, SocketCANAdapter())
+    elif dll_name == VIRTUAL_BUS_BACKEND:
+        return PythonRP1210Class(dll_name, VirtualBusAdapter())
+    elif dll_name == SIMULATED_BACKEND:
+        from RP1210Simulator import SimulatedRP1210Class
+        return SimulatedRP1210Class(dll_name)
+    return RP1210Class(dll_name)
+
+def get_backend_configs():
+    """
+    Return the Python backends as dictionaries in the layout of the vendor
+    ini files, keyed by the name to pass to create_rp1210, so SelectRP1210
+    can list them with the RP1210 vendors.
+    """
+    configs = {}
+    configs[SIMULATED_BACKEND] = {
+        "VendorInformation": {"Name": "Simulated RP1210 Adapter"},
+        "DeviceInformation1": {"DeviceID": "1", "DeviceName": "Simulated",
+                               "DeviceDescription": "Generated J1939, J1708 and CAN traffic"},
+        "ProtocolInformation1": {"ProtocolString": "J1939", "ProtocolDescription": "Simulated J1939",
+                                 "ProtocolSpeed": "250,500", "Devices": "1"},
+        "ProtocolInformation2": {"ProtocolString": "J1708", "ProtocolDescription": "Simulated J1708",
+                                 "ProtocolSpeed": "", "Devices": "1"},
+        "ProtocolInformation3": {"ProtocolString": "CAN", "ProtocolDescription": "Simulated CAN",
+                                 "ProtocolSpeed": "250,500", "Devices": "1"}}
+    configs[VIRTUAL_BUS_BACKEND] = {
+        "VendorInformation": {"Name": "In-Process Virtual CAN Bus"},
+        "DeviceInformation1": {"DeviceID": "1", "DeviceName": "Virtual Bus 1",
+                               "DeviceDescription": "Clients of this program on the same bus"},
+        "ProtocolInformation1": {"ProtocolString": "J1939", "ProtocolDescription": "J1939 on the virtual bus",
+                                 "ProtocolSpeed": "250,500", "Devices": "1"},
+        "ProtocolInformation2": {"ProtocolString": "CAN", "ProtocolDescription": "CAN on the virtual bus",
+                                 "ProtocolSpeed": "250,500", "Devices": "1"}}
+    interfaces = list_socketcan_interfaces()
+    if interfaces:
+        devices = ",".join(str(i + 1) for i in range(len(interfaces)))
+        configs[SOCKETCAN_BACKEND] = {
+            "VendorInformation": {"Name": "Linux SocketCAN"},
+            "ProtocolInformation1": {"ProtocolString": "J1939", "ProtocolDescription": "J1939 on SocketCAN",
+                                     "ProtocolSpeed": "250,500", "Devices": devices},
+            "ProtocolInformation2": {"ProtocolString": "CAN", "ProtocolDescription": "CAN on SocketCAN",
+                                     "ProtocolSpeed": "250,500", "Devices": devices}}
+        for i, interface in enumerate(interfaces):
+            configs[SOCKETCAN_BACKEND]["DeviceInformation{}".format(i + 1)] = {
+                "DeviceID": str(i + 1), "DeviceName": interface,
+                "DeviceDescription": "SocketCAN interface {}".format(interface)}
+    return configs
@@ -0,0 +1,462 @@
+"""
+Capture files of the raw RP1210 traffic.
+
+The read thread copies every message it reads into a capture ring buffer, the
+same FrameRingBuffer the GUI reads from, so capturing costs the reader one
+more copy into a preallocated slot and never waits on the disk. A
+CaptureWriterThread drains the ring, packs each message into a record of
+
+    length (2 bytes), PC time (8 byte double), VDA time (4 bytes), raw message
+
+(the FRAME_RECORD of the spill files) and writes the records in large blocks.
+A capture file starts with a CAPTURE_HEADER. The writer starts a new file
+when the current one reaches a size or an age and calls fsync on a schedule,
+so at most a few seconds are lost if the computer loses power.
+
+Every block written gets an entry in a sparse index kept in a sidecar file
+next to the capture (the capture file name with .idx added). An entry has the
+PC times of the first and last message of the block, where the block is in
+the file and a Bloom filter of the J1939 PGNs and source addresses in it, so
+a reader can go straight to the blocks of a time range or a PGN and SA. See
+CaptureReader.
+
+A capture can also be compressed. Then a block is a few thousand messages
+compressed on their own with zlib or lzma behind a BLOCK_HEADER that has the
+number of messages, the times, the lengths and a CRC-32 of the uncompressed
+records. The data bytes of a J1939 message are stored XORed with the last
+data bytes of the same PGN and SA in the block, which turns the bytes that
+did not change into zeros. Nothing is carried from one block to the next, so
+every block can be checked and decompressed by itself, in any order or in
+parallel.
+"""
+import lzma
+import os
+import struct
+import threading
+import time
+import zlib
+
+from RingBuffer import FrameRingBuffer, FRAME_RECORD, DROP_NEWEST
+
+import logging
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b"CSUCAP\r\n"
+CAPTURE_VERSION = 2
+# Magic, version, codec of the blocks, protocol, PC time the file was started
+CAPTURE_HEADER = struct.Struct("<8sHB5x8sd")
+
+NO_COMPRESSION = "None"
+ZLIB_COMPRESSION = "zlib"
+LZMA_COMPRESSION = "lzma"
+# The codec numbers stored in the capture header and the block headers
+CAPTURE_CODECS = {NO_COMPRESSION: 0, ZLIB_COMPRESSION: 1, LZMA_COMPRESSION: 2}
+COMPRESSORS = {1: lambda raw: zlib.compress(raw, 6),
+               2: lambda raw: lzma.compress(raw, preset=1)}
+DECOMPRESSORS = {1: zlib.decompress,
+                 2: lzma.decompress}
+# Magic, codec, flags, number of messages, length of the uncompressed
+# records, length of the compressed records, CRC-32 of the uncompressed
+# records, PC time of the first and the last message
+BLOCK_HEADER = struct.Struct("<2sBBLLLLdd")
+BLOCK_MAGIC = b"CB"
+# The J1939 data bytes are XORed with the last ones of the same PGN and SA.
+BLOCK_DELTA = 0x01
+# Messages in a compressed block
+COMPRESSED_BLOCK_FRAMES = 4096
+
+# Slots in the capture ring. This is several seconds of a fully loaded bus.
+CAPTURE_RING_SLOTS = 1 << 16
+# Bytes of records collected before they are written
+CAPTURE_BLOCK_SIZE = 1 << 20
+# Seconds a partly filled block waits before it is written anyway
+CAPTURE_FLUSH_INTERVAL = 1.0
+# Seconds between calls to fsync
+CAPTURE_FSYNC_INTERVAL = 5.0
+# A new file is started after this many bytes or seconds.
+CAPTURE_MAX_BYTES = 256 << 20
+CAPTURE_MAX_SECONDS = 3600
+
+INDEX_MAGIC = b"CSUIDX\r\n"
+INDEX_VERSION = 1
+INDEX_EXTENSION = ".idx"
+# Magic, version
+INDEX_HEADER = struct.Struct("<8sH6x")
+BLOOM_BYTES = 128
+BLOOM_BITS = BLOOM_BYTES * 8
+# PC time of the first and the last message, file offset, length in bytes,
+# number of messages, Bloom filter
+INDEX_ENTRY = struct.Struct("<ddQLL{}s".format(BLOOM_BYTES))
+
+# The keys added to the Bloom filter for a J1939 message, so it can be looked
+# up by PGN and SA, by PGN only or by SA only.
+BLOOM_PGN_SA = 0
+BLOOM_PGN = 1 << 28
+BLOOM_SA = 2 << 28
+
+
+def bloom_mask(key):
+    """
+    Return the Bloom filter bits of a key as an integer with 3 bits set.
+    """
+    h = zlib.crc32(key.to_bytes(4, 'little'))
+    return (1 << (h % BLOOM_BITS)) | (1 << ((h >> 10) % BLOOM_BITS)) | (1 << ((h >> 20) % BLOOM_BITS))
+
+def j1939_bloom_mask(pgn, sa):
+    """
+    Return the Bloom filter bits of a J1939 message.
+    """
+    return (bloom_mask(BLOOM_PGN_SA | (pgn << 8) | sa) |
+            bloom_mask(BLOOM_PGN | pgn) |
+            bloom_mask(BLOOM_SA | sa))
+
+def query_bloom_mask(pgn=None, sa=None):
+    """
+    Return the bits a block's Bloom filter has to have to possibly hold a
+    message with the PGN and SA, or 0 if both are None.
+    """
+    if pgn is not None and sa is not None:
+        return bloom_mask(BLOOM_PGN_SA | (pgn << 8) | sa)
+    elif pgn is not None:
+        return bloom_mask(BLOOM_PGN | pgn)
+    elif sa is not None:
+        return bloom_mask(BLOOM_SA | sa)
+    return 0
+
+def get_index_filename(filename):
+    return filename + INDEX_EXTENSION
+
+def make_capture_ring():
+    """
+    Return a ring buffer for a read thread's capture_queue.
+    """
+    return FrameRingBuffer(CAPTURE_RING_SLOTS, overflow_policy=DROP_NEWEST)
+
+def read_capture_header(capture_file):
+    """
+    Read the header at the start of a capture file and return the protocol,
+    the PC time the file was started and the codec of its blocks.
+    """
+    magic, version, codec, protocol, start_time = CAPTURE_HEADER.unpack(capture_file.read(CAPTURE_HEADER.size))
+    if magic != CAPTURE_MAGIC:
+        raise ValueError("{} is not an RP1210 capture file.".format(getattr(capture_file, "name", capture_file)))
+    if version > CAPTURE_VERSION:
+        raise ValueError("Capture file version {} is not supported.".format(version))
+    if codec and codec not in DECOMPRESSORS:
+        raise ValueError("Capture codec {} is not supported.".format(codec))
+    return protocol.rstrip(b'\x00').decode('ascii'), start_time, codec
+
+def xor_bytes(data, previous):
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(previous, 'little')).to_bytes(len(data), 'little')
+
+def decode_block(buffer, offset, protocol):
+    """
+    Check and decompress the block at offset in a compressed capture.
+    Returns the block header and a list of its messages as (current_time,
+    vda_time, data). Raises ValueError if the block is damaged.
+    """
+    try:
+        magic, codec, flags, count, raw_length, compressed_length, crc, first_time, last_time = \
+            BLOCK_HEADER.unpack_from(buffer, offset)
+    except struct.error:
+        raise ValueError("The block at {} is cut short.".format(offset))
+    if magic != BLOCK_MAGIC or codec not in DECOMPRESSORS:
+        raise ValueError("There is no block at {}.".format(offset))
+    start = offset + BLOCK_HEADER.size
+    try:
+        raw = DECOMPRESSORS[codec](buffer[start:start + compressed_length])
+    except (zlib.error, lzma.LZMAError, EOFError) as e:
+        raise ValueError("The block at {} does not decompress: {}".format(offset, repr(e)))
+    if len(raw) != raw_length or zlib.crc32(raw) != crc:
+        raise ValueError("The block at {} fails its CRC check.".format(offset))
+    messages = []
+    delta = flags & BLOCK_DELTA and protocol == "J1939"
+    payloads = {}
+    position = 0
+    for i in range(count):
+        length, current_time, vda_time = FRAME_RECORD.unpack_from(raw, position)
+        position += FRAME_RECORD.size
+        data = raw[position:position + length]
+        position += length
+        if delta and length > 11:
+            key = (data[5] | (data[6] << 8) | (data[7] << 16)) << 8 | data[9]
+            previous = payloads.get(key)
+            if previous is not None and len(previous) == length - 11:
+                data = data[:11] + xor_bytes(data[11:], previous)
+            payloads[key] = data[11:]
+        messages.append((current_time, vda_time, data))
+    header = (codec, flags, count, raw_length, compressed_length, crc, first_time, last_time)
+    return header, messages
+
+def iter_capture(filename):
+    """
+    Yield the (current_time, vda_time, data) of each message in a capture
+    file. A record or block cut short at the end of the file is ignored, and
+    a damaged block is skipped.
+    """
+    with open(filename, 'rb') as capture_file:
+        protocol, start_time, codec = read_capture_header(capture_file)
+        if codec:
+            capture_file.seek(0)
+            contents = capture_file.read()
+            offset = CAPTURE_HEADER.size
+            while offset + BLOCK_HEADER.size <= len(contents):
+                compressed_length = BLOCK_HEADER.unpack_from(contents, offset)[5]
+                try:
+                    header, messages = decode_block(contents, offset, protocol)
+                except ValueError as e:
+                    logger.warning(str(e))
+                    if contents[offset:offset + 2] != BLOCK_MAGIC:
+                        return
+                else:
+                    yield from messages
+                offset += BLOCK_HEADER.size + compressed_length
+            return
+        while True:
+            record = capture_file.read(FRAME_RECORD.size)
+            if len(record) < FRAME_RECORD.size:
+                return
+            length, current_time, vda_time = FRAME_RECORD.unpack(record)
+            data = capture_file.read(length)
+            if len(data) < length:
+                return
+            yield (current_time, vda_time, data)
+
+
+class CaptureWriterThread(threading.Thread):
+    """
+    Writes the messages of a capture ring buffer to capture files. The files
+    are named after base_filename with the time they were started, like
+    J1939NetworkTraffic_20200101_120000.bin.
+    """
+    def __init__(self, capture_queue, base_filename, protocol,
+                 max_bytes=CAPTURE_MAX_BYTES, max_seconds=CAPTURE_MAX_SECONDS,
+                 fsync_interval=CAPTURE_FSYNC_INTERVAL, block_size=CAPTURE_BLOCK_SIZE,
+                 compression=NO_COMPRESSION, block_frames=COMPRESSED_BLOCK_FRAMES):
+        threading.Thread.__init__(self)
+        self.capture_queue = capture_queue
+        self.base_filename = base_filename
+        self.protocol = protocol
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.block_size = block_size
+        self.codec = CAPTURE_CODECS[compression]
+        # Compressed blocks are cut by the number of messages.
+        self.block_frames = block_frames if self.codec else 1 << 32
+        self.delta = self.codec and protocol == "J1939"
+        self.block_payloads = {}
+        self.runSignal = True
+        self.capture_file = None
+        self.filename = None
+        self.filenames = []
+        self.block = bytearray()
+        self.index_file = None
+        self.file_start_time = 0
+        self.file_open_time = 0
+        self.file_bytes = 0
+        self.block_time = 0
+        self.block_open_time = 0
+        self.block_last_time = 0
+        self.block_count = 0
+        self.block_bloom = 0
+        self.bloom_masks = {}
+        self.fsync_time = 0
+        self.frame_count = 0
+        self.byte_count = 0
+        self.raw_byte_count = 0
+        self.error = None
+
+    def run(self):
+        logger.debug("Capturing {} to {}".format(self.protocol, self.base_filename))
+        try:
+            while self.runSignal:
+                if not self.write_frames():
+                    time.sleep(0.01)
+                self.check_schedule(time.time())
+            # Take what the read thread left in the ring.
+            self.write_frames()
+        except (OSError, ValueError) as e:
+            self.error = e
+            logger.warning(repr(e))
+            logger.warning("Stopped capturing {}.".format(self.protocol))
+        finally:
+            self.close_file()
+        logger.debug("Capture writer for {} is finished. {} messages in {}".format(
+            self.protocol, self.frame_count, self.filenames))
+
+    def write_frames(self):
+        """
+        Move the waiting messages into the block. Returns the number of
+        messages.
+        """
+        count = 0
+        block = self.block
+        bloom_masks = self.bloom_masks
+        payloads = self.block_payloads
+        j1939 = self.protocol == "J1939"
+        for current_time, vda_time, data in self.capture_queue.iter_views(self.capture_queue.slot_count):
+            if self.capture_file is None:
+                self.open_file(current_time)
+            if not block:
+                self.block_time = current_time
+                self.block_open_time = time.time()
+            length = len(data)
+            block += FRAME_RECORD.pack(length, current_time, vda_time)
+            self.block_last_time = current_time
+            self.block_count += 1
+            if j1939 and length > 9:
+                key = (data[5] | (data[6] << 8) | (data[7] << 16)) << 8 | data[9]
+                mask = bloom_masks.get(key)
+                if mask is None:
+                    mask = j1939_bloom_mask(key >> 8, key & 0xFF)
+                    bloom_masks[key] = mask
+                self.block_bloom |= mask
+                if self.delta and length > 11:
+                    payload = bytes(data[11:])
+                    previous = payloads.get(key)
+                    payloads[key] = payload
+                    if previous is not None and len(previous) == length - 11:
+                        block += data[:11]
+                        block += xor_bytes(payload, previous)
+                        data = None
+            if data is not None:
+                block += data
+            count += 1
+            if len(block) >= self.block_size or self.block_count >= self.block_frames:
+                self.write_block()
+                self.check_rotation(time.time())
+        self.frame_count += count
+        return count
+
+    def check_schedule(self, now):
+        if self.capture_file is None:
+            return
+        if self.block and now - self.block_open_time >= CAPTURE_FLUSH_INTERVAL:
+            self.write_block()
+        if now - self.fsync_time >= self.fsync_interval:
+            self.sync()
+        self.check_rotation(now)
+
+    def check_rotation(self, now):
+        if self.file_bytes + len(self.block) >= self.max_bytes or now - self.file_open_time >= self.max_seconds:
+            self.close_file()
+
+    def open_file(self, current_time):
+        stem, extension = os.path.splitext(self.base_filename)
+        self.filename = "{}_{}{}".format(stem, time.strftime("%Y%m%d_%H%M%S", time.localtime(current_time)), extension)
+        if self.filename in self.filenames:
+            self.filename = "{}_{}_{}{}".format(stem, time.strftime("%Y%m%d_%H%M%S", time.localtime(current_time)),
+                                                len(self.filenames), extension)
+        self.capture_file = open(self.filename, 'wb')
+        self.index_file = open(get_index_filename(self.filename), 'wb')
+        self.filenames.append(self.filename)
+        self.capture_file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, self.codec,
+                                                    self.protocol.encode('ascii'), current_time))
+        self.index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION))
+        self.file_start_time = current_time
+        self.file_bytes = CAPTURE_HEADER.size
+        self.file_open_time = time.time()
+        self.fsync_time = self.file_open_time
+        logger.info("Capturing {} to {}".format(self.protocol, self.filename))
+
+    def write_block(self):
+        if self.block:
+            self.raw_byte_count += len(self.block)
+            if self.codec:
+                compressed = COMPRESSORS[self.codec](self.block)
+                header = BLOCK_HEADER.pack(BLOCK_MAGIC, self.codec, BLOCK_DELTA if self.delta else 0,
+                                           self.block_count, len(self.block), len(compressed),
+                                           zlib.crc32(self.block), self.block_time, self.block_last_time)
+                self.capture_file.write(header)
+                self.capture_file.write(compressed)
+                length = len(header) + len(compressed)
+            else:
+                self.capture_file.write(self.block)
+                length = len(self.block)
+            # The index entry goes out after its block, so an entry never
+            # points past the end of the capture file.
+            bloom = self.block_bloom if self.protocol == "J1939" else (1 << BLOOM_BITS) - 1
+            self.index_file.write(INDEX_ENTRY.pack(self.block_time, self.block_last_time, self.file_bytes,
+                                                   length, self.block_count,
+                                                   bloom.to_bytes(BLOOM_BYTES, 'little')))
+            self.file_bytes += length
+            self.byte_count += length
+            self.block.clear()
+            self.block_payloads.clear()
+            self.block_count = 0
+            self.block_bloom = 0
+
+    def sync(self):
+        self.capture_file.flush()
+        os.fsync(self.capture_file.fileno())
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        self.fsync_time = time.time()
+
+    def close_file(self):
+        if self.capture_file is None:
+            return
+        try:
+            self.write_block()
+            self.sync()
+        finally:
+            self.capture_file.close()
+            self.index_file.close()
+            self.capture_file = None
+            self.index_file = None
+
+    def get_stats(self):
+        ring_stats = self.capture_queue.get_stats()
+        return {"Files": list(self.filenames),
+                "Messages": self.frame_count,
+                "Bytes": self.byte_count,
+                "Uncompressed Bytes": self.raw_byte_count,
+                "Queued": ring_stats["Queued"],
+                "Dropped Count": ring_stats["Dropped Count"]}
+
+
+def benchmark(duration=5.0):
+    """
+    Read the simulated adapter as fast as it goes with and without capturing
+    and print the messages per second of the read thread and the writer.
+    """
+    import tempfile
+    from RP1210 import RP1210ReadMessageThread
+    from RP1210Simulator import SimulatedRP1210Class, SimulatedAdapter
+    for capture in [False, True]:
+        rp1210 = SimulatedRP1210Class(adapter=SimulatedAdapter(rates={"J1939": 0}))
+        nClientID = rp1210.get_client_id("J1939", 1, "500")
+        rx_queue = FrameRingBuffer()
+        read_thread = RP1210ReadMessageThread(None, rx_queue, FrameRingBuffer(100), rp1210.ReadMessage,
+                                              nClientID, "J1939", "Simulated")
+        read_thread.setDaemon(True)
+        writer = None
+        if capture:
+            read_thread.capture_queue = make_capture_ring()
+            writer = CaptureWriterThread(read_thread.capture_queue,
+                                         os.path.join(tempfile.gettempdir(), "J1939Benchmark.bin"), "J1939")
+            writer.start()
+        start_time = time.time()
+        read_thread.start()
+        while time.time() - start_time < duration:
+            rx_queue.get_batch()
+            time.sleep(0.001)
+        read_thread.runSignal = False
+        read_thread.join()
+        elapsed = time.time() - start_time
+        print("Capture {}".format("on" if capture else "off"))
+        print("Read:    {:10.0f} messages/s".format(read_thread.message_count / elapsed))
+        if writer is not None:
+            writer.runSignal = False
+            writer.join()
+            stats = writer.get_stats()
+            print("Written: {:10.0f} messages/s".format(stats["Messages"] / elapsed))
+            print("Dropped: {:10d} messages".format(stats["Dropped Count"]))
+            print("Check:   {:10d} messages read back".format(sum(1 for message in iter_capture(stats["Files"][0]))))
+            for filename in stats["Files"]:
+                os.remove(filename)
+                os.remove(get_index_filename(filename))
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,233 @@
+"""
+Message filters that run in the vehicle diagnostic adapter (VDA).
+
+Filtering in Python means every message still crosses the USB link and is
+copied by the read thread before it is thrown away. The RP1210 API can filter
+in the adapter instead. A filter set is a declarative list of the messages to
+pass or to block, like
+
+    {"Mode": "Block",
+     "Filters": [{"PGN": 61444, "SA": 0},
+                 {"PGN": 65215}]}
+
+for J1939 (the keys are PGN, Priority, SA and DA),
+
+    {"Mode": "Pass",
+     "Filters": [{"CAN ID": 0x18FEF100, "Mask": 0x1FFFFFFF, "Extended": True}]}
+
+for CAN and
+
+    {"Mode": "Pass", "Filters": [{"MID": 128}]}
+
+for J1708. The filter manager turns a filter set into the buffers of the
+RP1210_Set_Message_Filtering_For_* commands and sends them to a client. The
+filters can be changed at any time without reconnecting.
+
+Blocking needs the exclusive filter type, which not every adapter supports.
+When it is refused, all messages are passed and J1939 messages are blocked
+in the read thread like before.
+"""
+import struct
+
+from RP1210Functions import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+PASS_LISTED = "Pass"
+BLOCK_LISTED = "Block"
+FILTER_MODES = [PASS_LISTED, BLOCK_LISTED]
+
+# Flags, PGN (LSB first), priority, source address, destination address
+J1939_FILTER = struct.Struct("<BHBBBB")
+# CAN type, mask and header (MSB first)
+CAN_FILTER = struct.Struct(">BLL")
+
+FILTER_COMMANDS = {"J1939": RP1210_Set_Message_Filtering_For_J1939,
+                   "CAN": RP1210_Set_Message_Filtering_For_CAN,
+                   "J1708": RP1210_Set_Message_Filtering_For_J1708}
+FILTER_TYPE_COMMANDS = {"J1939": RP1210_Set_J1939_Filter_Type,
+                        "CAN": RP1210_Set_CAN_Filter_Type,
+                        "J1708": RP1210_Set_J1708_Filter_Type}
+
+
+def build_j1939_filter(entry):
+    """
+    Return the 7 byte RP1210 J1939 filter for a dictionary with any of the
+    keys PGN, Priority, SA and DA. Missing keys match anything.
+    """
+    flags = 0
+    if "PGN" in entry:
+        flags |= FILTER_PGN
+    if "Priority" in entry:
+        flags |= FILTER_PRIORITY
+    if "SA" in entry:
+        flags |= FILTER_SOURCE
+    if "DA" in entry:
+        flags |= FILTER_DESTINATION
+    if not flags:
+        raise ValueError("A J1939 filter needs a PGN, Priority, SA or DA.")
+    pgn = entry.get("PGN", 0)
+    return J1939_FILTER.pack(flags, pgn & 0xFFFF, (pgn >> 16) & 0x03,
+                             entry.get("Priority", 0), entry.get("SA", 0), entry.get("DA", 0))
+
+def build_can_filter(entry):
+    """
+    Return the 9 byte RP1210 CAN filter for a dictionary with a CAN ID and
+    optionally a Mask and whether the ID is Extended (29 bits).
+    """
+    can_id = entry["CAN ID"]
+    extended = entry.get("Extended", can_id > 0x7FF)
+    mask = entry.get("Mask", 0x1FFFFFFF if extended else 0x7FF)
+    return CAN_FILTER.pack(EXTENDED_CAN if extended else STANDARD_CAN, mask, can_id)
+
+def build_j1708_filter(entry):
+    """
+    Return the 1 byte RP1210 J1708 filter for a dictionary with a MID.
+    """
+    return bytes([entry["MID"]])
+
+FILTER_BUILDERS = {"J1939": build_j1939_filter,
+                   "CAN": build_can_filter,
+                   "J1708": build_j1708_filter}
+
+
+class RP1210FilterSet():
+    """
+    The messages to pass or to block for one protocol.
+    """
+    def __init__(self, protocol, filters=[], mode=BLOCK_LISTED):
+        if protocol not in FILTER_BUILDERS:
+            raise ValueError("Filters are not supported for {}.".format(protocol))
+        if mode not in FILTER_MODES:
+            raise ValueError("Unknown filter mode: {}".format(mode))
+        self.protocol = protocol
+        self.mode = mode
+        self.filters = [dict(entry) for entry in filters]
+        # Build the command buffer now, so a bad entry is found before
+        # anything is sent to the adapter.
+        self.command_bytes = b''.join(FILTER_BUILDERS[protocol](entry) for entry in self.filters)
+        self.compile_j1939()
+
+    @classmethod
+    def from_dict(cls, protocol, settings):
+        return cls(protocol, settings.get("Filters", []), settings.get("Mode", BLOCK_LISTED))
+
+    def to_dict(self):
+        return {"Mode": self.mode, "Filters": [dict(entry) for entry in self.filters]}
+
+    def passes_all(self):
+        return self.mode == BLOCK_LISTED and not self.filters
+
+    def compile_j1939(self):
+        """
+        Sort the J1939 filters into sets, so the read thread can check a
+        message with a few lookups when the adapter cannot do the filtering.
+        """
+        self.keys = set() # (PGN << 8) | SA
+        self.pgns = set()
+        self.sources = set()
+        self.others = []
+        if self.protocol != "J1939":
+            return
+        for entry in self.filters:
+            fields = set(entry.keys())
+            if fields == {"PGN", "SA"}:
+                self.keys.add((entry["PGN"] << 8) | entry["SA"])
+            elif fields == {"PGN"}:
+                self.pgns.add(entry["PGN"])
+            elif fields == {"SA"}:
+                self.sources.add(entry["SA"])
+            else:
+                self.others.append(entry)
+
+    def matches_j1939(self, pgn, priority, sa, da):
+        if (pgn << 8) | sa in self.keys or pgn in self.pgns or sa in self.sources:
+            return True
+        for entry in self.others:
+            if (entry.get("PGN", pgn) == pgn and entry.get("Priority", priority) == priority and
+                    entry.get("SA", sa) == sa and entry.get("DA", da) == da):
+                return True
+        return False
+
+    def passes_j1939(self, pgn, priority, sa, da):
+        """
+        Return True if a J1939 message gets through this filter set.
+        """
+        return self.matches_j1939(pgn, priority, sa, da) != (self.mode == BLOCK_LISTED)
+
+    def __repr__(self):
+        return "<RP1210FilterSet {} {} {} filters>".format(self.protocol, self.mode, len(self.filters))
+
+
+class RP1210FilterManager():
+    """
+    Keeps the filter set of each connected client and sends it to the
+    adapter. send_command is RP1210Class.send_command.
+    """
+    def __init__(self, send_command):
+        self.send_command = send_command
+        self.client_ids = {}
+        self.filter_sets = {}
+        self.in_hardware = {}
+
+    def add_client(self, protocol, nClientID):
+        self.client_ids[protocol] = nClientID
+
+    def remove_clients(self):
+        self.client_ids = {}
+        self.in_hardware = {}
+
+    def set_filters(self, protocol, filter_set):
+        """
+        Send a filter set to the client of a protocol. Returns 0, or the
+        RP1210 return value of the command that passes all messages when the
+        adapter could not filter. A protocol without a filter manager
+        command, or without a filter set, passes everything.
+        """
+        if filter_set is None:
+            filter_set = RP1210FilterSet(protocol) if protocol in FILTER_BUILDERS else None
+        self.filter_sets[protocol] = filter_set
+        nClientID = self.client_ids.get(protocol)
+        if nClientID is None:
+            return 0
+        self.in_hardware[protocol] = False
+        if filter_set is None or filter_set.passes_all():
+            return_value = self.send_command(RP1210_Set_All_Filters_States_to_Pass, nClientID, b'')
+            self.in_hardware[protocol] = (return_value == 0)
+            return return_value
+
+        # Clear the filters that were set before.
+        return_value = self.send_command(RP1210_Set_All_Filters_States_to_Discard, nClientID, b'')
+        if return_value != 0:
+            logger.debug("The adapter returned {} for Set_All_Filters_States_to_Discard.".format(return_value))
+        elif not filter_set.filters:
+            # Pass nothing
+            self.in_hardware[protocol] = True
+            return 0
+        else:
+            filter_type = FILTER_EXCLUSIVE if filter_set.mode == BLOCK_LISTED else FILTER_INCLUSIVE
+            return_value = self.send_command(FILTER_TYPE_COMMANDS[protocol], nClientID, bytes([filter_type]))
+            if return_value == 0 or filter_type == FILTER_INCLUSIVE:
+                # Inclusive is the default, so adapters without the filter
+                # type command can still pass the listed messages.
+                return_value = self.send_command(FILTER_COMMANDS[protocol], nClientID, filter_set.command_bytes)
+                if return_value == 0:
+                    self.in_hardware[protocol] = True
+                    logger.info("The adapter is filtering {} with {}".format(protocol, filter_set))
+                    return 0
+        if protocol == "J1939":
+            logger.info("The adapter could not filter J1939. Filtering in the read thread instead.")
+        else:
+            logger.warning("The adapter could not filter {}. All messages are passed.".format(protocol))
+        return self.send_command(RP1210_Set_All_Filters_States_to_Pass, nClientID, b'')
+
+    def get_software_filter(self, protocol):
+        """
+        Return the filter set the read thread has to apply itself, or None
+        if the adapter does the filtering or everything is passed.
+        """
+        filter_set = self.filter_sets.get(protocol)
+        if filter_set is None or filter_set.passes_all() or self.in_hardware.get(protocol, False):
+            return None
+        return filter_set
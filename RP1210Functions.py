@@ -1,6 +1,7 @@
 import time
 import traceback
 import string
+import struct
 import logging
 logger = logging.getLogger(__name__)
 
@@ -40,6 +41,24 @@ def hex_string_to_bytes(hex_string):
 def get_local_time_string(ts):
     return time.strftime("%A, %d %b %Y at %H:%M:%S %Z", time.localtime(ts))
 
+# Every message from RP1210_ReadMessage starts with the time stamp of the VDA
+# (big endian) and the echo byte.
+RP1210_MESSAGE_HEADER = struct.Struct(">LB")
+# A J1939 message follows with the PGN as a little endian word and a high
+# byte, the how/priority byte, the source address and the destination address.
+J1939_MESSAGE_HEADER = struct.Struct("<HBBBB")
+J1939_HEADER_LENGTH = 11
+
+def parse_j1939_header(rx_buffer):
+    """
+    Return (vda_time, echo, pgn, priority, sa, da) from a J1939 message in the
+    RP1210_ReadMessage format. The buffer can be a memoryview, so nothing is
+    copied.
+    """
+    vda_time, echo = RP1210_MESSAGE_HEADER.unpack_from(rx_buffer)
+    pgn_low, pgn_high, priority, sa, da = J1939_MESSAGE_HEADER.unpack_from(rx_buffer, 5)
+    return (vda_time, echo, pgn_low | (pgn_high << 16), priority, sa, da)
+
 
 # A file with constants useful for RP1210 accplications
 
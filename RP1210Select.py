@@ -17,6 +17,7 @@ import configparser
 import traceback
 import logging
 from RP1210 import get_storage_path
+from RP1210Backends import get_backend_configs
 logger = logging.getLogger(__name__)
 
 class SelectRP1210(QDialog):
@@ -26,17 +27,21 @@ class SelectRP1210(QDialog):
     def __init__(self,title):
         super(SelectRP1210,self).__init__()
         RP1210_config = configparser.ConfigParser()
+        self.current_api_index = 0
+        self.rp1201_missing = False
         try:
             RP1210_config.read(os.path.join(os.environ["WINDIR"],"RP121032.ini"))
             self.apis = sorted(RP1210_config["RP1210Support"]["apiimplementations"].split(","))
-            self.current_api_index = 0
             logger.debug("Current RP1210 APIs installed are: " + ", ".join(self.apis))
-            self.rp1201_missing = False
         except:
             logger.warning(traceback.format_exc())
-            QMessageBox.warning(self,"No RP1210 Device","The RP121032.ini file was not found. Please install an RP1210 compliant Vehicle Diagnostics adatper.")
-            self.rp1201_missing = True
-            return
+            self.apis = []
+            if os.name == 'nt':
+                QMessageBox.warning(self,"No RP1210 Device","The RP121032.ini file was not found. Please install an RP1210 compliant Vehicle Diagnostics adatper.")
+        # The Python backends come after the vendor DLLs, so the saved
+        # selection indexes of the DLLs do not change.
+        self.backend_configs = get_backend_configs()
+        self.apis.extend(sorted(self.backend_configs))
         storage = get_storage_path()
         self.selection_filename = os.path.join(storage,"RP1210_selection.txt")
         logger.debug(f"selection_filename path: {self.selection_filename}")
@@ -132,7 +137,10 @@ class SelectRP1210(QDialog):
         for api_string in self.apis:
             self.vendor_configs[api_string] = configparser.ConfigParser()
             try:
-                self.vendor_configs[api_string].read(os.path.join(os.environ["WINDIR"],api_string + ".ini"))
+                if api_string in self.backend_configs:
+                    self.vendor_configs[api_string].read_dict(self.backend_configs[api_string])
+                else:
+                    self.vendor_configs[api_string].read(os.path.join(os.environ["WINDIR"],api_string + ".ini"))
                 #logger.debug("api_string = {}".format(api_string))
                 #logger.debug("The api ini file has the following sections:")
                 #logger.debug(vendor_config.sections())
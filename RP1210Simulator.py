@@ -0,0 +1,222 @@
+"""
+A simulated RP1210 adapter in pure Python.
+
+RP1210Class needs a vendor DLL loaded with windll, so the receive pipeline can
+only be measured on a Windows computer with a vehicle diagnostic adapter
+(VDA). SimulatedRP1210Class has the same ClientConnect, ClientDisconnect,
+ReadMessage, SendMessage and SendCommand functions, called with the same
+ctypes arguments, but the messages come from a generator or from a list of
+recorded frames. RP1210ReadMessageThread, read_rp1210 and the decoders can
+then be load tested on any computer.
+
+Every client has its own source of frames at a rate in frames per second. A
+rate of 0 delivers the frames as fast as they are read. Echo mode and the
+RP1210 message filters are honored like an adapter would.
+"""
+import collections
+import itertools
+import random
+import struct
+import time
+
+from RP1210 import RP1210ReadMessageThread
+from RP1210Functions import *
+from RP1210Backends import *
+
+import logging
+logger = logging.getLogger(__name__)
+
+SIMULATED_DLL_NAME = SIMULATED_BACKEND
+DEFAULT_RATE = 2000.0 # frames per second
+ECHO_QUEUE_SIZE = 1000
+
+
+def generate_j1939_frames(seed=0):
+    """
+    Yield (protocol payload) of J1939 broadcast messages from a few source
+    addresses: PGN (3 bytes, LSB first), priority, SA, DA and 8 data bytes.
+    """
+    rnd = random.Random(seed)
+    messages = [(61444, 3, 0), (61443, 3, 0), (65265, 6, 0), (65262, 6, 0), (65263, 6, 0),
+                (65270, 6, 0), (65266, 6, 0), (65271, 6, 0), (61442, 3, 3), (65272, 6, 3),
+                (61441, 6, 11), (65215, 6, 11), (65134, 6, 11), (65269, 6, 0), (65253, 6, 0)]
+    data = [bytearray(rnd.randrange(256) for i in range(8)) for message in messages]
+    for count in itertools.count():
+        index = count % len(messages)
+        pgn, priority, sa = messages[index]
+        # Change a byte now and then like a live value.
+        if rnd.random() < 0.2:
+            data[index][rnd.randrange(8)] = rnd.randrange(256)
+        yield bytes([pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16, priority, sa, 0xFF]) + bytes(data[index])
+
+def generate_j1708_frames(seed=0):
+    """
+    Yield J1708 messages: MID followed by J1587 parameters.
+    """
+    rnd = random.Random(seed)
+    for count in itertools.count():
+        speed = rnd.randrange(256)
+        rpm = rnd.randrange(65536)
+        if count % 2:
+            yield bytes([128, 84, speed, 190, rpm & 0xFF, rpm >> 8])
+        else:
+            yield bytes([128, 168, rnd.randrange(256), 1])
+
+def generate_can_frames(seed=0):
+    """
+    Yield CAN messages: type, identifier (MSB first) and data.
+    """
+    rnd = random.Random(seed)
+    for count in itertools.count():
+        if count % 3:
+            yield bytes([STANDARD_CAN]) + struct.pack(">H", 0x100 + count % 16) + bytes(rnd.randrange(256) for i in range(8))
+        else:
+            yield bytes([EXTENDED_CAN]) + struct.pack(">L", 0x18FEF100 | (count % 4)) + bytes(rnd.randrange(256) for i in range(8))
+
+FRAME_GENERATORS = {"J1939": generate_j1939_frames,
+                    "J1708": generate_j1708_frames,
+                    "CAN": generate_can_frames}
+
+
+class SimulatedClient(BackendClient):
+    """
+    The state of one connected client of the simulated adapter.
+    """
+    def __init__(self, protocol, frames, rate):
+        BackendClient.__init__(self, protocol)
+        self.frames = iter(frames)
+        self.rate = rate
+        self.frame_count = 0
+        self.echo_queue = collections.deque(maxlen=ECHO_QUEUE_SIZE)
+
+    def next_due(self):
+        """
+        Return the perf_counter time the next frame is due, or 0 if the rate
+        is not limited.
+        """
+        if not self.rate:
+            return 0
+        return self.start_time + self.frame_count / self.rate
+
+
+class SimulatedAdapter(PythonAdapter):
+    """
+    The RP1210 API functions of a simulated adapter. sources can give an
+    iterable of protocol payloads for each protocol, like recorded frames to
+    replay; protocols without a source use the built in generators. rates
+    gives the frames per second of each protocol.
+    """
+    protocols = list(FRAME_GENERATORS)
+
+    def __init__(self, sources={}, rates={}, default_rate=DEFAULT_RATE, max_clients=16):
+        PythonAdapter.__init__(self, max_clients)
+        self.sources = dict(sources)
+        self.rates = dict(rates)
+        self.default_rate = default_rate
+        self.connected = True
+
+    def connect_client(self, nClientID, nDeviceID, protocol):
+        frames = self.sources.get(protocol)
+        if frames is None:
+            frames = FRAME_GENERATORS[protocol](nClientID)
+        return SimulatedClient(protocol, frames, self.rates.get(protocol, self.default_rate))
+
+    def ReadMessage(self, nClientID, fpchAPIMessage, nBufferSize, nBlockOnRead):
+        """
+        Copy the next message for the client into the buffer in the
+        RP1210_ReadMessage format and return its length. Returns 0 if no
+        message is due and the read does not block.
+        """
+        client = self.get_client(nClientID)
+        if client is None:
+            return -ERR_INVALID_CLIENT_ID
+        while True:
+            if client.echo_queue:
+                payload = client.echo_queue.popleft()
+                echo = 1
+                break
+            due = client.next_due()
+            now = time.perf_counter()
+            if due > now:
+                if not get_value(nBlockOnRead):
+                    return 0
+                time.sleep(min(due - now, READ_TIMEOUT))
+                if self.get_client(nClientID) is not client:
+                    return -ERR_INVALID_CLIENT_ID
+                continue
+            try:
+                payload = next(client.frames)
+            except StopIteration:
+                if not get_value(nBlockOnRead):
+                    return 0
+                # The replay is over. Act like a quiet network.
+                time.sleep(READ_TIMEOUT)
+                if self.get_client(nClientID) is not client:
+                    return -ERR_INVALID_CLIENT_ID
+                continue
+            client.frame_count += 1
+            if client.passes(payload):
+                echo = 0
+                break
+            client.filtered_count += 1
+        return self.write_message(client, fpchAPIMessage, nBufferSize, echo, payload)
+
+    def SendMessage(self, nClientID, fpchClientMessage, nMessageSize, nNotifyStatusOnTx, nBlockOnSend):
+        client = self.get_client(nClientID)
+        if client is None:
+            return ERR_INVALID_CLIENT_ID
+        message = bytes(get_buffer(fpchClientMessage)[:get_value(nMessageSize)])
+        client.sent_count += 1
+        if client.echo:
+            if client.protocol == "J1708":
+                message = message[1:] # Take off the priority
+            client.echo_queue.append(message)
+        return 0
+
+
+class SimulatedRP1210Class(PythonRP1210Class):
+    """
+    An RP1210Class whose functions are those of a SimulatedAdapter instead
+    of a vendor DLL.
+    """
+    def __init__(self, dll_name=SIMULATED_DLL_NAME, adapter=None):
+        super(SimulatedRP1210Class, self).__init__(dll_name, adapter if adapter is not None else SimulatedAdapter())
+
+
+def benchmark(rate=0, duration=5.0):
+    """
+    Run a J1939 read thread against the simulated adapter and decode the
+    frames like the J1939 worker process does. Prints the frames per second
+    that were read and decoded and the number of frames the ring dropped.
+    """
+    from RingBuffer import FrameRingBuffer, DROP_OLDEST
+    from J1939Database import load_j1939db
+    from J1939Worker import SharedJ1939State, J1939StateDecoder
+    rp1210 = SimulatedRP1210Class(adapter=SimulatedAdapter(rates={"J1939": rate}))
+    nClientID = rp1210.get_client_id("J1939", 1, "500")
+    rp1210.send_command(RP1210_Echo_Transmitted_Messages, nClientID, bytes([ECHO_ON]))
+    rx_queue = FrameRingBuffer(overflow_policy=DROP_OLDEST)
+    read_thread = RP1210ReadMessageThread(None, rx_queue, FrameRingBuffer(100), rp1210.ReadMessage,
+                                          nClientID, "J1939", "Simulated")
+    read_thread.setDaemon(True)
+    state = SharedJ1939State()
+    decoder = J1939StateDecoder(load_j1939db("J1939db.json"), state)
+    decoded = 0
+    start_time = time.time()
+    read_thread.start()
+    while time.time() - start_time < duration:
+        for current_time, vda_time, data in rx_queue.iter_views(1000):
+            vda_time, echo, pgn, priority, sa, da = parse_j1939_header(data)
+            decoder.process(current_time, vda_time, pgn, sa, data[J1939_HEADER_LENGTH:])
+            decoded += 1
+        decoder.publish(time.time())
+        time.sleep(0.001)
+    read_thread.runSignal = False
+    elapsed = time.time() - start_time
+    print("Read:    {:10.0f} frames/s".format(read_thread.message_count / elapsed))
+    print("Decoded: {:10.0f} frames/s".format(decoded / elapsed))
+    print("Dropped: {:10d} frames".format(rx_queue.get_stats()["Dropped Count"]))
+    state.close(unlink=True)
+
+if __name__ == '__main__':
+    benchmark()
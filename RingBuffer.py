@@ -0,0 +1,323 @@
+"""
+A preallocated ring buffer to pass received messages from a read thread to the
+GUI thread.
+
+A queue.Queue takes a lock and notifies a condition for every message and each
+message is a newly allocated tuple or dict. The FrameRingBuffer keeps all the
+messages in one bytearray that is made once. Every slot holds the PC time, the
+time stamp from the vehicle diagnostic adapter (VDA), the length of the
+message and the raw RP1210 message, which starts with the VDA time and the
+header of the protocol followed by the payload.
+
+There is exactly one producer (the read thread) and one consumer (the GUI
+thread). The producer is the only one to move the head and the consumer is
+the only one to move the tail, so no lock is needed. A slot is filled before
+the head moves past it and it is read before the tail moves past it.
+
+When the consumer falls behind and the ring is full, the overflow policy
+decides what happens to the messages that do not fit:
+DROP_NEWEST - the incoming message is discarded.
+DROP_OLDEST - the oldest unread message is overwritten.
+SPILL_TO_DISK - messages are appended to a spill file until the consumer has
+                caught up, so nothing is lost and the order is kept.
+Every policy counts the dropped messages and records when the drops happened.
+"""
+import collections
+import queue
+import struct
+
+import logging
+logger = logging.getLogger(__name__)
+
+# PC time, VDA time, length of the raw message
+SLOT_HEADER = struct.Struct("<dLH")
+# Number of bytes in a slot including the slot header
+RING_SLOT_SIZE = 64
+# Number of slots in a receive ring buffer
+RING_SLOTS = 10000
+
+# Length, PC time and VDA time in front of each raw message written to a file
+FRAME_RECORD = struct.Struct("<HdL")
+
+DROP_NEWEST = "Drop Newest"
+DROP_OLDEST = "Drop Oldest"
+SPILL_TO_DISK = "Spill to Disk"
+OVERFLOW_POLICIES = [DROP_NEWEST, DROP_OLDEST, SPILL_TO_DISK]
+
+# Drops less than this many seconds apart are recorded as the same event.
+DROP_EVENT_GAP = 1.0
+MAX_DROP_EVENTS = 1000
+
+
+class FrameRingBuffer():
+    """
+    A single producer, single consumer ring buffer of fixed size slots.
+    Messages that do not fit in a slot, like reassembled J1939 transport
+    messages, keep their place in the ring but their bytes are passed in a
+    dictionary on the side.
+    """
+    def __init__(self, slot_count=RING_SLOTS, slot_size=RING_SLOT_SIZE, overflow_policy=DROP_NEWEST, spill_filename=None):
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        self.buffer = bytearray(slot_count * slot_size)
+        self.view = memoryview(self.buffer)
+        self.oversize = {}
+        # Counters of slots. They only ever increase; the slot is the counter
+        # modulo slot_count.
+        self.head = 0 # Slots available to the consumer. Only the producer changes this.
+        self.tail = 0 # Slots the consumer is done with. Only the consumer changes this.
+        self.written = 0 # Slots written by the producer but not committed yet.
+        self.dropped_to = 0 # Slots before this were overwritten. Only the producer changes this.
+        self.overflow_count = 0
+        self.high_water_mark = 0
+
+        self.set_overflow_policy(overflow_policy, spill_filename)
+        self.dropped_count = 0
+        self.drop_events = []
+        self.spilling = False
+        self.spill_file = None
+        self.spill_reader = None
+        self.spill_pending = 0
+        self.spill_written = 0 # Records the consumer may read. Only the producer changes this.
+        self.spill_read = 0 # Only the consumer changes this.
+        self.spilled_count = 0
+        self.overwritten_count = 0 # Only the consumer changes this.
+        self.claimed = -1 # The slot the consumer holds a view of. Only the consumer changes this.
+
+    def set_overflow_policy(self, overflow_policy, spill_filename=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: {}".format(overflow_policy))
+        if overflow_policy == SPILL_TO_DISK and spill_filename is None:
+            raise ValueError("A spill file name is needed to spill to disk.")
+        self.overflow_policy = overflow_policy
+        if spill_filename is not None:
+            self.spill_filename = spill_filename
+
+    # Producer methods
+    def write(self, current_time, vda_time, message, length=None):
+        """
+        Copy a message into the next free slot. The message is not seen by
+        the consumer until commit is called. Returns False if the message was
+        dropped.
+        """
+        if length is None:
+            length = len(message)
+        if self.spilling:
+            # Keep the order: nothing goes in the ring until the consumer has
+            # read everything that was spilled.
+            if self.spill_pending or self.spill_read < self.spill_written:
+                return self.spill(current_time, vda_time, message, length)
+            self.spilling = False
+        oldest = max(self.tail, self.dropped_to)
+        if self.written - oldest >= self.slot_count:
+            self.overflow_count += 1
+            if self.overflow_policy == DROP_OLDEST:
+                # Mark the slot as dropped before it is overwritten, so the
+                # consumer skips it from now on. The mark is never moved back.
+                self.dropped_to = oldest + 1
+            elif self.overflow_policy == SPILL_TO_DISK:
+                self.spilling = True
+                return self.spill(current_time, vda_time, message, length)
+            else:
+                self.record_drop(current_time)
+                return False
+        if 0 <= self.claimed <= self.written - self.slot_count:
+            # The consumer claimed this slot before it saw the mark and may
+            # hold a view of it, so drop the new message instead.
+            self.record_drop(current_time)
+            return False
+        if self.written - oldest >= self.slot_count:
+            # The consumer counts the overwritten slots it had to skip,
+            # since it may have finished reading this one already.
+            self.record_drop_event(current_time)
+        if self.oversize:
+            self.oversize.pop(self.written - self.slot_count, None)
+        offset = (self.written % self.slot_count) * self.slot_size
+        SLOT_HEADER.pack_into(self.buffer, offset, current_time, vda_time, length)
+        if length > self.capacity:
+            self.oversize[self.written] = bytes(message[:length])
+        else:
+            start = offset + SLOT_HEADER.size
+            self.view[start:start + length] = message[:length]
+        self.written += 1
+        return True
+
+    def spill(self, current_time, vda_time, message, length):
+        try:
+            if self.spill_file is None:
+                self.spill_file = open(self.spill_filename, 'wb')
+                logger.info("Spilling messages to {}".format(self.spill_filename))
+            self.spill_file.write(FRAME_RECORD.pack(length, current_time, vda_time))
+            self.spill_file.write(message[:length])
+        except (OSError, ValueError) as e:
+            logger.warning(repr(e))
+            logger.warning("Failed to spill a message to {}".format(self.spill_filename))
+            self.record_drop(current_time)
+            return False
+        self.spill_pending += 1
+        self.spilled_count += 1
+        return True
+
+    def record_drop(self, current_time):
+        self.dropped_count += 1
+        self.record_drop_event(current_time)
+
+    def record_drop_event(self, current_time):
+        if self.drop_events and (current_time - self.drop_events[-1][1] < DROP_EVENT_GAP or
+                                 len(self.drop_events) >= MAX_DROP_EVENTS):
+            self.drop_events[-1][1] = current_time
+            self.drop_events[-1][2] += 1
+        else:
+            self.drop_events.append([current_time, current_time, 1])
+
+    def commit(self):
+        """
+        Make the written slots and spilled messages available to the consumer.
+        """
+        if self.spill_pending:
+            try:
+                self.spill_file.flush()
+            except (OSError, ValueError) as e:
+                logger.warning(repr(e))
+            self.spill_written += self.spill_pending
+            self.spill_pending = 0
+        self.head = self.written
+        used = self.head - max(self.tail, self.dropped_to)
+        if used > self.high_water_mark:
+            self.high_water_mark = used
+
+    def put(self, current_time, vda_time, message, length=None):
+        """
+        Write and commit a single message.
+        """
+        success = self.write(current_time, vda_time, message, length)
+        self.commit()
+        return success
+
+    def close(self):
+        for spill_file in [self.spill_file, self.spill_reader]:
+            if spill_file is not None:
+                spill_file.close()
+        self.spill_file = None
+        self.spill_reader = None
+
+    # Consumer methods
+    def qsize(self):
+        return (self.head - max(self.tail, self.dropped_to) +
+                self.spill_written - self.spill_read)
+
+    def free_slots(self):
+        return self.slot_count - (self.written - max(self.tail, self.dropped_to))
+
+    def read_slot(self, counter):
+        offset = (counter % self.slot_count) * self.slot_size
+        current_time, vda_time, length = SLOT_HEADER.unpack_from(self.buffer, offset)
+        if length > self.capacity:
+            data = self.oversize.pop(counter, None)
+        else:
+            start = offset + SLOT_HEADER.size
+            data = bytes(self.view[start:start + length])
+        return (current_time, vda_time, data)
+
+    def read_spill(self, max_count):
+        if self.spill_reader is None:
+            self.spill_reader = open(self.spill_filename, 'rb')
+        batch = []
+        while self.spill_read < self.spill_written and len(batch) < max_count:
+            length, current_time, vda_time = FRAME_RECORD.unpack(self.spill_reader.read(FRAME_RECORD.size))
+            batch.append((current_time, vda_time, self.spill_reader.read(length)))
+            self.spill_read += 1
+        return batch
+
+    def get_batch(self, max_count=None):
+        """
+        Return a list of up to max_count of the oldest messages as
+        (current_time, vda_time, data) tuples.
+        """
+        if max_count is None:
+            max_count = self.slot_count
+        batch = []
+        counter = self.tail
+        head = self.head
+        while len(batch) < max_count:
+            dropped_to = self.dropped_to
+            if dropped_to > counter:
+                self.overwritten_count += dropped_to - counter
+                counter = dropped_to
+            if counter >= head:
+                break
+            message = self.read_slot(counter)
+            if self.dropped_to > counter:
+                # The producer overwrote this slot while it was read.
+                continue
+            if message[2] is not None:
+                batch.append(message)
+            counter += 1
+        self.tail = counter
+        if counter == head and len(batch) < max_count and self.spill_read < self.spill_written:
+            batch.extend(self.read_spill(max_count - len(batch)))
+        return batch
+
+    def iter_views(self, max_count=None):
+        """
+        Yield up to max_count of the oldest messages as (current_time,
+        vda_time, data) where data is a memoryview of the slot instead of a
+        copy. A view is only valid until the next message is requested, so
+        anything kept from it has to be copied.
+        """
+        if max_count is None:
+            max_count = self.slot_count
+        count = 0
+        counter = self.tail
+        head = self.head
+        try:
+            while count < max_count:
+                # Claim the slot before reading the mark. The producer marks
+                # a slot before it checks the claim, so either it sees the
+                # claim and leaves the slot alone or this sees the mark.
+                self.claimed = counter
+                dropped_to = self.dropped_to
+                if dropped_to > counter:
+                    self.overwritten_count += dropped_to - counter
+                    counter = dropped_to
+                    continue
+                if counter >= head:
+                    break
+                offset = (counter % self.slot_count) * self.slot_size
+                current_time, vda_time, length = SLOT_HEADER.unpack_from(self.buffer, offset)
+                if length > self.capacity:
+                    data = self.oversize.pop(counter, None)
+                else:
+                    start = offset + SLOT_HEADER.size
+                    data = self.view[start:start + length]
+                counter += 1
+                if data is not None:
+                    count += 1
+                    yield (current_time, vda_time, data)
+                self.tail = counter
+        finally:
+            self.claimed = -1
+            self.tail = counter
+        if counter == head and count < max_count and self.spill_read < self.spill_written:
+            yield from self.read_spill(max_count - count)
+
+    def get(self):
+        """
+        Return the oldest message as (current_time, vda_time, data). Raises
+        queue.Empty if there are no messages.
+        """
+        batch = self.get_batch(1)
+        if not batch:
+            raise queue.Empty
+        return batch[0]
+
+    def get_stats(self):
+        return {"Overflow Policy": self.overflow_policy,
+                "Slots": self.slot_count,
+                "Queued": self.qsize(),
+                "High Water Mark": self.high_water_mark,
+                "Overflow Count": self.overflow_count,
+                "Dropped Count": self.dropped_count + self.overwritten_count,
+                "Spilled Count": self.spilled_count,
+                "Drop Events": [list(event) for event in self.drop_events]}
@@ -1,8 +1,12 @@
 
-from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QVariant
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QVariant, QModelIndex, QTimer
 from PyQt5.QtGui import QIcon
 
 from collections import OrderedDict
+from itertools import islice
+
+# Milliseconds the changed cells are collected before the views are told
+CHANGE_INTERVAL = 100
 
 class J1939TableModel(QAbstractTableModel):
     ''' data model for a J1939 Data class '''
@@ -11,14 +15,96 @@ class J1939TableModel(QAbstractTableModel):
         self.data_dict = OrderedDict()
         self.header = []
         self.table_rows = []
+        # Row of each key and column of each header name, so a cell of a
+        # record can be updated without searching the lists.
+        self.key_rows = {}
+        self.header_columns = {}
+        # The rows and the columns with cells that changed since the views
+        # were last told. They are reported together as dataChanged ranges.
+        self.changed_rows = set()
+        self.changed_left = None
+        self.changed_right = None
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.timeout.connect(self.flushChanges)
 
     def setDataHeader(self, header):
         self.header = header
         self.header_len = len(self.header)
+        self.header_columns = {name: column for column, name in enumerate(header)}
         
     def setDataDict(self, new_dict):
-        self.data_dict = OrderedDict(new_dict)
-        self.table_rows = list(new_dict.keys())
+        ''' show the records of new_dict. The dictionary is kept, not
+        copied, so records added to it later are shown with appendRows '''
+        self.data_dict = new_dict
+        self.changed_rows.clear()
+        self.changed_left = None
+        self.changed_right = None
+        table_rows = list(new_dict.keys())
+        start = len(self.table_rows)
+        if table_rows[:start] != self.table_rows:
+            # Rows were removed or reordered
+            self.key_rows = {}
+            start = 0
+        for row in range(start, len(table_rows)):
+            self.key_rows[table_rows[row]] = row
+        self.table_rows = table_rows
+
+    def appendRows(self, new_keys=None):
+        ''' insert the records added to the end of the data dictionary
+        since the last call as new rows. new_keys are their keys, when the
+        caller knows them. Returns the number of rows added. '''
+        start = len(self.table_rows)
+        end = len(self.data_dict)
+        if end <= start:
+            return 0
+        if new_keys is None or len(new_keys) != end - start:
+            new_keys = list(islice(self.data_dict, start, None))
+        self.beginInsertRows(QModelIndex(), start, end - 1)
+        for row, key in enumerate(new_keys, start):
+            self.key_rows[key] = row
+        self.table_rows.extend(new_keys)
+        self.endInsertRows()
+        return end - start
+
+    def keyChanged(self, key, col_name):
+        ''' mark the cell of a record in a column as changed '''
+        self.markChanged(self.key_rows[key], self.header_columns[col_name])
+
+    def keysChanged(self, keys):
+        ''' mark every cell of the records of keys as changed '''
+        for key in keys:
+            row = self.key_rows[key]
+            self.markChanged(row, 0)
+            self.markChanged(row, len(self.header) - 1)
+
+    def markChanged(self, row, column):
+        self.changed_rows.add(row)
+        if self.changed_left is None or column < self.changed_left:
+            self.changed_left = column
+        if self.changed_right is None or column > self.changed_right:
+            self.changed_right = column
+        if not self.change_timer.isActive():
+            self.change_timer.start(CHANGE_INTERVAL)
+
+    def flushChanges(self):
+        ''' tell the views about the changed cells, with one dataChanged
+        for each run of consecutive rows '''
+        if not self.changed_rows:
+            return
+        rows = sorted(self.changed_rows)
+        left = self.changed_left
+        right = self.changed_right
+        self.changed_rows.clear()
+        self.changed_left = None
+        self.changed_right = None
+        first = last = rows[0]
+        for row in rows[1:]:
+            if row != last + 1:
+                self.dataChanged.emit(self.index(first, left), self.index(last, right))
+                first = row
+            last = row
+        self.dataChanged.emit(self.index(first, left), self.index(last, right))
         
     def aboutToUpdate(self):
         self.layoutAboutToBeChanged.emit()
@@ -51,13 +137,14 @@ class J1939TableModel(QAbstractTableModel):
 
     def setData(self, index, value, role = Qt.DisplayRole):
         if role == Qt.DisplayRole and index.isValid():
-            self.dataChanged.emit(index, index)
+            self.markChanged(index.row(), index.column())
             return True
         else:
             return False
 
     def rowCount(self, index=QVariant()):
-        return len(self.data_dict)
+        # Records added to the dictionary are not rows until appendRows.
+        return len(self.table_rows)
 
     def columnCount(self, index=QVariant()):
         return len(self.header)